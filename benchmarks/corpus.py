@@ -0,0 +1,108 @@
+# Synthetic PDF/TXT/JSON corpora for the benchmarks
+
+import json
+import os
+import random
+from typing import Dict, List, Sequence
+
+VOCABULARY = (
+    "retrieval augmented generation vector index embedding chunk document query answer model "
+    "latency throughput memory cache token context source metadata search score ranking recall "
+    "precision corpus ingestion pipeline server request response stream batch session history "
+    "apple banana cherry river mountain forest ocean desert city village market harbor bridge "
+    "engine turbine battery circuit sensor signal network protocol packet router switch cable"
+).split()
+
+
+def make_paragraph(rng: random.Random, words: int) -> str:
+    """A pseudo-random paragraph; sentences of 8-16 words drawn from VOCABULARY."""
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 16))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        remaining -= length
+    return " ".join(sentences)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: Sequence[str], line_chars: int = 90) -> None:
+    """Writes a minimal text-only PDF (Helvetica, one content stream per page) with no dependencies."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines, line = [], ""
+        for word in text.split():
+            if line and len(line) + len(word) + 1 > line_chars:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        stream = "BT /F1 10 Tf 14 TL 50 780 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(directory: str, num_docs: int, formats: Sequence[str] = ("txt", "json", "pdf"),
+                    words_per_doc: int = 600, seed: int = 0) -> Dict[str, int]:
+    """Fills `directory` with num_docs documents, cycling through the given formats.
+
+    A JSON file holds a list of publication records (the shape load_json_file expects);
+    a PDF has one page per ~300 words. Returns the number of files written per format.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    counts = {fmt: 0 for fmt in formats}
+    for i in range(num_docs):
+        fmt = formats[i % len(formats)]
+        path = os.path.join(directory, f"doc_{i:06d}.{fmt}")
+        if fmt == "txt":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(make_paragraph(rng, 100) for _ in range(max(1, words_per_doc // 100))))
+        elif fmt == "json":
+            records = [
+                {
+                    "title": f"Synthetic publication {i}-{r}",
+                    "authors": ["Benchmark Author"],
+                    "year": 2000 + rng.randint(0, 25),
+                    "publication_description": make_paragraph(rng, 150),
+                }
+                for r in range(max(1, words_per_doc // 150))
+            ]
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+        elif fmt == "pdf":
+            write_pdf(path, [make_paragraph(rng, 300) for _ in range(max(1, words_per_doc // 300))])
+        else:
+            raise ValueError(f"Unsupported benchmark format '{fmt}'.")
+        counts[fmt] += 1
+    return counts
+
+
+def make_queries(count: int, seed: int = 1) -> List[str]:
+    """Short questions over the corpus vocabulary."""
+    rng = random.Random(seed)
+    return [f"What does the corpus say about {rng.choice(VOCABULARY)} and {rng.choice(VOCABULARY)}?"
+            for _ in range(count)]
@@ -0,0 +1,361 @@
+# Offline benchmark suite for ingestion, retrieval and end-to-end /ask latency
+#
+#   python benchmarks/run_benchmarks.py --sizes 10,100,1000 --output benchmarks/results/run.json
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/before.json benchmarks/results/after.json
+#
+# Embeddings and the LLM are deterministic fakes with configurable latency, so no network
+# access or API key is needed and results only move when the code does.
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(REPO_ROOT, "src", "rt_rag"))
+# Measure parsing itself: each corpus is parsed twice (staged, then streamed)
+os.environ.setdefault("RAG_PARSE_CACHE", "0")
+
+import faiss
+import httpx
+
+import api_main
+import rag_assistant
+from chunk_store import get_docstore_backend
+from faiss_index import get_index_params
+from hybrid_retriever import get_retrieval_mode
+from corpus import generate_corpus, make_queries
+from fakes import SlowFakeChatModel, SlowFakeEmbeddings
+from metrics import start_context_stats
+from pipeline import PipelineStats
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+# Entry modules timed by bench_import, and dependencies that importing them should not pull in
+IMPORT_MODULES = ("rag_assistant", "api_main")
+HEAVY_MODULES = (
+    "faiss", "langchain.chains", "langchain_community.document_loaders", "langchain_community.vectorstores.faiss",
+    "langchain_openai", "langchain_text_splitters",
+)
+
+
+def percentiles(samples_seconds: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of a list of durations, in milliseconds."""
+    samples = np.asarray(samples_seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+    }
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_import(repeats: int = 5) -> Dict:
+    """Times importing each entry module in a fresh interpreter (median of `repeats` runs).
+
+    Also lists the HEAVY_MODULES that the import loaded; they should only load on first use.
+    """
+    script = (
+        "import json, sys, time; start = time.perf_counter(); import {module}; "
+        "print(json.dumps([time.perf_counter() - start, [m for m in {heavy!r} if m in sys.modules]]))"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO_ROOT, "src", "rt_rag"))
+    results = {}
+    for module in IMPORT_MODULES:
+        samples = []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, "-c", script.format(module=module, heavy=HEAVY_MODULES)],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            seconds, heavy = json.loads(output.strip().splitlines()[-1])
+            samples.append(seconds)
+        results[f"{module}_ms"] = float(np.median(samples)) * 1000
+        results[f"{module}_heavy_modules"] = heavy
+    return results
+
+
+def bench_ingestion(data_dir: str, vectorstore_dir: str, embeddings) -> Dict:
+    """Times loading, splitting and a full index build over the files in data_dir, the streaming pipeline and a warm load."""
+    saved_paths = (rag_assistant.DATA_PATH, rag_assistant.VECTORSTORE_PATH)
+    rag_assistant.DATA_PATH = data_dir + os.sep
+    rag_assistant.VECTORSTORE_PATH = vectorstore_dir + os.sep
+    num_files = len(os.listdir(data_dir))
+    try:
+        start = time.perf_counter()
+        documents = rag_assistant.load_documents()
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        chunks = rag_assistant.get_text_chunks(documents)
+        split_seconds = time.perf_counter() - start
+
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        vectorstore = rag_assistant.get_vector_store(chunks, embeddings, full_rebuild=True)
+        build_seconds = time.perf_counter() - start
+        rss_after = current_rss_bytes()
+        num_documents, num_chunks = len(documents), len(chunks)
+        del documents, chunks
+
+        # The same build through the streaming pipeline (parse, split and embed overlap)
+        stats = PipelineStats()
+        rag_assistant.ingest_documents(embeddings, full_rebuild=True, stats=stats)
+
+        # Warm start from what the pipeline published (RAG_DOCSTORE decides whether chunk texts are read in)
+        rss_before_load = current_rss_bytes()
+        start = time.perf_counter()
+        loaded = rag_assistant.load_vector_store(embeddings, check_data=False)
+        index_load_seconds = time.perf_counter() - start
+        rss_after_load = current_rss_bytes()
+        del loaded
+    finally:
+        rag_assistant.DATA_PATH, rag_assistant.VECTORSTORE_PATH = saved_paths
+
+    results = {
+        "load": {"files": num_files, "documents": num_documents, "seconds": load_seconds,
+                 "docs_per_sec": num_documents / load_seconds if load_seconds else None},
+        "split": {"chunks": num_chunks, "seconds": split_seconds,
+                  "chunks_per_sec": num_chunks / split_seconds if split_seconds else None},
+        "index_build": {
+            "vectors": vectorstore.index.ntotal,
+            "index_type": type(vectorstore.index).__name__,
+            "seconds": build_seconds,
+            "index_bytes": int(faiss.serialize_index(vectorstore.index).size),
+            "rss_growth_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        },
+        "index_load": {
+            "docstore": get_docstore_backend(),
+            "seconds": index_load_seconds,
+            "rss_growth_bytes": rss_after_load - rss_before_load
+            if rss_before_load is not None and rss_after_load is not None else None,
+        },
+        "pipeline": dict(
+            seconds=stats.wall_seconds,
+            **{f"{name}_per_sec": info["per_sec"] for name, info in stats.summary()["stages"].items()},
+        ),
+    }
+    return results, vectorstore
+
+
+def bench_queries(vectorstore, queries: List[str], k: int) -> Dict:
+    """Latency of single retriever queries (RAG_RETRIEVAL_MODE), one at a time, and the chunks they return."""
+    retriever = rag_assistant.create_retriever(vectorstore, k=k)
+    retriever.invoke(queries[0]) # Warm-up
+    samples, chunks = [], 0
+    context = start_context_stats() # Filled in with RAG_CONTEXT_PACKING=1
+    for query in queries:
+        start = time.perf_counter()
+        chunks += len(retriever.invoke(query))
+        samples.append(time.perf_counter() - start)
+    return dict(
+        queries=len(queries), k=k, chunks_per_query=chunks / len(queries),
+        context_tokens_per_query=context["tokens"] / len(queries) if context else None,
+        **percentiles(samples),
+    )
+
+
+async def _drive_ask(questions: List[str], concurrency: int) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, statuses = [], []
+
+    async def one(client, question):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/ask", json={"question": question})
+            samples.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    transport = httpx.ASGITransport(app=api_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, question) for question in questions))
+        elapsed = time.perf_counter() - start
+    return dict(
+        concurrency=concurrency,
+        requests=len(questions),
+        errors=sum(1 for status in statuses if status != 200),
+        seconds=elapsed,
+        requests_per_sec=len(questions) / elapsed,
+        **percentiles(samples),
+    )
+
+
+def bench_ask(vectorstore, llm, questions: List[str], concurrency_levels: List[int], k: int) -> List[Dict]:
+    """End-to-end /ask throughput through the FastAPI app (in process, no sockets)."""
+    chain = rag_assistant.create_qa_chain(llm, rag_assistant.create_retriever(vectorstore, k=k))
+    saved = (api_main.qa_chain, api_main.answer_cache, api_main.admission)
+    results = []
+    try:
+        api_main.qa_chain = chain
+        api_main.answer_cache = None # Measure the chain, not cache hits on repeated questions
+        for concurrency in concurrency_levels:
+            # Let every request in, so rejections do not distort the numbers
+            api_main.admission = api_main.AdmissionController(concurrency, len(questions), queue_timeout=600)
+            results.append(asyncio.run(_drive_ask(questions, concurrency)))
+    finally:
+        api_main.qa_chain, api_main.answer_cache, api_main.admission = saved
+    return results
+
+
+def run_benchmarks(sizes: List[int], formats: List[str], words_per_doc: int, num_queries: int,
+                   ask_requests: int, concurrency_levels: List[int], embedding_latency: float,
+                   embedding_per_text_latency: float, llm_latency: float, llm_token_latency: float,
+                   embedding_size: int = 256, k: int = rag_assistant.RETRIEVER_K, import_repeats: int = 5) -> Dict:
+    """Runs the import benchmark, then every other benchmark once per corpus size, and returns the results as a dict."""
+    import_times = bench_import(import_repeats)
+    runs = []
+    queries = make_queries(num_queries)
+    for size in sizes:
+        logger.warning(f"Benchmarking a corpus of {size} documents...")
+        with tempfile.TemporaryDirectory(prefix="rt_rag_bench_") as workdir:
+            data_dir = os.path.join(workdir, "data")
+            generate_corpus(data_dir, size, formats=formats, words_per_doc=words_per_doc)
+            embeddings = SlowFakeEmbeddings(size=embedding_size, latency=embedding_latency,
+                                            per_text_latency=embedding_per_text_latency)
+            run, vectorstore = bench_ingestion(data_dir, os.path.join(workdir, "vectorstore"), embeddings)
+            run["size"] = size
+            run["query"] = bench_queries(vectorstore, queries, k)
+            llm = SlowFakeChatModel(latency=llm_latency, token_latency=llm_token_latency)
+            run["ask"] = bench_ask(vectorstore, llm, make_queries(ask_requests, seed=2), concurrency_levels, k)
+            runs.append(run)
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "index_type": get_index_params()["type"],
+            "retrieval_mode": get_retrieval_mode(),
+            "settings": {
+                "formats": formats, "words_per_doc": words_per_doc, "embedding_size": embedding_size,
+                "embedding_latency": embedding_latency, "embedding_per_text_latency": embedding_per_text_latency,
+                "llm_latency": llm_latency, "llm_token_latency": llm_token_latency, "k": k,
+            },
+        },
+        "import": import_times,
+        "runs": runs,
+    }
+
+
+def flatten_metrics(results: Dict) -> Dict[str, float]:
+    """Maps 'size=N/section/metric' (and 'size=N/ask@C/metric') to numeric values."""
+    metrics = {}
+    for name, value in results.get("import", {}).items():
+        if isinstance(value, (int, float)):
+            metrics[f"import/{name}"] = value
+    for run in results["runs"]:
+        prefix = f"size={run['size']}"
+        for section in ("load", "split", "index_build", "index_load", "pipeline", "query"):
+            for name, value in run[section].items():
+                if isinstance(value, (int, float)):
+                    metrics[f"{prefix}/{section}/{name}"] = value
+        for ask in run["ask"]:
+            for name, value in ask.items():
+                if name != "concurrency" and isinstance(value, (int, float)):
+                    metrics[f"{prefix}/ask@{ask['concurrency']}/{name}"] = value
+    return metrics
+
+
+def compare_results(baseline: Dict, candidate: Dict) -> List[str]:
+    """Formats the relative change of every metric present in both runs."""
+    old, new = flatten_metrics(baseline), flatten_metrics(candidate)
+    lines = [f"{'metric':<48} {'baseline':>14} {'candidate':>14} {'change':>9}"]
+    for name in sorted(set(old) & set(new)):
+        change = f"{(new[name] - old[name]) / old[name]:+.1%}" if old[name] else "n/a"
+        lines.append(f"{name:<48} {old[name]:>14.4g} {new[name]:>14.4g} {change:>9}")
+    return lines
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline RT-RAG benchmarks (fake embeddings and LLM, no network).")
+    parser.add_argument("--sizes", type=parse_int_list, default=[10, 100, 1000], help="Corpus sizes in documents.")
+    parser.add_argument("--formats", default="txt,json,pdf", help="File formats to generate, cycled per document.")
+    parser.add_argument("--words-per-doc", type=int, default=600)
+    parser.add_argument("--queries", type=int, default=200, help="Retriever queries per corpus size.")
+    parser.add_argument("--ask-requests", type=int, default=100, help="/ask requests per concurrency level.")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 8, 32], help="/ask concurrency levels.")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="Fixed latency per embeddings call.")
+    parser.add_argument("--embedding-per-text-ms", type=float, default=0.0, help="Extra latency per embedded text.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="LLM time to first token.")
+    parser.add_argument("--llm-token-ms", type=float, default=0.0, help="LLM latency per further token.")
+    parser.add_argument("--import-repeats", type=int, default=5, help="Fresh interpreters per module import timing.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two saved result files instead of running.")
+    parser.add_argument("--verbose", action="store_true", help="Show the RAG assistant's INFO logging.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            candidate = json.load(f)
+        print("\n".join(compare_results(baseline, candidate)))
+        return
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    results = run_benchmarks(
+        sizes=args.sizes,
+        formats=[fmt.strip() for fmt in args.formats.split(",") if fmt.strip()],
+        words_per_doc=args.words_per_doc,
+        num_queries=args.queries,
+        ask_requests=args.ask_requests,
+        concurrency_levels=args.concurrency,
+        embedding_latency=args.embedding_latency_ms / 1000,
+        embedding_per_text_latency=args.embedding_per_text_ms / 1000,
+        llm_latency=args.llm_latency_ms / 1000,
+        llm_token_latency=args.llm_token_ms / 1000,
+        import_repeats=args.import_repeats,
+    )
+    output = args.output or os.path.join(RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({"import": results["import"], "runs": results["runs"]}, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
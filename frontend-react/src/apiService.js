@@ -5,10 +5,11 @@ const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://127.0.0.1:800
 /**
  * Sends a question to the backend API and returns the response.
  * @param {string} questionText The question to ask the assistant.
+ * @param {string} [sessionId] Conversation id; follow-up questions with the same id share history.
  * @returns {Promise<object>} The API response (answer and source documents).
  * @throws {Error} If the API request fails or returns an error.
  */
-export const askQuestion = async (questionText) => {
+export const askQuestion = async (questionText, sessionId = null) => {
   console.log("Sending question to API:", questionText);
   try {
     const response = await fetch(`${API_BASE_URL}/ask`, {
@@ -17,7 +18,7 @@ export const askQuestion = async (questionText) => {
         'Content-Type': 'application/json',
       },
       // Ensure the question is definitely a string, though it should be already
-      body: JSON.stringify({ question: String(questionText) }), 
+      body: JSON.stringify({ question: String(questionText), session_id: sessionId }), 
     });
 
     console.log("API Response Status:", response.status);
@@ -45,3 +46,94 @@ export const askQuestion = async (questionText) => {
     throw error; // Re-throw the error to be caught by the UI component
   }
 };
+
+/**
+ * Parses one Server-Sent Events block ("event: ...\ndata: ...") into { event, data }.
+ * @param {string} block The raw text between two blank lines.
+ * @returns {{event: string, data: object}|null}
+ */
+const parseSseBlock = (block) => {
+  let event = 'message';
+  const dataLines = [];
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
+    }
+  }
+  if (dataLines.length === 0) {
+    return null;
+  }
+  return { event, data: JSON.parse(dataLines.join('\n')) };
+};
+
+/**
+ * Asks a question via the streaming endpoint and reports the answer incrementally.
+ * @param {string} questionText The question to ask the assistant.
+ * @param {object} handlers Callbacks: onSources(sources), onToken(token), onDone(result).
+ * @param {string} [sessionId] Conversation id; follow-up questions with the same id share history.
+ * @returns {Promise<object>} The final `done` payload (answer, sources, timings).
+ * @throws {Error} If the API request fails or the stream reports an error.
+ */
+export const askQuestionStream = async (questionText, { onSources, onToken, onDone } = {}, sessionId = null) => {
+  console.log("Streaming question to API:", questionText);
+  const response = await fetch(`${API_BASE_URL}/ask/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+    },
+    body: JSON.stringify({ question: String(questionText), session_id: sessionId }),
+  });
+
+  if (!response.ok) {
+    let errorMessage = `API request failed with status ${response.status}`;
+    try {
+      const responseData = await response.json();
+      if (responseData && typeof responseData.detail === 'string') {
+        errorMessage += `: ${responseData.detail}`;
+      }
+    } catch (parseError) {
+      console.error("Could not parse error response:", parseError);
+    }
+    throw new Error(errorMessage);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line; keep any incomplete tail in the buffer
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const message = parseSseBlock(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+      if (!message) continue;
+
+      if (message.event === 'sources') {
+        onSources?.(message.data.sources);
+      } else if (message.event === 'token') {
+        onToken?.(message.data.token);
+      } else if (message.event === 'done') {
+        result = message.data;
+        console.log(`Time to first token: ${result.time_to_first_token_ms}ms, total: ${result.total_ms}ms`);
+        onDone?.(result);
+      } else if (message.event === 'error') {
+        throw new Error(message.data.detail || 'Streaming failed.');
+      }
+    }
+  }
+
+  if (!result) {
+    throw new Error('Stream ended before the answer was complete.');
+  }
+  return result;
+};
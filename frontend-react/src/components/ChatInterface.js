@@ -1,6 +1,6 @@
 // src/components/ChatInterface.js
 import React, { useState, useEffect, useRef } from 'react';
-import { askQuestion } from '../apiService';
+import { askQuestionStream } from '../apiService';
 // import './ChatInterface.css'; 
 import {
   Box,
@@ -29,6 +29,10 @@ function ChatInterface() {
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef(null);
+  // One conversation per page load; the backend keeps its history under this id
+  const sessionIdRef = useRef(
+    window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
   const toast = useToast(); 
 
   const scrollToBottom = () => {
@@ -50,14 +54,20 @@ function ChatInterface() {
     setIsLoading(true);
 
     let errorMessageText = 'Failed to get a response from the assistant.'; // Default error
+    // The assistant's reply starts as an empty placeholder and is filled in as tokens stream in
+    const replyId = `reply-${Date.now()}`;
+    setMessages((prevMessages) => [...prevMessages, { id: replyId, sender: 'assistant', text: '', sources: [] }]);
+    const updateReply = (update) => {
+      setMessages((prevMessages) => prevMessages.map((msg) => (msg.id === replyId ? { ...msg, ...update(msg) } : msg)));
+    };
+    const toSourceList = (sources) => (sources || []).map((source) => ({ metadata: { source } }));
+
     try {
-      const response = await askQuestion(currentInput);
-      const assistantMessage = {
-        sender: 'assistant',
-        text: response.answer,
-        sources: response.source_documents || [],
-      };
-      setMessages((prevMessages) => [...prevMessages, assistantMessage]);
+      await askQuestionStream(currentInput, {
+        onSources: (sources) => updateReply(() => ({ sources: toSourceList(sources) })),
+        onToken: (token) => updateReply((reply) => ({ text: reply.text + token })),
+        onDone: (result) => updateReply(() => ({ text: result.answer, sources: toSourceList(result.sources) })),
+      }, sessionIdRef.current);
     } catch (err) {
       console.error("Error fetching response:", err);
       if (err instanceof Error) {
@@ -89,7 +99,8 @@ function ChatInterface() {
         text: `Error: ${errorMessageText}`, 
         isError: true 
       };
-      setMessages((prevMessages) => [...prevMessages, errorMessageForChat]);
+      // Replace the (possibly partial) streamed reply with the error message
+      setMessages((prevMessages) => [...prevMessages.filter((msg) => msg.id !== replyId), errorMessageForChat]);
     } finally {
       setIsLoading(false);
     }
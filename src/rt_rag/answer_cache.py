@@ -0,0 +1,158 @@
+# Answer cache for repeated and near-duplicate questions
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Cosine similarity a past question needs to reach to count as the same question
+ANSWER_CACHE_SIMILARITY = float(os.getenv("RAG_ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases, collapses whitespace and strips trailing punctuation."""
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+
+def key_terms(question: str) -> frozenset:
+    """Numbers, quoted phrases and capitalized words (except the first word) in question, lower-cased.
+
+    Questions about different entities ("Who wrote paper X?" / "... paper Y?") embed very
+    close together; the semantic tier only matches questions whose key terms agree.
+    """
+    terms = {(straight or curly).lower() for straight, curly in re.findall(r'"([^"]+)"|\u201c([^\u201d]+)\u201d', question)}
+    words = re.findall(r"[\w][\w.\-/]*", question)
+    for position, word in enumerate(words):
+        word = word.rstrip(".-/")
+        if any(char.isdigit() for char in word) or (position > 0 and any(char.isupper() for char in word)):
+            terms.add(word.lower())
+    return frozenset(terms)
+
+
+class AnswerCache:
+    """Two-tier cache of answers for one index version.
+
+    The exact tier is keyed by the normalized question text. The semantic tier keeps the
+    embedding of every cached question and returns the answer of the most similar past
+    question if its cosine similarity reaches `similarity_threshold` and both questions
+    have the same key terms (numbers, names; see key_terms). All entries are
+    dropped as soon as a different index version is seen, so answers never outlive the
+    vector store they were computed from.
+    """
+
+    def __init__(self, embeddings=None, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.embeddings = embeddings # None disables the semantic tier
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.index_version = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._terms: Dict[str, frozenset] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+
+    def _sync_version(self, index_version: Optional[str]) -> None:
+        if index_version != self.index_version:
+            if self._entries:
+                logger.info(f"Index version changed ({self.index_version} -> {index_version}); dropping {len(self._entries)} cached answers.")
+                self.invalidations += 1
+            self._entries.clear()
+            self._vectors.clear()
+            self._terms.clear()
+            self._matrix = None
+            self.index_version = index_version
+
+    def _most_similar(self, vector: np.ndarray, terms: frozenset) -> Tuple[Optional[str], float]:
+        """The most similar cached question with the same key terms, and its similarity."""
+        if self._matrix is None:
+            if not self._vectors:
+                return None, 0.0
+            self._matrix_keys = list(self._vectors)
+            self._matrix = np.vstack([self._vectors[key] for key in self._matrix_keys])
+        similarities = self._matrix @ vector
+        for best in np.argsort(-similarities):
+            if similarities[best] < self.similarity_threshold:
+                break
+            if self._terms[self._matrix_keys[best]] == terms:
+                return self._matrix_keys[best], float(similarities[best])
+        return None, 0.0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def aget(self, question: str, index_version: Optional[str],
+                   semantic: bool = True) -> Tuple[Any, Optional[str], Optional[np.ndarray]]:
+        """Looks a question up in both tiers.
+
+        Returns (value, tier, question_embedding); value and tier ("exact"/"semantic") are
+        None on a miss. Pass the embedding back to put() to avoid embedding the question twice.
+        semantic=False skips the semantic tier, for questions that would otherwise never be embedded.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._sync_version(index_version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key], "exact", None
+            if self.embeddings is None or not semantic:
+                self.misses += 1
+                return None, None, None
+
+        vector = self._unit(await self.embeddings.aembed_query(question))
+        with self._lock:
+            if index_version == self.index_version:
+                best_key, similarity = self._most_similar(vector, key_terms(question))
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    logger.info(f"Semantic answer cache hit (similarity {similarity:.3f}) for '{question}'.")
+                    return self._entries[best_key], "semantic", vector
+            self.misses += 1
+        return None, None, vector
+
+    def put(self, question: str, index_version: Optional[str], value: Any, question_embedding=None) -> None:
+        """Caches the answer to a question computed against index_version."""
+        key = normalize_question(question)
+        with self._lock:
+            self._sync_version(index_version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if question_embedding is not None:
+                self._vectors[key] = self._unit(question_embedding)
+                self._terms[key] = key_terms(question)
+                self._matrix = None
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._terms.pop(evicted, None)
+                if self._vectors.pop(evicted, None) is not None:
+                    self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "index_version": self.index_version,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -1,22 +1,43 @@
 # Main FastAPI application for the RAG Assistant UI
 
 import os
-import uvicorn
-from fastapi import FastAPI, HTTPException, Request
+import time
+import asyncio
+import json
+import functools
+from contextlib import asynccontextmanager, AsyncExitStack
+from dotenv import load_dotenv
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware # To handle CORS for local development
 from pydantic import BaseModel
 import logging
-from typing import Optional # Import Optional
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple # Import Optional
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+
+# This module is the API's entry point: read .env before the RAG settings are read from the environment
+load_dotenv()
 
 # Import the RAG chain initializer from your existing script
-from rag_assistant import initialize_rag_chain, setup_logging
+from rag_assistant import initialize_rag_chain, setup_logging, log_path_diagnostics, env_flag, astream_answer, get_index_version, aanswer_questions_batch, index_needs_refresh, get_condense_stats
+from session_store import create_session_store
+from answer_cache import AnswerCache, normalize_question
+from metrics import (
+    ADMISSION_REJECTIONS,
+    COALESCED_REQUESTS,
+    REQUEST_SECONDS,
+    REINDEXES,
+    REQUESTS,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+    StageTimingHandler,
+    record_stage,
+    stage,
+    start_context_stats,
+    start_timings,
+    timings_breakdown,
+)
 
-# Setup logging (ensure it's called before other loggers if not already configured)
-# This assumes setup_logging() configures a root logger or the specific loggers used.
-if not logging.getLogger().hasHandlers():
-    setup_logging() 
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -58,6 +79,23 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# --- Request Metrics ---
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Counts requests and observes their latency, labelled with the matched route."""
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        # For streamed responses this is the time until the response starts
+        REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - start_time)
+        REQUESTS.labels(endpoint=endpoint, status=str(status)).inc()
+
 # --- Pydantic Models for Request/Response --- 
 class QuestionRequest(BaseModel):
     question: str
@@ -67,32 +105,292 @@ class AnswerResponse(BaseModel):
     answer: str
     sources: list = []
     session_id: Optional[str] = None # Changed to Optional[str]
+    index_version: Optional[str] = None # Version of the index the answer was retrieved from
+    context_tokens: Optional[int] = None # Tokens of retrieved text packed into the prompt (RAG_CONTEXT_PACKING=1)
+    timings: Optional[dict] = None # Per-stage milliseconds, only when the X-Debug-Timings header is set
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+
+class BatchAnswer(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: list = []
+    error: Optional[str] = None
+
+class BatchAnswerResponse(BaseModel):
+    answers: List[BatchAnswer]
+    index_version: Optional[str] = None
+
+MAX_BATCH_SIZE = int(os.getenv("RAG_MAX_BATCH_SIZE", "256"))
+
+def wants_timings(header_value: Optional[str]) -> bool:
+    """Whether the X-Debug-Timings request header asks for a timing breakdown."""
+    return (header_value or "").strip().lower() in ("1", "true", "yes", "on")
+
+# --- Admission Control ---
+# At most MAX_CONCURRENT_REQUESTS chain invocations run at once; up to MAX_QUEUED_REQUESTS more
+# may wait (for at most QUEUE_TIMEOUT seconds). Anything beyond that is rejected right away.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("RAG_MAX_CONCURRENT_REQUESTS", "8"))
+MAX_QUEUED_REQUESTS = int(os.getenv("RAG_MAX_QUEUED_REQUESTS", "32"))
+QUEUE_TIMEOUT = float(os.getenv("RAG_QUEUE_TIMEOUT", "30"))
+
+class AdmissionController:
+    """Bounds concurrent chain invocations and fails fast once the wait queue is full."""
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one concurrency slot for the duration of the block.
+
+        Raises HTTPException 429 if the queue is already full and 503 if no slot frees
+        up within queue_timeout seconds.
+        """
+        # Counters change synchronously, so this check is exact even before the semaphore is awaited
+        if self.active + self.waiting >= self.max_concurrent + self.max_queued:
+            self.rejected += 1
+            ADMISSION_REJECTIONS.labels(reason="queue_full").inc()
+            logger.warning(f"Rejecting request: {self.active} active, {self.waiting} queued.")
+            raise HTTPException(status_code=429, detail="Too many requests in flight. Please retry shortly.", headers={"Retry-After": "1"})
+        self.waiting += 1
+        wait_start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            ADMISSION_REJECTIONS.labels(reason="queue_timeout").inc()
+            logger.warning(f"Request waited {self.queue_timeout:.0f}s for a free slot; giving up.")
+            raise HTTPException(status_code=503, detail="Service busy: timed out waiting for capacity.", headers={"Retry-After": "5"})
+        finally:
+            self.waiting -= 1
+            record_stage("queue", time.perf_counter() - wait_start)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+admission = AdmissionController(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT)
+
+# --- Request Coalescing ---
+# Identical /ask questions without chat history that arrive while one is being answered wait for
+# that answer instead of running the chain again (RAG_COALESCE_REQUESTS=0 disables this).
+COALESCE_REQUESTS = env_flag("RAG_COALESCE_REQUESTS", default=True)
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Returns compute()'s result and whether it came from a call that was already in flight.
+
+        The computation runs as its own task, so a caller that disconnects does not cancel it
+        for the others; an exception is raised to every caller.
+        """
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+            COALESCED_REQUESTS.labels(role="follower").inc()
+        else:
+            self.leaders += 1
+            COALESCED_REQUESTS.labels(role="leader").inc()
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), coalesced
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception() # Retrieved here so an unawaited failure is not logged as never retrieved
+
+    def stats(self) -> dict:
+        total = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "coalesce_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+single_flight = SingleFlight()
 
 # --- RAG Chain Initialization --- 
 # We'll store the chain globally. 
 # For more complex scenarios with multiple users/sessions, you might manage chains differently.
 qa_chain = None
+# Conversation history per QuestionRequest.session_id; requests without a session_id are stateless
+session_store = None
+# Version of the loaded vector store and the answer cache tied to it
+index_version = None
+answer_cache = None
+# qa_chain, index_version and answer_cache are only ever replaced together, by swap_chain(). Handlers
+# read all three once when they start, so a request that is in flight during a reindex finishes on
+# the old index while new requests use the new one.
+REINDEX_INTERVAL = float(os.getenv("RAG_REINDEX_INTERVAL", "0")) # Seconds between change checks; 0 disables the watcher
+ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN") # Required in X-Admin-Token for /reindex when set
+reindex_lock = asyncio.Lock()
+reindex_watcher = None
+
+def create_answer_cache(chain):
+    """Builds the answer cache (RAG_ANSWER_CACHE=0 disables it, RAG_ANSWER_CACHE_SEMANTIC=1 adds the semantic tier)."""
+    if not env_flag("RAG_ANSWER_CACHE", default=True):
+        return None
+    embeddings = None
+    # Off by default: similar questions about different things can embed above any useful threshold
+    if env_flag("RAG_ANSWER_CACHE_SEMANTIC"):
+        embeddings = getattr(getattr(chain.retriever, "vectorstore", None), "embeddings", None)
+    logger.info(f"Answer cache enabled ({'exact + semantic' if embeddings is not None else 'exact only'}).")
+    return AnswerCache(embeddings=embeddings)
+
+def embeds_question(chain, question):
+    """Whether retrieval embeds the question; if not (lexical routes), the semantic cache tier would add the only embedding call."""
+    embeds_query = getattr(getattr(chain, "retriever", None), "embeds_query", None)
+    return embeds_query(question) if callable(embeds_query) else True
+
+def swap_chain(chain, version):
+    """Makes `chain` (answering from index `version`) the one new requests use.
+
+    Runs on the event loop without awaiting, so no request can observe a half-swapped state.
+    The old chain and its answer cache are released once the requests holding them finish.
+    """
+    global qa_chain, index_version, answer_cache
+    qa_chain, index_version, answer_cache = chain, version, create_answer_cache(chain)
+
+def serving_state():
+    """The (chain, index version, answer cache) a request should use from start to finish."""
+    return qa_chain, index_version, answer_cache
+
+async def reindex(full_rebuild=False):
+    """Builds the chain for the current data off to the side and swaps it in.
+
+    The index is updated (or, for read-only workers, reloaded) in a worker thread under the
+    index lock while requests keep being served from the current chain. Returns the previous
+    and the new index version; the chain is only swapped if the version changed. Raises
+    RuntimeError if the build fails, in which case the current chain stays in place.
+    """
+    async with reindex_lock:
+        loop = asyncio.get_running_loop()
+        previous_version = index_version
+        start_time = time.perf_counter()
+        logger.info(f"Reindexing (current index version {previous_version})...")
+        chain = await loop.run_in_executor(None, functools.partial(initialize_rag_chain, full_rebuild=full_rebuild))
+        if chain is None:
+            REINDEXES.labels(outcome="failed").inc()
+            raise RuntimeError("Reindex failed; still serving the previous index.")
+        version = await loop.run_in_executor(None, get_index_version)
+        if version == previous_version and qa_chain is not None:
+            REINDEXES.labels(outcome="unchanged").inc()
+            logger.info(f"Reindex finished in {time.perf_counter() - start_time:.2f}s; index version {version} unchanged.")
+        else:
+            swap_chain(chain, version)
+            REINDEXES.labels(outcome="swapped").inc()
+            logger.info(f"Reindex finished in {time.perf_counter() - start_time:.2f}s; now serving index version {version} (was {previous_version}).")
+        return previous_version, version
+
+async def watch_for_changes(interval):
+    """Reindexes whenever DATA_PATH changes or another worker publishes a new index."""
+    loop = asyncio.get_running_loop()
+    read_only = env_flag("RAG_INDEX_READ_ONLY")
+    logger.info(f"Watching for data and index changes every {interval:.0f}s.")
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if reindex_lock.locked():
+                continue
+            if await loop.run_in_executor(None, index_needs_refresh, index_version, read_only):
+                await reindex()
+        except Exception as e:
+            logger.error(f"Background reindex failed: {e}", exc_info=True)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the RAG chain when the application starts."""
-    global qa_chain
+    global qa_chain, session_store, index_version, answer_cache, reindex_watcher
+    # Logging is configured here rather than at import, unless the server already set it up
+    if not logging.getLogger().hasHandlers():
+        setup_logging()
+    log_path_diagnostics()
     logger.info("FastAPI application starting up...")
+    session_store = create_session_store()
     logger.info("Attempting to initialize RAG chain...")
-    qa_chain = initialize_rag_chain()
+    start_time = time.perf_counter()
+    # Set RAG_FULL_REBUILD=1 to force re-embedding every document instead of an incremental update
+    qa_chain = initialize_rag_chain(full_rebuild=env_flag("RAG_FULL_REBUILD"))
     if qa_chain is None:
         logger.error("CRITICAL: RAG chain initialization failed. API will not be functional.")
         # You might want to prevent the app from starting or handle this more gracefully
     else:
-        logger.info("RAG chain initialized successfully. API is ready.")
+        index_version = get_index_version()
+        answer_cache = create_answer_cache(qa_chain)
+        logger.info(f"RAG chain initialized successfully in {time.perf_counter() - start_time:.2f}s (index version {index_version}). API is ready.")
+    if REINDEX_INTERVAL > 0:
+        reindex_watcher = asyncio.create_task(watch_for_changes(REINDEX_INTERVAL))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stops the background change watcher."""
+    if reindex_watcher is not None:
+        reindex_watcher.cancel()
+
+async def get_session_history(session_id: Optional[str]):
+    """Returns the stored (question, answer) turns for a session, or [] for stateless requests."""
+    if session_id is None or session_store is None:
+        return []
+    return await session_store.aget_history(session_id)
+
+async def record_session_turn(session_id: Optional[str], question: str, answer: str):
+    """Appends a finished turn to the session's history."""
+    if session_id is not None and session_store is not None:
+        await session_store.aappend_turn(session_id, question, answer)
+
+def get_unique_sources(source_documents):
+    """Extracts source filenames from retrieved documents, de-duplicated and sorted.
+
+    Includes the files whose duplicate copies of a chunk were dropped at ingestion.
+    """
+    raw_sources = [doc.metadata.get("source", "Unknown source") for doc in source_documents]
+    raw_sources += [source for doc in source_documents for source in doc.metadata.get("duplicate_sources", [])]
+    return sorted(list(set(raw_sources))) # Ensure uniqueness and consistent order
+
+async def replay_cached_answer(cached):
+    """Yields a cached answer in the same event shape as astream_answer."""
+    yield "sources", cached["sources"]
+    yield "token", cached["answer"]
+    yield "answer", cached["answer"]
+
+def format_sse(event: str, data: dict) -> str:
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # --- API Endpoints --- 
 @app.post("/ask", response_model=AnswerResponse)
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, debug_timings: Optional[str] = Header(None, alias="X-Debug-Timings")):
     """
     Receives a question, gets an answer from the RAG chain, and returns it.
+
+    With the `X-Debug-Timings: 1` header the response includes a per-stage timing breakdown.
     """
     logger.info(f"Received request for /ask: {request.question}")
+    start_time = time.perf_counter()
+    timings = start_timings()
+    context = start_context_stats()
+    qa_chain, index_version, answer_cache = serving_state()
 
     if qa_chain is None:
         logger.error("RAG chain is not initialized. Cannot process question.")
@@ -102,38 +400,261 @@ async def ask_question(request: QuestionRequest):
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
     try:
-        # Here, you would ideally pass the session_id to the chain if you implement per-session memory
-        # For now, the global qa_chain uses its own ConversationBufferMemory
-        logger.info(f"Invoking RAG chain for question: '{request.question}'")
-        result = qa_chain.invoke({"question": request.question})
-        
-        answer = result.get('answer', "Sorry, I couldn't find an answer.")
-        source_documents = result.get("source_documents", [])
-        # Extract source filenames and ensure uniqueness
-        raw_sources = [doc.metadata.get("source", "Unknown source") for doc in source_documents]
-        unique_sources = sorted(list(set(raw_sources))) # Ensure uniqueness and consistent order
-
-        logger.info(f"Successfully processed question. Answer: {answer[:50]}...")
+        chat_history = await get_session_history(request.session_id)
+        # Only questions without prior context have a context-free answer worth caching
+        use_cache = answer_cache is not None and not chat_history
+        question_embedding = None
+        if use_cache:
+            with stage("answer_cache"):
+                cached, tier, question_embedding = await answer_cache.aget(
+                    request.question, index_version, semantic=embeds_question(qa_chain, request.question)
+                )
+            if cached is not None:
+                logger.info(f"Answer cache hit ({tier}) for question: '{request.question}'")
+                await record_session_turn(request.session_id, request.question, cached["answer"])
+                return AnswerResponse(
+                    answer=cached["answer"], sources=cached["sources"], session_id=request.session_id, index_version=index_version,
+                    timings=timings_breakdown(timings, time.perf_counter() - start_time) if wants_timings(debug_timings) else None,
+                )
+
+        async def answer_question():
+            async with admission.slot():
+                logger.info(f"Invoking RAG chain for question: '{request.question}'")
+                # ainvoke keeps the event loop free while the embedding and LLM calls are in flight
+                result = await qa_chain.ainvoke(
+                    {"question": request.question, "chat_history": chat_history},
+                    config={"callbacks": [StageTimingHandler()]},
+                )
+            answer = result.get('answer', "Sorry, I couldn't find an answer.")
+            unique_sources = get_unique_sources(result.get("source_documents", []))
+            if use_cache:
+                answer_cache.put(request.question, index_version, {"answer": answer, "sources": unique_sources}, question_embedding)
+            return answer, unique_sources, context.get("tokens")
+
+        if COALESCE_REQUESTS and not chat_history:
+            # Stateless requests and new sessions ask the same question in the same context
+            key = (index_version, normalize_question(request.question))
+            wait_start = time.perf_counter()
+            (answer, unique_sources, context_tokens), coalesced = await single_flight.run(key, answer_question)
+            if coalesced:
+                record_stage("coalesce", time.perf_counter() - wait_start)
+                logger.info(f"Shared the answer of an identical in-flight request for question: '{request.question}'")
+        else:
+            answer, unique_sources, context_tokens = await answer_question()
+        await record_session_turn(request.session_id, request.question, answer)
+
+        breakdown = timings_breakdown(timings, time.perf_counter() - start_time)
+        packed = f" Packed {context['tokens']} context tokens in {context['chunks']} chunks." if context else ""
+        logger.info(f"Successfully processed question in {breakdown['total']:.0f}ms {breakdown}.{packed} Answer: {answer[:50]}...")
         return AnswerResponse(
             answer=answer, 
             sources=unique_sources, 
-            session_id=request.session_id
+            session_id=request.session_id,
+            index_version=index_version,
+            context_tokens=context_tokens,
+            timings=breakdown if wants_timings(debug_timings) else None,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing question in API: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest, debug_timings: Optional[str] = Header(None, alias="X-Debug-Timings")):
+    """
+    Streams the answer as Server-Sent Events.
+
+    Events: `sources` (sent once, as soon as retrieval finishes), `token` (one per generated
+    token), then `done` with the full answer and timings (`time_to_first_token_ms`,
+    `total_ms`, `context_tokens`, plus a per-stage `timings` breakdown with the `X-Debug-Timings: 1` header),
+    or `error` if generation fails midway.
+    """
+    logger.info(f"Received request for /ask/stream: {request.question}")
+    start_time = time.perf_counter()
+    qa_chain, index_version, answer_cache = serving_state()
+
+    if qa_chain is None:
+        logger.error("RAG chain is not initialized. Cannot process question.")
+        raise HTTPException(status_code=503, detail="Service Unavailable: RAG chain not initialized. Please try again later.")
+
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    timings = start_timings()
+    context = start_context_stats()
+    # Take the admission slot before the response starts so a full queue still yields a 429/503 status
+    slot = AsyncExitStack()
+    await slot.enter_async_context(admission.slot())
+
+    async def event_stream():
+        time_to_first_token = None
+        sources = []
+        try:
+            chat_history = await get_session_history(request.session_id)
+            use_cache = answer_cache is not None and not chat_history
+            cached, question_embedding = None, None
+            if use_cache:
+                with stage("answer_cache"):
+                    cached, tier, question_embedding = await answer_cache.aget(
+                        request.question, index_version, semantic=embeds_question(qa_chain, request.question)
+                    )
+            if cached is not None:
+                logger.info(f"Answer cache hit ({tier}) for streamed question: '{request.question}'")
+                stream = replay_cached_answer(cached)
+            else:
+                stream = astream_answer(qa_chain, request.question, chat_history)
+            async for kind, payload in stream:
+                if kind == "sources":
+                    # Cached answers already carry the de-duplicated source names
+                    sources = payload if cached is not None else get_unique_sources(payload)
+                    yield format_sse("sources", {"sources": sources})
+                elif kind == "token":
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start_time
+                        TIME_TO_FIRST_TOKEN_SECONDS.observe(time_to_first_token)
+                        logger.info(f"Time to first token: {time_to_first_token * 1000:.0f}ms")
+                    yield format_sse("token", {"token": payload})
+                else:
+                    await record_session_turn(request.session_id, request.question, payload)
+                    if use_cache and cached is None:
+                        answer_cache.put(request.question, index_version, {"answer": payload, "sources": sources}, question_embedding)
+                    total_time = time.perf_counter() - start_time
+                    breakdown = timings_breakdown(timings, total_time)
+                    logger.info(f"Successfully streamed answer in {total_time:.2f}s {breakdown}. Answer: {payload[:50]}...")
+                    done = {
+                        "answer": payload,
+                        "sources": sources,
+                        "session_id": request.session_id,
+                        "index_version": index_version,
+                        "context_tokens": context.get("tokens"),
+                        "time_to_first_token_ms": round(time_to_first_token * 1000, 1) if time_to_first_token is not None else None,
+                        "total_ms": round(total_time * 1000, 1),
+                    }
+                    if wants_timings(debug_timings):
+                        done["timings"] = breakdown
+                    yield format_sse("done", done)
+        except Exception as e:
+            logger.error(f"Error streaming answer in API: {e}", exc_info=True)
+            yield format_sse("error", {"detail": f"Internal Server Error: {str(e)}"})
+        finally:
+            await slot.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/ask/batch", response_model=BatchAnswerResponse)
+async def ask_questions_batch(request: BatchQuestionRequest):
+    """
+    Answers many independent questions at once, in order.
+
+    Retrieval follows the configured retrieval mode. The questions that need the vector
+    store are embedded in one request and searched in one FAISS call; the answer LLM calls
+    run with bounded concurrency, each holding an admission slot. Batch questions are
+    stateless: they neither read nor write any session history.
+    """
+    logger.info(f"Received request for /ask/batch with {len(request.questions)} questions")
+    qa_chain, index_version, _ = serving_state()
+
+    if qa_chain is None:
+        logger.error("RAG chain is not initialized. Cannot process questions.")
+        raise HTTPException(status_code=503, detail="Service Unavailable: RAG chain not initialized. Please try again later.")
+
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty.")
+    if len(request.questions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Too many questions: at most {MAX_BATCH_SIZE} per batch.")
+    if any(not question.strip() for question in request.questions):
+        raise HTTPException(status_code=400, detail="Questions cannot be empty.")
+
+    try:
+        # Retrieval and every LLM call take their own admission slot, like the same number of /ask requests
+        results = await aanswer_questions_batch(qa_chain, request.questions, slot=admission.slot)
+        return BatchAnswerResponse(answers=[
+            BatchAnswer(
+                question=result["question"],
+                answer=result["answer"],
+                sources=get_unique_sources(result["source_documents"]),
+                error=result["error"],
+            )
+            for result in results
+        ], index_version=index_version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing batch in API: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+@app.post("/reindex")
+async def reindex_endpoint(full_rebuild: bool = False, admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """
+    Picks up changes in the data directory without downtime.
+
+    The updated index is built in the background while `/ask` keeps answering from the
+    current one, then swapped in. Requires the `X-Admin-Token` header when RAG_ADMIN_TOKEN
+    is set. Answers 409 if a reindex is already running.
+    """
+    if ADMIN_TOKEN and admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+    if reindex_lock.locked():
+        raise HTTPException(status_code=409, detail="A reindex is already in progress.")
+    start_time = time.perf_counter()
+    try:
+        previous_version, version = await reindex(full_rebuild=full_rebuild)
+    except Exception as e:
+        logger.error(f"Error reindexing in API: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    return {
+        "index_version": version,
+        "previous_index_version": previous_version,
+        "swapped": version != previous_version,
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+@app.delete("/sessions/{session_id}")
+async def clear_session(session_id: str):
+    """Forgets the conversation history of a session."""
+    if session_store is not None:
+        await session_store.aclear(session_id)
+    return {"session_id": session_id, "cleared": True}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit rates of the answer cache and the embedding cache, how often the condense step was skipped and requests were coalesced."""
+    embeddings = getattr(getattr(getattr(qa_chain, "retriever", None), "vectorstore", None), "embeddings", None)
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "embedding_cache": embeddings.stats() if hasattr(embeddings, "stats") else None,
+        "condense": get_condense_stats(qa_chain),
+        "coalescing": single_flight.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage and request latency histograms, ingestion and rejection counters."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Several worker processes: aggregate the per-process files prometheus_client writes there
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the RAG Assistant API. Use the /ask endpoint to ask questions."}
 
 # --- Main block to run the server --- 
 if __name__ == "__main__":
+    setup_logging()
     # Ensure OPENAI_API_KEY is available before trying to run
     if not os.getenv("OPENAI_API_KEY"):
         logger.error("OPENAI_API_KEY not found in environment. Please set it in .env file.")
         print("Error: OPENAI_API_KEY not found. Please create a .env file with your key and ensure it's loaded.")
     else:
+        import uvicorn
         logger.info("Starting Uvicorn server for RAG Assistant API...")
         # For development, reload=True is useful. For production, set it to False.
         # The host '0.0.0.0' makes it accessible on your network, '127.0.0.1' for local only.
@@ -0,0 +1,141 @@
+# In-process BM25 inverted index over the chunks in the vector store
+
+import logging
+import os
+import pickle
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.pkl" # Stored inside VECTORSTORE_PATH, next to the FAISS index
+BM25_FORMAT_VERSION = 1
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.5"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+# Words that say nothing about which chunk is relevant; they are neither indexed nor searched
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my no not of on or so than that the their them then there these they this to was "
+    "we were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text and splits it into word tokens, without stopwords."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks, stored as a compressed inverted index.
+
+    Postings are kept in CSR form: the postings of term t are positions
+    offsets[t]:offsets[t + 1] of `doc_positions` (chunk positions) and `term_freqs`.
+    Build a new index whenever the chunks change (see build()); building only tokenizes,
+    so it is cheap next to embedding.
+    """
+
+    def __init__(self, chunk_ids: List[str], doc_lengths: np.ndarray, vocabulary: Dict[str, int],
+                 offsets: np.ndarray, doc_positions: np.ndarray, term_freqs: np.ndarray,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.chunk_ids = chunk_ids
+        self.doc_lengths = doc_lengths
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_positions = doc_positions
+        self.term_freqs = term_freqs
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, str]], k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """Indexes (chunk_id, text) pairs."""
+        chunk_ids, doc_lengths = [], []
+        vocabulary: Dict[str, int] = {}
+        terms, positions, freqs = [], [], []
+        for position, (chunk_id, text) in enumerate(chunks):
+            counts = Counter(tokenize(text))
+            chunk_ids.append(chunk_id)
+            doc_lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                positions.append(position)
+                freqs.append(count)
+
+        terms = np.asarray(terms, dtype=np.int64)
+        order = np.argsort(terms, kind="stable") # Keeps each term's postings in chunk order
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            chunk_ids,
+            np.asarray(doc_lengths, dtype=np.float32),
+            vocabulary,
+            offsets,
+            np.asarray(positions, dtype=np.int32)[order],
+            np.asarray(freqs, dtype=np.float32)[order],
+            k1=k1,
+            b=b,
+        )
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Returns up to k (chunk_id, score) pairs, best first. Chunks sharing no term with the query are left out."""
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids or k <= 0:
+            return []
+        num_docs = len(self.chunk_ids)
+        positions, contributions = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_positions[start:end]
+            tf = self.term_freqs[start:end]
+            df = end - start
+            idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / max(self.avg_doc_length, 1e-9))
+            positions.append(docs)
+            contributions.append(idf * tf * (self.k1 + 1) / (tf + norm))
+
+        # Sum the per-term contributions over the (few) matching chunks only
+        matched, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(self.chunk_ids[matched[i]], float(scores[i])) for i in top]
+
+    def save(self, directory: str) -> None:
+        """Pickles the index to BM25_FILE inside directory."""
+        state = {
+            "version": BM25_FORMAT_VERSION,
+            "chunk_ids": self.chunk_ids,
+            "doc_lengths": self.doc_lengths,
+            "vocabulary": self.vocabulary,
+            "offsets": self.offsets,
+            "doc_positions": self.doc_positions,
+            "term_freqs": self.term_freqs,
+            "k1": self.k1,
+            "b": self.b,
+        }
+        with open(os.path.join(directory, BM25_FILE), "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """Loads the index saved in directory, or returns None if there is none (or it is outdated)."""
+        path = os.path.join(directory, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        # Like the docstore pickle, this file is only written by save_vector_store
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != BM25_FORMAT_VERSION:
+            logger.info(f"Ignoring BM25 index in {directory} with format version {state.get('version')}.")
+            return None
+        state.pop("version")
+        return cls(**state)
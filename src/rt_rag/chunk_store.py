@@ -0,0 +1,152 @@
+# On-disk docstore for the FAISS vector store: chunk text and metadata in SQLite
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Union
+from urllib.request import pathname2url
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+DOCSTORE_FILE = "docstore.sqlite" # Stored inside VECTORSTORE_PATH, next to the FAISS index
+DOCSTORE_BACKENDS = ("memory", "sqlite")
+DOCSTORE_BACKEND = os.getenv("RAG_DOCSTORE", "memory").lower()
+
+_MAX_VARIABLES = 500 # Ids per IN (...) query, well below SQLite's limit
+
+
+def get_docstore_backend() -> str:
+    """The configured docstore backend (RAG_DOCSTORE)."""
+    if DOCSTORE_BACKEND not in DOCSTORE_BACKENDS:
+        logger.warning(f"Unknown RAG_DOCSTORE '{DOCSTORE_BACKEND}'; using 'memory'.")
+        return "memory"
+    return DOCSTORE_BACKEND
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore that keeps chunk text and metadata in SQLite and reads only the chunks asked for.
+
+    A published store is opened read-only: save_vector_store never modifies it in place,
+    so any number of workers can read it without locking and only the index-to-id map
+    stays in memory. Before an incremental update, copy_on_write() names a scratch file;
+    the first add() or delete() copies the database there. save() moves a written store
+    into the staging directory of the next publish. Pickling keeps no path, so the
+    docstore pickle next to the index is tiny; open() reattaches a loaded store to its
+    directory.
+    """
+
+    def __init__(self, path: Optional[str] = None, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self.working_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._conn = self._connect() if path else None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            # immutable=1: a published file never changes, so SQLite can skip file locking
+            uri = f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro&immutable=1"
+            return sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=OFF") # A scratch file until it is published; a crash discards it
+        conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL)")
+        conn.commit()
+        return conn
+
+    def __getstate__(self) -> Dict:
+        return {}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__()
+
+    def open(self, directory: str) -> "SQLiteDocstore":
+        """Attaches the store to the DOCSTORE_FILE published in directory, read-only."""
+        self.path, self.read_only = os.path.join(directory, DOCSTORE_FILE), True
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        self._conn = self._connect()
+        return self
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute("SELECT content, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        rows = [(chunk_id, doc.page_content, json.dumps(doc.metadata, default=str)) for chunk_id, doc in texts.items()]
+        with self._lock:
+            self._ensure_writable()
+            existing = self._existing_ids(list(texts))
+            if existing:
+                raise ValueError(f"Tried to add ids that already exist: {existing}")
+            self._conn.executemany("INSERT INTO chunks (id, content, metadata) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._ensure_writable()
+            missing = set(ids) - self._existing_ids(ids)
+            if missing:
+                raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self._conn.commit()
+
+    def _existing_ids(self, ids: List[str]) -> set:
+        existing = set()
+        for start in range(0, len(ids), _MAX_VARIABLES):
+            part = ids[start:start + _MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(part))
+            existing.update(row[0] for row in self._conn.execute(f"SELECT id FROM chunks WHERE id IN ({placeholders})", part))
+        return existing
+
+    def copy_on_write(self, working_path: str) -> None:
+        """Lets a read-only store be modified: the first write copies it to working_path."""
+        self.working_path = working_path
+
+    def _ensure_writable(self) -> None:
+        if not self.read_only:
+            return
+        if self.working_path is None:
+            raise ValueError(f"Docstore {self.path} is read-only.")
+        if os.path.exists(self.working_path):
+            os.remove(self.working_path)
+        target = sqlite3.connect(self.working_path)
+        try:
+            self._conn.backup(target)
+        finally:
+            target.close()
+        self._conn.close()
+        self.path, self.read_only, self.working_path = self.working_path, False, None
+        self._conn = self._connect()
+
+    def save(self, directory: str) -> None:
+        """Writes the store to DOCSTORE_FILE in directory and reopens it there read-only.
+
+        A written store is a scratch file, so it is moved; an unchanged read-only store is copied.
+        """
+        target = os.path.join(directory, DOCSTORE_FILE)
+        with self._lock:
+            if self.read_only:
+                copy = sqlite3.connect(target)
+                try:
+                    self._conn.backup(copy)
+                finally:
+                    copy.close()
+                self._conn.close()
+            else:
+                self._conn.commit()
+                self._conn.close()
+                os.replace(self.path, target)
+            self.path, self.read_only = target, True
+            self._conn = self._connect()
@@ -0,0 +1,132 @@
+# Policy for the condense-question step of the conversational retrieval chain
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from langchain.chains import LLMChain
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+from pydantic import PrivateAttr
+
+from metrics import CONDENSE_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+CONDENSE_POLICIES = ("auto", "always", "never")
+CONDENSE_POLICY = os.getenv("RAG_CONDENSE_POLICY", "auto").lower()
+CONDENSE_MODEL = os.getenv("RAG_CONDENSE_MODEL") # Defaults to the answer model
+CONDENSE_CACHE_SIZE = int(os.getenv("RAG_CONDENSE_CACHE_SIZE", "1000")) # 0 disables the cache
+CONDENSE_MIN_WORDS = int(os.getenv("RAG_CONDENSE_MIN_WORDS", "4")) # Shorter follow-ups are always rewritten
+
+_WORD_PATTERN = re.compile(r"[a-z']+")
+# Words that point back into the conversation: a question using them needs the history to make sense
+REFERENCE_WORDS = frozenset(
+    "it its it's they them their theirs this that these those he him his she her hers one ones "
+    "there then former latter above previous earlier same such also else another other others "
+    "again more further".split()
+)
+# Openings of elliptical follow-ups such as "and for PDFs?" or "what about the API?"
+FOLLOW_UP_PREFIXES = ("and ", "but ", "or ", "so ", "also ", "then ", "what about", "how about", "why not", "same ")
+
+
+def get_condense_policy() -> str:
+    """The configured condense policy (RAG_CONDENSE_POLICY)."""
+    if CONDENSE_POLICY not in CONDENSE_POLICIES:
+        logger.warning(f"Unknown RAG_CONDENSE_POLICY '{CONDENSE_POLICY}'; using 'auto'.")
+        return "auto"
+    return CONDENSE_POLICY
+
+
+def is_self_contained(question: str, min_words: int = CONDENSE_MIN_WORDS) -> bool:
+    """Heuristic: whether a follow-up question can be understood without the chat history.
+
+    It must have at least `min_words` words, must not open like an elliptical follow-up
+    ("and ...", "what about ...") and must not use pronouns or other words that refer back
+    to earlier turns.
+    """
+    text = question.strip().lower()
+    words = _WORD_PATTERN.findall(text)
+    if len(words) < min_words or text.startswith(FOLLOW_UP_PREFIXES):
+        return False
+    return not any(word in REFERENCE_WORDS for word in words)
+
+
+class CondenseQuestionChain(LLMChain):
+    """The question generator of a ConversationalRetrievalChain, with a policy in front of the LLM.
+
+    The chain only calls it when there is chat history. With policy "auto", a question
+    that is_self_contained() is passed through as is, and rewrites are cached per (history,
+    question) in a bounded LRU; "always" rewrites every question and "never" none. Each
+    decision is counted in rag_condense_total{outcome} and in stats().
+    """
+
+    policy: str = "auto"
+    cache_size: int = CONDENSE_CACHE_SIZE
+    _cache: "OrderedDict[tuple, str]" = PrivateAttr(default_factory=OrderedDict)
+    _counts: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _decide(self, inputs: Dict[str, Any]) -> Optional[str]:
+        """Returns the question to use without an LLM call, or None if it has to be rewritten."""
+        question = inputs["question"]
+        if self.policy == "never":
+            return self._record("skipped_policy", question)
+        if self.policy == "auto" and is_self_contained(question):
+            return self._record("self_contained", question)
+        with self._lock:
+            cached = self._cache.get((inputs["chat_history"], question))
+            if cached is not None:
+                self._cache.move_to_end((inputs["chat_history"], question))
+        if cached is not None:
+            return self._record("cached", cached)
+        return None
+
+    def _record(self, outcome: str, question: Optional[str] = None) -> Optional[str]:
+        CONDENSE_DECISIONS.labels(outcome=outcome).inc()
+        with self._lock:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+        return question
+
+    def _remember(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> Dict[str, str]:
+        self._record("rewritten")
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[(inputs["chat_history"], inputs["question"])] = outputs[self.output_key]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return outputs
+
+    def _call(self, inputs: Dict[str, Any], run_manager=None) -> Dict[str, str]:
+        question = self._decide(inputs)
+        if question is not None:
+            return {self.output_key: question}
+        return self._remember(inputs, super()._call(inputs, run_manager=run_manager))
+
+    async def _acall(self, inputs: Dict[str, Any], run_manager=None) -> Dict[str, str]:
+        question = self._decide(inputs)
+        if question is not None:
+            return {self.output_key: question}
+        return self._remember(inputs, await super()._acall(inputs, run_manager=run_manager))
+
+    def stats(self) -> Dict[str, Any]:
+        """Decision counts for this process, the share of questions not sent to the LLM and the cache size."""
+        with self._lock:
+            counts = dict(self._counts)
+            cached_rewrites = len(self._cache)
+        total = sum(counts.values())
+        skipped = total - counts.get("rewritten", 0)
+        return {
+            "policy": self.policy,
+            "decisions": counts,
+            "skip_rate": skipped / total if total else 0.0,
+            "cached_rewrites": cached_rewrites,
+        }
+
+
+def create_condense_chain(llm, policy: Optional[str] = None, prompt=CONDENSE_QUESTION_PROMPT) -> CondenseQuestionChain:
+    """Builds the question generator for ConversationalRetrievalChain with the configured policy."""
+    return CondenseQuestionChain(llm=llm, prompt=prompt, policy=policy or get_condense_policy())
+
@@ -0,0 +1,115 @@
+# Selection of the retrieved chunks that go into the answer prompt: similarity floor, MMR and a token budget
+
+import logging
+import os
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from metrics import record_context_packed, stage
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_PACKING = os.getenv("RAG_CONTEXT_PACKING", "0").strip().lower() in ("1", "true", "yes", "on")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500")) # Tokens of chunk text per answer prompt
+CONTEXT_FETCH_K = int(os.getenv("RAG_CONTEXT_FETCH_K", "20")) # Candidates retrieved before packing
+CONTEXT_MAX_CHUNKS = int(os.getenv("RAG_CONTEXT_MAX_CHUNKS", "8"))
+CONTEXT_MIN_SIMILARITY = float(os.getenv("RAG_CONTEXT_MIN_SIMILARITY", "0.0")) # Cosine similarity to the question
+CONTEXT_MAX_SIMILARITY_GAP = float(os.getenv("RAG_CONTEXT_MAX_SIMILARITY_GAP", "0.15")) # Below the best candidate
+CONTEXT_MMR_LAMBDA = float(os.getenv("RAG_CONTEXT_MMR_LAMBDA", "0.7")) # 1 = relevance only, 0 = diversity only
+TOKENIZER_ENCODING = os.getenv("RAG_TOKENIZER_ENCODING", "cl100k_base")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken, or estimates 4 characters per token if its encoding cannot be loaded."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e: # Not installed, or the encoding file cannot be downloaded
+            logger.warning(f"Could not load the {TOKENIZER_ENCODING} tokenizer ({e}); estimating 4 characters per token.")
+            _encoding = False
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class ContextPacker:
+    """Chooses the retrieved chunks for the answer prompt instead of always stuffing the top k.
+
+    The retriever over-fetches `fetch_k` candidates. Candidates whose cosine similarity to
+    the question is below `min_similarity`, or more than `max_similarity_gap` below the
+    best candidate, are dropped; an easy question with one clear match thus gets few
+    chunks. The rest are ordered by maximal marginal relevance (MMR) and added while they
+    fit in `token_budget` (the first one always does), up to `max_chunks`. Candidates
+    without vectors (lexical hits) keep their ranking and only go through the budget.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, fetch_k: int = CONTEXT_FETCH_K,
+                 max_chunks: int = CONTEXT_MAX_CHUNKS, min_similarity: float = CONTEXT_MIN_SIMILARITY,
+                 max_similarity_gap: float = CONTEXT_MAX_SIMILARITY_GAP, mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                 token_counter: Callable[[str], int] = count_tokens):
+        self.token_budget = token_budget
+        self.fetch_k = fetch_k
+        self.max_chunks = max_chunks
+        self.min_similarity = min_similarity
+        self.max_similarity_gap = max_similarity_gap
+        self.mmr_lambda = mmr_lambda
+        self.token_counter = token_counter
+
+    def order(self, query_vector: Sequence[float], vectors: np.ndarray) -> List[int]:
+        """Positions of the candidates that pass the similarity floor, in MMR order."""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        similarities = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+        floor = max(self.min_similarity, float(similarities.max()) - self.max_similarity_gap)
+        remaining = np.flatnonzero(similarities >= floor)
+        redundancy = np.zeros(len(vectors), dtype=np.float32) # Highest similarity to an already chosen candidate
+        ordered = []
+        while len(remaining) and len(ordered) < self.max_chunks:
+            scores = self.mmr_lambda * similarities[remaining] - (1 - self.mmr_lambda) * redundancy[remaining]
+            chosen = int(remaining[int(np.argmax(scores))])
+            ordered.append(chosen)
+            redundancy = np.maximum(redundancy, vectors @ vectors[chosen])
+            remaining = remaining[remaining != chosen]
+        return ordered
+
+    def pack(self, documents: List[Document], query_vector: Optional[Sequence[float]] = None,
+             vectors: Optional[np.ndarray] = None) -> List[Document]:
+        """Returns the candidates that make up the answer context, most relevant first."""
+        if not documents:
+            record_context_packed(0, 0)
+            return []
+        with stage("pack"):
+            if query_vector is None or vectors is None:
+                order = list(range(len(documents)))
+            else:
+                order = self.order(query_vector, vectors)
+            packed, used = [], 0
+            for position in order:
+                if len(packed) >= self.max_chunks:
+                    break
+                tokens = self.token_counter(documents[position].page_content)
+                if packed and used + tokens > self.token_budget:
+                    continue # A shorter candidate further down may still fit
+                packed.append(documents[position])
+                used += tokens
+        record_context_packed(used, len(packed))
+        return packed
+
+
+def create_context_packer() -> Optional[ContextPacker]:
+    """Returns a ContextPacker with the configured settings, or None unless RAG_CONTEXT_PACKING is on."""
+    if not CONTEXT_PACKING:
+        return None
+    return ContextPacker(
+        token_budget=CONTEXT_TOKEN_BUDGET, fetch_k=CONTEXT_FETCH_K, max_chunks=CONTEXT_MAX_CHUNKS,
+        min_similarity=CONTEXT_MIN_SIMILARITY, max_similarity_gap=CONTEXT_MAX_SIMILARITY_GAP, mmr_lambda=CONTEXT_MMR_LAMBDA,
+    )
@@ -0,0 +1,225 @@
+# Exact and near-duplicate chunk detection between splitting and embedding
+
+import hashlib
+import logging
+import os
+import pickle
+import re
+import zlib
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEDUP_FILE = "dedup.pkl" # Stored inside VECTORSTORE_PATH, next to the FAISS index
+DEDUP_FORMAT_VERSION = 1
+DEDUP_MODES = ("off", "exact", "near")
+DEDUP_MODE = os.getenv("RAG_DEDUP", "off").lower()
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9")) # Estimated Jaccard similarity of word shingles
+DEDUP_NUM_PERM = int(os.getenv("RAG_DEDUP_NUM_PERM", "128")) # MinHash signature length
+DEDUP_SHINGLE_SIZE = int(os.getenv("RAG_DEDUP_SHINGLE_SIZE", "5")) # Words per shingle
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def get_dedup_mode() -> str:
+    """The configured dedup mode (RAG_DEDUP)."""
+    if DEDUP_MODE not in DEDUP_MODES:
+        logger.warning(f"Unknown RAG_DEDUP '{DEDUP_MODE}'; deduplication is off.")
+        return "off"
+    return DEDUP_MODE
+
+
+def get_dedup_params() -> Optional[Dict]:
+    """Settings that change which chunks get indexed, or None if deduplication is off."""
+    mode = get_dedup_mode()
+    if mode == "off":
+        return None
+    if mode == "exact":
+        return {"mode": mode}
+    return {"mode": mode, "threshold": DEDUP_THRESHOLD, "num_perm": DEDUP_NUM_PERM, "shingle_size": DEDUP_SHINGLE_SIZE}
+
+
+def content_hash(text: str) -> str:
+    """sha256 of the text with runs of whitespace collapsed, so re-wrapped copies hash alike."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> Set[str]:
+    """The set of lowercased `size`-word windows of text (the whole text if it is shorter)."""
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) <= size:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Splits a signature into (bands, rows) so pairs at `threshold` similarity are likely candidates.
+
+    Picks the most rows per band whose S-curve midpoint (1/bands)^(1/rows) is still at or
+    below the threshold: fewer spurious candidates, while pairs above it collide in some band.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """MinHash signatures of word shingles with `num_perm` random universal hash functions."""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a, x < 2**32 keeps a * x + b within uint64
+        self.a = rng.randint(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def __call__(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)), dtype=np.uint64
+        )
+        permuted = ((hashes[:, None] * self.a + self.b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class ChunkDeduplicator:
+    """Remembers the chunks kept so far and tells whether a new chunk repeats one of them.
+
+    Exact duplicates are found by content_hash(). In "near" mode, candidates sharing a
+    band of their MinHash signature (LSH) are compared and a chunk whose estimated
+    Jaccard similarity to a kept chunk reaches `threshold` is a near duplicate. The state
+    is saved next to the index, so incremental updates compare against every kept chunk.
+    """
+
+    def __init__(self, mode: str = "exact", threshold: float = DEDUP_THRESHOLD,
+                 num_perm: int = DEDUP_NUM_PERM, shingle_size: int = DEDUP_SHINGLE_SIZE):
+        self.mode = mode
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.minhasher = MinHasher(num_perm, shingle_size) if mode == "near" else None
+        self.hashes: Dict[str, str] = {} # content hash -> kept chunk id
+        self.chunk_hashes: Dict[str, str] = {} # kept chunk id -> content hash
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self.dropped = {"exact": 0, "near": 0}
+
+    @classmethod
+    def from_params(cls, params: Dict) -> "ChunkDeduplicator":
+        return cls(**params)
+
+    @property
+    def params(self) -> Dict:
+        if self.mode == "exact":
+            return {"mode": self.mode}
+        return {"mode": self.mode, "threshold": self.threshold, "num_perm": self.num_perm, "shingle_size": self.shingle_size}
+
+    def __len__(self) -> int:
+        return len(self.chunk_hashes)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.chunk_hashes
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _find_near(self, signature: np.ndarray) -> Optional[str]:
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for chunk_id in sorted(candidates):
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        return best
+
+    def _keep(self, chunk_id: str, digest: str, signature: Optional[np.ndarray]) -> None:
+        self.hashes.setdefault(digest, chunk_id)
+        self.chunk_hashes[chunk_id] = digest
+        if signature is not None:
+            self.signatures[chunk_id] = signature
+            for key in self._band_keys(signature):
+                self.buckets.setdefault(key, set()).add(chunk_id)
+
+    def add(self, chunk_id: str, text: str) -> None:
+        """Records a kept chunk without checking it (e.g. one that is already indexed)."""
+        if chunk_id not in self.chunk_hashes:
+            self._keep(chunk_id, content_hash(text), self.minhasher(text) if self.minhasher else None)
+
+    def check(self, chunk_id: str, text: str) -> Optional[str]:
+        """Returns the id of the kept chunk that `text` duplicates, or keeps the chunk and returns None."""
+        if chunk_id in self.chunk_hashes:
+            return None
+        digest = content_hash(text)
+        kept = self.hashes.get(digest)
+        if kept is not None:
+            self.dropped["exact"] += 1
+            return kept
+        signature = None
+        if self.minhasher is not None:
+            signature = self.minhasher(text)
+            kept = self._find_near(signature)
+            if kept is not None:
+                self.dropped["near"] += 1
+                return kept
+        self._keep(chunk_id, digest, signature)
+        return None
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        """Forgets kept chunks, e.g. those deleted from the index."""
+        for chunk_id in chunk_ids:
+            digest = self.chunk_hashes.pop(chunk_id, None)
+            if digest is None:
+                continue
+            if self.hashes.get(digest) == chunk_id:
+                del self.hashes[digest]
+            signature = self.signatures.pop(chunk_id, None)
+            if signature is not None:
+                for key in self._band_keys(signature):
+                    bucket = self.buckets.get(key)
+                    if bucket is not None:
+                        bucket.discard(chunk_id)
+                        if not bucket:
+                            del self.buckets[key]
+
+    def save(self, directory: str) -> None:
+        """Pickles the kept chunks' hashes and signatures to DEDUP_FILE inside directory."""
+        chunk_ids = list(self.chunk_hashes)
+        signatures = np.stack([self.signatures[chunk_id] for chunk_id in chunk_ids]) \
+            if self.minhasher is not None and chunk_ids else None
+        state = {
+            "version": DEDUP_FORMAT_VERSION,
+            "params": self.params,
+            "chunk_ids": chunk_ids,
+            "hashes": [self.chunk_hashes[chunk_id] for chunk_id in chunk_ids],
+            "signatures": signatures,
+        }
+        with open(os.path.join(directory, DEDUP_FILE), "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, directory: str, params: Dict) -> Optional["ChunkDeduplicator"]:
+        """Loads the state saved in directory, or returns None if there is none or it used other params."""
+        path = os.path.join(directory, DEDUP_FILE)
+        if not os.path.exists(path):
+            return None
+        # Like the docstore pickle, this file is only written by save_vector_store
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != DEDUP_FORMAT_VERSION or state.get("params") != params:
+            logger.info(f"Ignoring dedup state in {directory} saved with other settings.")
+            return None
+        deduplicator = cls.from_params(params)
+        for position, (chunk_id, digest) in enumerate(zip(state["chunk_ids"], state["hashes"])):
+            signature = state["signatures"][position] if state["signatures"] is not None else None
+            deduplicator._keep(chunk_id, digest, signature)
+        return deduplicator
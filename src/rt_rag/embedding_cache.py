@@ -0,0 +1,193 @@
+# Disk-backed embedding cache for the RAG Assistant
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("RAG_EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# Cache hits only mark entries as recently used in memory; they are written out with the next
+# insert, or once this many are pending or the oldest is this many seconds old
+TOUCH_FLUSH_ENTRIES = 256
+TOUCH_FLUSH_SECONDS = 30.0
+
+
+def _as_float32(vectors: List[List[float]]) -> List[List[float]]:
+    """Rounds vectors to float32 so fresh results equal what a later cache hit returns."""
+    return np.asarray(vectors, dtype=np.float32).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings object with a persistent SQLite cache.
+
+    Entries are keyed by (model name, sha256 of the text) and stored as float32 blobs.
+    Document and query embeddings share entries, which holds for OpenAI models where
+    embed_query(text) == embed_documents([text])[0]. The cache keeps at most
+    `max_entries` vectors and evicts the least recently used ones beyond that.
+
+    The async methods run the SQLite work in the default executor, so a lookup never
+    blocks the event loop. The entry count is tracked as rows are inserted and evicted
+    instead of being counted on every insert; it is recounted before evicting, since
+    other processes may share the file.
+    """
+
+    def __init__(self, underlying_embeddings: Embeddings, path: str = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, model_name: Optional[str] = None):
+        self.underlying_embeddings = underlying_embeddings
+        self.model_name = model_name or getattr(underlying_embeddings, "model", None) or type(underlying_embeddings).__name__
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._touched: Dict[str, float] = {} # Key -> last use not yet written
+        self._touched_since: Optional[float] = None
+
+    @property
+    def model(self) -> str:
+        return self.model_name
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Returns cached vectors for the given keys and marks them as recently used."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), 500): # Stay below SQLite's host-parameter limit
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._touched.update(dict.fromkeys(found, now))
+                if self._touched_since is None:
+                    self._touched_since = now
+                if len(self._touched) >= TOUCH_FLUSH_ENTRIES or now - self._touched_since >= TOUCH_FLUSH_SECONDS:
+                    self._flush_touched()
+                    self._conn.commit()
+        return found
+
+    def _flush_touched(self) -> None:
+        """Writes the pending last-used times; the caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key, now in self._touched.items()])
+            self._touched.clear()
+        self._touched_since = None
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        """Inserts new vectors and evicts the least recently used entries over the size bound."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            # Recent hits must be on disk before eviction picks the least recently used rows
+            self._flush_touched()
+            # The vector of a (model, text) key never changes, so an existing row can stay as it is
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+            ).rowcount
+            self._entries += max(inserted, 0)
+            if self._entries > self.max_entries:
+                self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                # Evict a little more than needed so a full cache does not evict on every insert
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess + self.max_entries // 100,),
+                ).rowcount
+                self._entries -= evicted
+                logger.info(f"Embedding cache evicted {evicted} least recently used entries.")
+            self._conn.commit()
+
+    def _split(self, texts: List[str]):
+        """Returns (keys, cached vectors by key, texts that still need embedding)."""
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for key in keys if key not in cached)
+        self.misses += len(missing)
+        return keys, cached, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split(texts)
+        if missing:
+            vectors = self.underlying_embeddings.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), _as_float32(vectors)))
+            self._store(new_items)
+            cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+        self.misses += 1
+        vector = _as_float32([self.underlying_embeddings.embed_query(text)])[0]
+        self._store({key: vector})
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await run_in_executor(None, self._split, texts)
+        if missing:
+            vectors = await self.underlying_embeddings.aembed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), _as_float32(vectors)))
+            await run_in_executor(None, self._store, new_items)
+            cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        cached = await run_in_executor(None, self._lookup, [key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+        self.misses += 1
+        vector = _as_float32([await self.underlying_embeddings.aembed_query(text)])[0]
+        await run_in_executor(None, self._store, {key: vector})
+        return vector
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process plus the number of stored entries."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+        }
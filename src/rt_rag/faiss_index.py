@@ -0,0 +1,262 @@
+# FAISS index construction and tuning for the RAG Assistant
+
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Tolerate a second OpenMP runtime (e.g. from torch) in the same process; must be set before faiss loads
+os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# Build-time parameters: changing any of them requires rebuilding the index
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat").lower()
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "200"))
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0")) # 0 = about 4 * sqrt(number of vectors)
+PQ_M = int(os.getenv("RAG_PQ_M", "16")) # Sub-quantizers; must divide the embedding dimension
+PQ_NBITS = int(os.getenv("RAG_PQ_NBITS", "8"))
+TRAIN_SAMPLE_SIZE = int(os.getenv("RAG_INDEX_TRAIN_SAMPLE", "100000"))
+
+# Search-time parameters: applied whenever an index is loaded, no rebuild needed
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+
+def get_index_params() -> Dict:
+    """The requested build-time index parameters (stored in the manifest config)."""
+    if INDEX_TYPE not in INDEX_TYPES:
+        raise ValueError(f"Unknown RAG_INDEX_TYPE '{INDEX_TYPE}'. Expected one of {INDEX_TYPES}.")
+    params = {"type": INDEX_TYPE}
+    if INDEX_TYPE == "hnsw":
+        params.update(m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+    if INDEX_TYPE in ("ivf", "ivfpq"):
+        params.update(nlist=IVF_NLIST, train_sample=TRAIN_SAMPLE_SIZE)
+    if INDEX_TYPE == "ivfpq":
+        params.update(pq_m=PQ_M, pq_nbits=PQ_NBITS)
+    return params
+
+
+def supports_removal(index) -> bool:
+    """Whether FAISS.delete can be used on this index.
+
+    langchain's FAISS.delete renumbers the remaining vectors, which only matches what
+    IndexFlat does. IVF indexes keep their ids after remove_ids and HNSW cannot remove
+    at all, so those are rebuilt instead when vectors have to go.
+    """
+    return isinstance(index, faiss.IndexFlat)
+
+
+def is_fallback_index(index, params: Optional[Dict] = None) -> bool:
+    """Whether a flat index stands in for a requested type that could not be trained yet."""
+    params = params or get_index_params()
+    return params["type"] != "flat" and isinstance(index, faiss.IndexFlat)
+
+
+def create_index(vectors: np.ndarray, params: Optional[Dict] = None):
+    """Creates and (if needed) trains an empty index for the given vectors.
+
+    The vectors are only used for training; the caller adds them afterwards. Falls back
+    to a flat index when there are too few vectors to train the requested type.
+    """
+    params = params or get_index_params()
+    n, dim = vectors.shape
+    index_type = params["type"]
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+
+    if index_type in ("ivf", "ivfpq"):
+        nlist = params["nlist"] or max(1, int(4 * math.sqrt(n)))
+        min_points = nlist
+        if index_type == "ivfpq":
+            if dim % params["pq_m"] != 0:
+                raise ValueError(f"RAG_PQ_M={params['pq_m']} must divide the embedding dimension {dim}.")
+            min_points = max(nlist, 2 ** params["pq_nbits"])
+        if n < min_points:
+            logger.warning(f"Only {n} vectors; {index_type} needs at least {min_points} to train. Using a flat index.")
+            return faiss.IndexFlatL2(dim)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["pq_m"], params["pq_nbits"])
+        sample = vectors
+        if n > params["train_sample"]:
+            sample = vectors[np.random.default_rng(0).choice(n, params["train_sample"], replace=False)]
+        logger.info(f"Training {index_type} index (nlist={nlist}) on {len(sample)} of {n} vectors...")
+        start = time.perf_counter()
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        logger.info(f"Index trained in {time.perf_counter() - start:.2f}s.")
+        return index
+
+    return faiss.IndexFlatL2(dim)
+
+
+class IndexBuilder:
+    """Builds an index from batches of vectors as they are embedded.
+
+    Flat and HNSW indexes take every batch right away. IVF and IVF-PQ indexes need to
+    know the number of vectors (for nlist) and train before adding, so their batches are
+    kept as float32 arrays until finish() trains and fills the index.
+    """
+
+    def __init__(self, params: Optional[Dict] = None):
+        self.params = params or get_index_params()
+        self.index = None
+        self.ntotal = 0
+        self._pending: List[np.ndarray] = []
+
+    def add(self, vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.ntotal += len(vectors)
+        if self.params["type"] in ("ivf", "ivfpq"):
+            self._pending.append(vectors)
+            return
+        if self.index is None:
+            self.index = create_index(vectors, self.params)
+        self.index.add(vectors)
+
+    def finish(self):
+        """Returns the built index (None if no vectors were added)."""
+        if self._pending:
+            vectors = np.concatenate(self._pending)
+            self._pending = []
+            self.index = create_index(vectors, self.params)
+            self.index.add(vectors)
+        return self.index
+
+
+def apply_search_params(index, nprobe: int = IVF_NPROBE, ef_search: int = HNSW_EF_SEARCH) -> None:
+    """Sets nprobe (IVF) or efSearch (HNSW) on a built or loaded index."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+_direct_map_lock = threading.Lock()
+
+
+def make_reconstructable(index) -> None:
+    """Builds the direct map reconstruct_vectors needs on IVF indexes (other types have one built in).
+
+    Costs one int64 per vector. make_direct_map rewrites the index, so call this once when
+    the index is loaded, before it serves concurrent searches.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return
+    with _direct_map_lock:
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+
+
+def reconstruct_vectors(index, positions: List[int]) -> np.ndarray:
+    """Returns the vectors stored at `positions` (approximations for PQ), e.g. to compare search hits.
+
+    Read-only, so it is safe next to concurrent searches; IVF indexes must have gone
+    through make_reconstructable first.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        raise ValueError("IVF index has no direct map; call make_reconstructable() when loading it.")
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def mmap_flags(index_class: Optional[str]) -> Optional[int]:
+    """read_index flags that memory-map an index of the given class read-only, or None if unsupported.
+
+    IVF indexes map their inverted lists (IO_FLAG_MMAP); flat and HNSW indexes map their
+    vector storage (IO_FLAG_MMAP_IFC, faiss >= 1.9).
+    """
+    if index_class and "IVF" in index_class:
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    ifc_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    return ifc_flag | faiss.IO_FLAG_READ_ONLY if ifc_flag is not None else None
+
+
+def read_index(path: str, mmap: bool = False, index_class: Optional[str] = None):
+    """Reads a saved index, memory-mapped and read-only if requested and supported.
+
+    A memory-mapped index shares its pages with every other process mapping the same
+    file, and cannot be modified. Falls back to a normal read if mapping fails.
+    """
+    flags = mmap_flags(index_class) if mmap else None
+    if flags is not None:
+        try:
+            index = faiss.read_index(path, flags)
+            logger.info(f"Memory-mapped {type(index).__name__} from {path} (read-only).")
+            return index
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {path} ({e}); reading it into memory instead.")
+    return faiss.read_index(path)
+
+
+def describe_index(index) -> Dict:
+    """The parameters an index was actually built with (stored in the manifest)."""
+    description = {"class": type(index).__name__, "dim": index.d, "ntotal": index.ntotal}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        description.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexIVFPQ):
+        description.update(pq_m=index.pq.M, pq_nbits=index.pq.nbits)
+    if isinstance(index, faiss.IndexHNSW):
+        description.update(m=index.hnsw.nb_neighbors(1), ef_construction=index.hnsw.efConstruction,
+                           ef_search=index.hnsw.efSearch)
+    return description
+
+
+def evaluate_index(index, vectors: np.ndarray, queries: np.ndarray, k: int = 10) -> Dict:
+    """Compares an index against exact (flat) search over the same vectors.
+
+    `vectors` must be in the index's id order. Returns recall@k of the index relative to
+    the flat results and the per-query latency of both.
+    """
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, exact.ntotal)
+
+    start = time.perf_counter()
+    _, exact_ids = exact.search(queries, k)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    _, index_ids = index.search(queries, k)
+    index_seconds = time.perf_counter() - start
+
+    found = sum(len(set(row_index) & set(row_exact)) for row_index, row_exact in zip(index_ids, exact_ids))
+    return {
+        "index": describe_index(index),
+        "queries": len(queries),
+        "k": k,
+        f"recall@{k}": found / (len(queries) * k),
+        "index_ms_per_query": index_seconds * 1000 / len(queries),
+        "flat_ms_per_query": exact_seconds * 1000 / len(queries),
+    }
+
+
+def sample_query_vectors(vectors: np.ndarray, count: int) -> np.ndarray:
+    """Picks stored vectors (with a little noise) to use as evaluation queries."""
+    rng = np.random.default_rng(0)
+    picked = vectors[rng.choice(len(vectors), min(count, len(vectors)), replace=False)]
+    noise = rng.normal(scale=picked.std() * 0.1, size=picked.shape)
+    return (picked + noise).astype(np.float32)
+
+
+def index_vectors_in_order(vectorstore, embeddings) -> List[List[float]]:
+    """Re-embeds the stored chunks in index order (served from the embedding cache when enabled)."""
+    texts = [vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+             for i in range(len(vectorstore.index_to_docstore_id))]
+    return embeddings.embed_documents(texts)
@@ -0,0 +1,233 @@
+# Vector, lexical (BM25) and hybrid retrieval for the RAG Assistant
+
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+from pydantic import ConfigDict, Field, PrivateAttr
+
+from bm25_index import BM25Index, tokenize
+from context_packing import ContextPacker
+from metrics import RETRIEVALS, stage
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "vector").lower()
+HYBRID_FETCH_K = int(os.getenv("RAG_HYBRID_FETCH_K", "20")) # Candidates taken from each ranking before fusion
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+LEXICAL_FAST_PATH = os.getenv("RAG_LEXICAL_FAST_PATH", "0").strip().lower() in ("1", "true", "yes", "on")
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("RAG_LEXICAL_FAST_PATH_MAX_TERMS", "3"))
+
+
+def get_retrieval_mode() -> str:
+    """The configured retrieval mode (RAG_RETRIEVAL_MODE)."""
+    if RETRIEVAL_MODE not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown RAG_RETRIEVAL_MODE '{RETRIEVAL_MODE}'. Expected one of {RETRIEVAL_MODES}.")
+    return RETRIEVAL_MODE
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Merges ranked id lists; each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    # Stable sort: ties keep the order of first appearance (vector ranking first)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def is_keyword_query(query: str, max_terms: int = LEXICAL_FAST_PATH_MAX_TERMS) -> bool:
+    """Whether query looks like a few keywords rather than a question (short, no question mark)."""
+    return "?" not in query and 0 < len(tokenize(query)) <= max_terms and len(query.split()) <= max_terms
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieves chunks from the FAISS vector store, the BM25 index, or both.
+
+    * "vector": FAISS similarity search, as `vectorstore.as_retriever()` would do.
+    * "lexical": BM25 only; the question is never embedded.
+    * "hybrid": both rankings (`fetch_k` candidates each), merged by reciprocal rank fusion.
+
+    With `lexical_fast_path`, short keyword queries (see is_keyword_query) take the
+    lexical route in any mode, as long as BM25 finds something. The BM25 search is timed
+    as the `lexical` stage and the FAISS search as `search`, next to `embed_query`.
+    `vectorstore` and `search_kwargs` mirror VectorStoreRetriever. abatch_retrieve()
+    serves the batch path with one embeddings request and one FAISS search.
+
+    With a `context_packer`, the vector and hybrid routes fetch its `fetch_k` candidates
+    instead of k and return what it packs (see context_packing); lexical routes still
+    return at most k chunks, trimmed to the token budget.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    bm25_index: Optional[BM25Index] = None
+    search_kwargs: Dict[str, Any] = Field(default_factory=lambda: {"k": 4})
+    mode: str = Field(default_factory=get_retrieval_mode)
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    lexical_fast_path: bool = LEXICAL_FAST_PATH
+    lexical_max_terms: int = LEXICAL_FAST_PATH_MAX_TERMS
+    context_packer: Optional[ContextPacker] = None
+    _positions: Optional[Dict[str, int]] = PrivateAttr(default=None)
+
+    @property
+    def k(self) -> int:
+        return self.search_kwargs.get("k", 4)
+
+    @property
+    def candidate_k(self) -> int:
+        """Chunks fetched from the vector store per query: k, or more for the context packer."""
+        return self.context_packer.fetch_k if self.context_packer is not None else self.k
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.context_packer is not None:
+            self.prepare_packing()
+
+    def prepare_packing(self) -> None:
+        """Builds what pack() reads: the chunk id -> index position map and, for IVF, the direct map.
+
+        Runs when the retriever is created, before it serves concurrent queries, so pack()
+        only ever reads the index.
+        """
+        from faiss_index import make_reconstructable
+        make_reconstructable(self.vectorstore.index)
+        self._positions = {chunk_id: position for position, chunk_id in self.vectorstore.index_to_docstore_id.items()}
+
+    def pack(self, documents: List[Document], embedding: Optional[List[float]]) -> List[Document]:
+        """Applies the context packer to retrieved documents (no-op without one).
+
+        Their stored vectors are read back from the index, so MMR needs no extra embedding
+        calls. Pass embedding=None for lexical hits, which are only trimmed to the budget.
+        """
+        if self.context_packer is None:
+            return documents
+        vectors = None
+        if embedding is not None and documents:
+            from faiss_index import reconstruct_vectors
+            if self._positions is None:
+                raise ValueError("Context packer set after the retriever was created; call prepare_packing() first.")
+            vectors = reconstruct_vectors(self.vectorstore.index, [self._positions[doc.id] for doc in documents])
+        return self.context_packer.pack(documents, embedding, vectors)
+
+    def _route(self, query: str) -> str:
+        """Picks "vector", "hybrid", "lexical" or "lexical_fast_path" for query."""
+        if self.bm25_index is None:
+            if self.mode != "vector":
+                logger.warning(f"No BM25 index loaded; falling back to vector retrieval ({self.mode} mode).")
+            return "vector"
+        if self.mode != "lexical" and self.lexical_fast_path and is_keyword_query(query, self.lexical_max_terms):
+            return "lexical_fast_path"
+        return self.mode
+
+    def embeds_query(self, query: str) -> bool:
+        """Whether retrieving for query embeds it; the lexical routes do not (unless BM25 finds nothing)."""
+        return self._route(query) not in ("lexical", "lexical_fast_path")
+
+    def _lexical_search(self, query: str, k: int) -> List[Tuple[str, Document]]:
+        with stage("lexical"):
+            hits = self.bm25_index.search(query, k)
+            return [(chunk_id, self.vectorstore.docstore.search(chunk_id)) for chunk_id, _ in hits]
+
+    def _vector_search(self, embedding: List[float], k: int) -> List[Tuple[str, Document]]:
+        return self._vector_search_many([embedding], k)[0]
+
+    def _vector_search_many(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[str, Document]]]:
+        """One FAISS search for a whole matrix of query vectors; one hit list per row."""
+        vectorstore = self.vectorstore
+        with stage("search"):
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            if getattr(vectorstore, "_normalize_L2", False):
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            _, indices = vectorstore.index.search(vectors, k)
+            hits = []
+            for row in indices:
+                chunk_ids = [vectorstore.index_to_docstore_id[int(i)] for i in row if i != -1]
+                hits.append([(chunk_id, vectorstore.docstore.search(chunk_id)) for chunk_id in chunk_ids])
+            return hits
+
+    def _fuse(self, vector_hits: List[Tuple[str, Document]], lexical_hits: List[Tuple[str, Document]]) -> List[Document]:
+        documents = dict(lexical_hits)
+        documents.update(vector_hits)
+        ranking = reciprocal_rank_fusion(
+            [[chunk_id for chunk_id, _ in vector_hits], [chunk_id for chunk_id, _ in lexical_hits]], k=self.rrf_k
+        )
+        return [documents[chunk_id] for chunk_id in ranking[:self.candidate_k]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        route = self._route(query)
+        if route in ("lexical", "lexical_fast_path"):
+            hits = self._lexical_search(query, self.k)
+            if hits or route == "lexical":
+                RETRIEVALS.labels(route=route).inc()
+                return self.pack([doc for _, doc in hits], None)
+            route = "vector" # No keyword matched; let the embeddings find something close
+        RETRIEVALS.labels(route=route).inc()
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        if route == "vector":
+            documents = [doc for _, doc in self._vector_search(embedding, self.candidate_k)]
+        else:
+            documents = self._fuse(self._vector_search(embedding, self.fetch_k), self._lexical_search(query, self.fetch_k))
+        return self.pack(documents, embedding)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        route = self._route(query)
+        # The searches are CPU-bound; run_in_executor keeps the event loop free and copies the timing context
+        if route in ("lexical", "lexical_fast_path"):
+            hits = await run_in_executor(None, self._lexical_search, query, self.k)
+            if hits or route == "lexical":
+                RETRIEVALS.labels(route=route).inc()
+                return self.pack([doc for _, doc in hits], None)
+            route = "vector"
+        RETRIEVALS.labels(route=route).inc()
+        embedding = await self.vectorstore.embeddings.aembed_query(query)
+        if route == "vector":
+            documents = [doc for _, doc in await run_in_executor(None, self._vector_search, embedding, self.candidate_k)]
+        else:
+            vector_hits = await run_in_executor(None, self._vector_search, embedding, self.fetch_k)
+            lexical_hits = await run_in_executor(None, self._lexical_search, query, self.fetch_k)
+            documents = self._fuse(vector_hits, lexical_hits)
+        if self.context_packer is None:
+            return documents
+        return await run_in_executor(None, self.pack, documents, embedding)
+
+    async def abatch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """Retrieves for many queries, as ainvoke would for each, with one embeddings request and one FAISS search.
+
+        Every query takes its own route: lexical queries are never embedded, and the
+        queries that need the vector store are embedded and searched together.
+        """
+        routes = [self._route(query) for query in queries]
+        results: List[Optional[List[Document]]] = [None] * len(queries)
+        for i, query in enumerate(queries):
+            if routes[i] in ("lexical", "lexical_fast_path"):
+                hits = await run_in_executor(None, self._lexical_search, query, self.k)
+                if hits or routes[i] == "lexical":
+                    RETRIEVALS.labels(route=routes[i]).inc()
+                    results[i] = self.pack([doc for _, doc in hits], None)
+                else:
+                    routes[i] = "vector"
+        embedded = [i for i, documents in enumerate(results) if documents is None]
+        if not embedded:
+            return results
+        # embed_documents gives the same vectors as embed_query for OpenAI models, in one API call
+        embeddings = await self.vectorstore.embeddings.aembed_documents([queries[i] for i in embedded])
+        k = max(self.candidate_k if routes[i] == "vector" else self.fetch_k for i in embedded)
+        vector_hits = await run_in_executor(None, self._vector_search_many, embeddings, k)
+        for i, embedding, hits in zip(embedded, embeddings, vector_hits):
+            RETRIEVALS.labels(route=routes[i]).inc()
+            if routes[i] == "vector":
+                documents = [doc for _, doc in hits[:self.candidate_k]]
+            else:
+                lexical_hits = await run_in_executor(None, self._lexical_search, queries[i], self.fetch_k)
+                documents = self._fuse(hits[:self.fetch_k], lexical_hits)
+            results[i] = documents if self.context_packer is None else await run_in_executor(None, self.pack, documents, embedding)
+        return results
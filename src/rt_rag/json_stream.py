@@ -0,0 +1,91 @@
+# Incremental readers for large JSON arrays and JSON Lines files
+
+import json
+import logging
+from typing import Any, Iterator, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1 << 16 # Characters read per refill
+
+
+def iter_json_array(file_obj: TextIO, read_size: int = READ_SIZE) -> Iterator[Any]:
+    """Yields the items of a top-level JSON array one at a time.
+
+    Only the item being decoded (plus one read of `read_size` characters) is held in
+    memory, whatever the size of the file. Raises TypeError if the top-level value is not
+    an array (that value is decoded in full to name its type) and json.JSONDecodeError on
+    malformed input; items before the error have already been yielded.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def refill() -> bool:
+        nonlocal buffer, pos, eof
+        data = file_obj.read(read_size)
+        if not data:
+            eof = True
+            return False
+        buffer = buffer[pos:] + data
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        """Skips whitespace and returns the next character without consuming it ('' at EOF)."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not refill():
+                return ""
+
+    first = next_char()
+    if first != "[":
+        rest = buffer[pos:] + file_obj.read()
+        value = json.loads(rest) # Raises JSONDecodeError for empty or malformed files
+        raise TypeError(f"Expected a list of JSON objects, but got {type(value)}.")
+    pos += 1
+
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof or not refill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next read
+            if end == len(buffer) and not eof and refill():
+                continue
+            break
+        pos = end
+        yield item
+        delimiter = next_char()
+        if delimiter == ",":
+            pos += 1
+        elif delimiter == "]":
+            return
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+
+
+def iter_json_lines(file_obj: TextIO) -> Iterator[Tuple[int, Any]]:
+    """Yields (line number, value) for every non-blank line of a JSON Lines file.
+
+    Lines that are not valid JSON are logged and skipped, so one bad line does not cost
+    the rest of the file.
+    """
+    for line_number, line in enumerate(file_obj, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON on line {line_number} of {getattr(file_obj, 'name', 'input')}: {e}")
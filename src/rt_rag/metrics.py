@@ -0,0 +1,251 @@
+# Per-stage latency instrumentation and Prometheus metrics for the RAG Assistant
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Buckets from 5ms (cache hits, FAISS search) up to a minute (slow LLM calls, big files)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Time spent in one stage of answering or ingestion.", ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_duration_seconds", "End-to-end HTTP request latency.", ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter("rag_requests_total", "HTTP requests by endpoint and status code.", ["endpoint", "status"])
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "rag_time_to_first_token_seconds", "Time until the first streamed token.", buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTIONS = Counter("rag_admission_rejections_total", "Requests rejected by admission control.", ["reason"])
+FILE_PARSE_SECONDS = Histogram(
+    "rag_file_parse_seconds", "Time to parse one data file.", ["extension"], buckets=LATENCY_BUCKETS,
+)
+FILES_PARSED = Counter("rag_files_parsed_total", "Data files parsed, by outcome.", ["extension", "outcome"])
+DOCUMENTS_LOADED = Counter("rag_documents_loaded_total", "Documents produced by the file loaders.", ["extension"])
+CHUNKS_CREATED = Counter("rag_chunks_total", "Chunks produced by the text splitter.")
+EMBEDDED_TEXTS = Counter("rag_embedded_texts_total", "Texts passed to the embeddings model.", ["kind"])
+INGEST_THROUGHPUT = Gauge(
+    "rag_ingest_throughput", "Items per busy second of each ingestion pipeline stage in the last run.", ["stage"],
+    multiprocess_mode="mostrecent",
+)
+CONDENSE_DECISIONS = Counter(
+    "rag_condense_total", "Condense-question decisions for follow-ups (self_contained, cached, skipped_policy, rewritten).",
+    ["outcome"],
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens", "Tokens of retrieved chunks packed into one answer prompt.",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+)
+CONTEXT_CHUNKS = Histogram(
+    "rag_context_chunks", "Retrieved chunks packed into one answer prompt.", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20),
+)
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests_total", "/ask requests that ran the chain (leader) or shared an identical in-flight one (follower).",
+    ["role"],
+)
+DEDUP_CHUNKS = Counter("rag_dedup_chunks_total", "Chunks dropped before embedding as duplicates (exact, near).", ["kind"])
+REINDEXES = Counter("rag_reindexes_total", "Live index refreshes by outcome (swapped, unchanged, failed).", ["outcome"])
+RETRIEVALS = Counter("rag_retrievals_total", "Retriever calls by route (vector, hybrid, lexical, lexical_fast_path).", ["route"])
+
+# Stage timings of the request being handled; None outside of a timed request
+_current_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "rag_current_timings", default=None
+)
+# What context packing put into the prompt of the request being handled; None outside of a request
+_current_context: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "rag_current_context", default=None
+)
+
+
+def start_timings() -> Dict[str, float]:
+    """Starts collecting stage timings (seconds by stage) for the current request or task."""
+    timings: Dict[str, float] = {}
+    _current_timings.set(timings)
+    return timings
+
+
+def record_stage(stage_name: str, seconds: float) -> None:
+    """Observes a stage duration and adds it to the current request's timings, if any."""
+    STAGE_SECONDS.labels(stage=stage_name).observe(seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[stage_name] = timings.get(stage_name, 0.0) + seconds
+
+
+@contextmanager
+def stage(stage_name: str):
+    """Times the enclosed block as one stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, time.perf_counter() - start)
+
+
+def start_context_stats() -> Dict[str, int]:
+    """Starts collecting the packed context size (tokens, chunks) for the current request or task."""
+    stats: Dict[str, int] = {}
+    _current_context.set(stats)
+    return stats
+
+
+def record_context_packed(tokens: int, chunks: int) -> None:
+    """Observes one packed answer context and adds it to the current request's context stats, if any."""
+    CONTEXT_TOKENS.observe(tokens)
+    CONTEXT_CHUNKS.observe(chunks)
+    stats = _current_context.get()
+    if stats is not None:
+        stats["tokens"] = stats.get("tokens", 0) + tokens
+        stats["chunks"] = stats.get("chunks", 0) + chunks
+
+
+def record_dedup(kind: str, chunks: int) -> None:
+    """Records chunks dropped as duplicates; kind is "exact" or "near"."""
+    if chunks:
+        DEDUP_CHUNKS.labels(kind=kind).inc(chunks)
+
+
+def record_file_parsed(extension: str, seconds: Optional[float], documents: int, outcome: str) -> None:
+    """Records one parsed data file; outcome is "ok", "empty", "cached", "timeout" or "error"."""
+    FILES_PARSED.labels(extension=extension, outcome=outcome).inc()
+    if seconds is not None:
+        FILE_PARSE_SECONDS.labels(extension=extension).observe(seconds)
+    if documents:
+        DOCUMENTS_LOADED.labels(extension=extension).inc(documents)
+
+
+def record_chunks_created(count: int) -> None:
+    """Counts the chunks produced by one split run."""
+    CHUNKS_CREATED.inc(count)
+
+
+def record_ingest_throughput(stage_name: str, items_per_second: float) -> None:
+    """Publishes the throughput of one ingestion pipeline stage."""
+    INGEST_THROUGHPUT.labels(stage=stage_name).set(items_per_second)
+
+
+def timings_breakdown(timings: Dict[str, float], total_seconds: float) -> Dict[str, float]:
+    """Formats timings as milliseconds, with `search` derived and the `total` added.
+
+    Retrieval through a retriever is timed as a whole; the query embedding inside it is
+    timed separately, so the FAISS search (plus docstore lookup) is the difference. The
+    hybrid retriever times `search` (and `lexical`) itself.
+    """
+    breakdown = dict(timings)
+    if "retrieve" in breakdown and "search" not in breakdown and "lexical" not in breakdown:
+        breakdown["search"] = max(breakdown["retrieve"] - breakdown.get("embed_query", 0.0), 0.0)
+    breakdown["total"] = total_seconds
+    return {name: round(seconds * 1000, 1) for name, seconds in breakdown.items()}
+
+
+# Question generators of ConversationalRetrievalChain: the stock LLMChain or condense.CondenseQuestionChain
+CONDENSE_CHAIN_NAMES = ("LLMChain", "CondenseQuestionChain")
+
+
+class StageTimingHandler(BaseCallbackHandler):
+    """Callback handler that times the stages of a ConversationalRetrievalChain run.
+
+    The condensing LLMChain runs directly under the top-level chain, while the answer LLM
+    runs inside the combine-documents chain; LLM calls are attributed accordingly to
+    `condense` and `llm`. Retriever runs are timed as `retrieve`.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._starts: Dict[UUID, float] = {}
+        self._stages: Dict[UUID, str] = {}
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._names: Dict[UUID, str] = {}
+
+    def _top_level_child(self, run_id: UUID) -> Optional[UUID]:
+        """The ancestor of run_id that is a direct child of the root run."""
+        while self._parents.get(run_id) is not None and self._parents.get(self._parents[run_id]) is not None:
+            run_id = self._parents[run_id]
+        return run_id
+
+    def _start(self, stage_name: str, run_id: UUID) -> None:
+        self._stages[run_id] = stage_name
+        self._starts[run_id] = time.perf_counter()
+
+    def _end(self, run_id: UUID) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            record_stage(self._stages.pop(run_id), time.perf_counter() - start)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        self._names[run_id] = kwargs.get("name") or (serialized or {}).get("name", "")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs):
+        self.on_llm_start(serialized, [], run_id=run_id, parent_run_id=parent_run_id, **kwargs)
+
+    def on_llm_start(self, serialized, prompts: List[str], *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        branch = self._top_level_child(parent_run_id) if parent_run_id is not None else None
+        self._start("condense" if self._names.get(branch) in CONDENSE_CHAIN_NAMES else "llm", run_id)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs):
+        self._start("retrieve", run_id)
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """Wraps an Embeddings object to time its calls and count the embedded texts.
+
+    Query embeddings are recorded as the `embed_query` stage and document embeddings as
+    `embed_documents`. Other attributes (e.g. the embedding cache's stats()) are passed
+    through to the wrapped object.
+    """
+
+    def __init__(self, underlying_embeddings: Embeddings):
+        self.underlying_embeddings = underlying_embeddings
+
+    def __getattr__(self, name):
+        try:
+            underlying = self.__dict__["underlying_embeddings"]
+        except KeyError:
+            raise AttributeError(name) from None
+        return getattr(underlying, name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        EMBEDDED_TEXTS.labels(kind="documents").inc(len(texts))
+        with stage("embed_documents"):
+            return self.underlying_embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        EMBEDDED_TEXTS.labels(kind="query").inc()
+        with stage("embed_query"):
+            return self.underlying_embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        EMBEDDED_TEXTS.labels(kind="documents").inc(len(texts))
+        with stage("embed_documents"):
+            return await self.underlying_embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        EMBEDDED_TEXTS.labels(kind="query").inc()
+        with stage("embed_query"):
+            return await self.underlying_embeddings.aembed_query(text)
@@ -0,0 +1,136 @@
+# Disk-backed cache of the documents extracted from each data file
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+PARSE_CACHE_PATH = os.getenv("RAG_PARSE_CACHE_PATH", "cache/parsed.sqlite")
+
+
+def compute_file_sha256(file_path: str) -> str:
+    """Returns the sha256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode(documents: List[Document]) -> bytes:
+    # Metadata values that JSON cannot hold are stored as strings, which is also how
+    # chunk ids serialize them, so cached documents produce the same ids
+    payload = [[doc.page_content, doc.metadata] for doc in documents]
+    return zlib.compress(json.dumps(payload, default=str).encode("utf-8"))
+
+
+def _decode(blob: bytes) -> List[Document]:
+    return [Document(page_content=text, metadata=metadata) for text, metadata in json.loads(zlib.decompress(blob))]
+
+
+class ParsedDocumentCache:
+    """SQLite cache of the documents a loader extracted from each file.
+
+    There is one entry per file path. It is served while the file's sha256 and the
+    loader signature (loader classes and kwargs) are unchanged; the size and mtime
+    recorded with it let unchanged files skip re-hashing. Documents are stored as
+    zlib-compressed JSON. Entries of files that no longer exist are removed by
+    evict_deleted().
+    """
+
+    def __init__(self, path: str = PARSE_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parsed_files ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL,"
+            " loader TEXT NOT NULL, documents BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _lookup(self, file_path: str, loader: str, fetch: bool = True) -> Optional[bytes]:
+        """Returns the stored blob (b"" unless fetch) for file_path if its content and loader are unchanged."""
+        key = os.path.abspath(file_path)
+        documents_column = "documents" if fetch else "X''"
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT size, mtime_ns, sha256, loader, {documents_column} FROM parsed_files WHERE path = ?", (key,)
+            ).fetchone()
+        if row is None or row[3] != loader:
+            return None
+        size, mtime_ns, sha256, _, blob = row
+        stat = os.stat(file_path)
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            if stat.st_size != size or compute_file_sha256(file_path) != sha256:
+                return None
+            with self._lock: # Touched but identical: remember the new mtime
+                self._conn.execute("UPDATE parsed_files SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, key))
+                self._conn.commit()
+        return blob
+
+    def has(self, file_path: str, loader: str) -> bool:
+        """Whether get() would serve file_path (without decoding or counting it)."""
+        return self._lookup(file_path, loader, fetch=False) is not None
+
+    def get(self, file_path: str, loader: str) -> Optional[List[Document]]:
+        """Returns the cached documents for file_path if its content and loader are unchanged."""
+        blob = self._lookup(file_path, loader)
+        if blob is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _decode(blob)
+
+    def put(self, file_path: str, loader: str, documents: List[Document]) -> None:
+        """Stores the documents extracted from file_path, replacing any previous entry."""
+        stat = os.stat(file_path)
+        sha256 = compute_file_sha256(file_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed_files (path, size, mtime_ns, sha256, loader, documents, stored_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, sha256, loader, _encode(documents), time.time()),
+            )
+            self._conn.commit()
+
+    def evict_deleted(self) -> int:
+        """Removes the entries of files that no longer exist and returns how many there were."""
+        with self._lock:
+            paths = [path for (path,) in self._conn.execute("SELECT path FROM parsed_files")]
+            deleted = [(path,) for path in paths if not os.path.exists(path)]
+            if deleted:
+                self._conn.executemany("DELETE FROM parsed_files WHERE path = ?", deleted)
+                self._conn.commit()
+        if deleted:
+            logger.info(f"Parse cache evicted {len(deleted)} entries of deleted files.")
+        return len(deleted)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process plus the number of stored entries and their size."""
+        with self._lock:
+            entries, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(documents)), 0) FROM parsed_files"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "stored_bytes": stored_bytes,
+        }
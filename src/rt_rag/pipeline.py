@@ -0,0 +1,143 @@
+# Bounded producer/consumer helpers and throughput accounting for the ingestion pipeline
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, TypeVar
+
+from metrics import record_ingest_throughput
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    """Iterates `items` in a background thread, at most `maxsize` items ahead of the consumer.
+
+    The producer blocks while the queue is full, so a slow consumer (e.g. embedding
+    requests) bounds how much parsed data is held in memory. Exceptions raised by the
+    producer are re-raised in the consumer. Closing the returned generator early stops the
+    producer at its next item.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close() # Runs the producer's cleanup (e.g. shutting down a process pool)
+        put(_DONE)
+
+    producer = threading.Thread(target=produce, name="rag-ingest-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Groups items into lists of `size` (the last one may be shorter)."""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PipelineStats:
+    """Counts items and busy seconds per pipeline stage (thread-safe).
+
+    Stages run concurrently, so their seconds add up to more than the wall time; the
+    slowest stage by busy time is the bottleneck.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+
+    def add(self, stage_name: str, items: int, seconds: float = 0.0) -> None:
+        with self._lock:
+            self.items[stage_name] = self.items.get(stage_name, 0) + items
+            self.seconds[stage_name] = self.seconds.get(stage_name, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, stage_name: str, items: int):
+        """Times the enclosed block as `items` items of work for stage_name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage_name, items, time.perf_counter() - start)
+
+    def finish(self) -> None:
+        """Stops the wall clock and publishes the per-stage throughput gauges."""
+        self.wall_seconds = time.perf_counter() - self.started
+        for stage_name, per_sec in self.throughput().items():
+            if per_sec is not None:
+                record_ingest_throughput(stage_name, per_sec)
+
+    def throughput(self) -> Dict[str, float]:
+        """Items per busy second for each stage (None if the stage took no measurable time)."""
+        with self._lock:
+            return {
+                name: (self.items[name] / self.seconds[name] if self.seconds.get(name) else None)
+                for name in self.items
+            }
+
+    def summary(self) -> Dict[str, Dict]:
+        throughput = self.throughput()
+        with self._lock:
+            stages = {
+                name: {"items": self.items[name], "seconds": self.seconds.get(name, 0.0), "per_sec": throughput[name]}
+                for name in self.items
+            }
+        return {"wall_seconds": self.wall_seconds, "stages": stages}
+
+    def log(self) -> None:
+        parts = [
+            f"{name} {info['items']} in {info['seconds']:.2f}s"
+            + (f" ({info['per_sec']:.1f}/s)" if info["per_sec"] is not None else "")
+            for name, info in self.summary()["stages"].items()
+        ]
+        logger.info(f"Ingestion pipeline finished in {self.wall_seconds:.2f}s: " + ", ".join(parts) + ".")
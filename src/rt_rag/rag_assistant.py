@@ -4,55 +4,41 @@ import sys
 import os
 import logging
 import json # Import the json module
+import pickle
 import shutil # Added for rmtree
+import hashlib # For content hashes in the index manifest
+import argparse
+import time
+import multiprocessing
+import asyncio
+import contextlib
+import functools
+import glob
+import itertools
+from collections import deque
 
-os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
-
-# Print PATH for debugging Poppler/Tesseract issues
-logger = logging.getLogger(__name__) # Ensure logger is available early
-# Basic config for early logging if not already set up by setup_logging
-if not logging.getLogger().hasHandlers():
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
+import numpy as np
+from dotenv import load_dotenv
+from filelock import FileLock
+from langchain_core.documents import Document
 
-path_env_var = os.environ.get('PATH', 'PATH environment variable not found.')
-# Split the PATH for better readability in logs, especially if it's very long
-path_directories = path_env_var.split(os.pathsep)
+from bm25_index import BM25Index
+from dedup import ChunkDeduplicator, get_dedup_params
+from embedding_cache import CachedEmbeddings
+from metrics import InstrumentedEmbeddings, record_chunks_created, record_dedup, record_file_parsed, record_stage, stage
+from json_stream import iter_json_array, iter_json_lines
+from parse_cache import PARSE_CACHE_PATH, ParsedDocumentCache, compute_file_sha256
+from pipeline import PipelineStats, batched, prefetch
+from session_store import InMemorySessionStore
 
-# Log the PATH. Using logger if available, otherwise print.
-try:
-    logger.info("Python script sees the following PATH components:")
-    for i, p_dir in enumerate(path_directories):
-        logger.info(f"  PATH[{i}]: {p_dir}")
-    if not any("poppler" in p.lower() for p in path_directories):
-        logger.warning("Poppler's directory does NOT seem to be in the Python script's PATH!")
-    if not any("tesseract" in p.lower() for p in path_directories):
-        logger.warning("Tesseract's directory does NOT seem to be in the Python script's PATH!")
-except NameError: # Fallback if logger isn't fully set up this early
-    print("Python script sees the following PATH components:")
-    for i, p_dir in enumerate(path_directories):
-        print(f"  PATH[{i}]: {p_dir}")
-    if not any("poppler" in p.lower() for p in path_directories):
-        print("WARNING: Poppler's directory does NOT seem to be in the Python script's PATH!")
-    if not any("tesseract" in p.lower() for p in path_directories):
-        print("WARNING: Tesseract's directory does NOT seem to be in the Python script's PATH!")
+# Importing this module has no side effects and stays cheap: the langchain integrations
+# (OpenAI, document loaders, the FAISS vector store, chains), faiss itself and the
+# retriever are imported inside the functions that use them. Entry points (main() and
+# api_main) load .env and set up logging.
+if __name__ == "__main__":
+    load_dotenv() # Before the settings below are read from the environment
 
-from dotenv import load_dotenv
-from langchain_community.document_loaders import (
-    DirectoryLoader, 
-    PyPDFLoader, 
-    TextLoader, 
-    UnstructuredPDFLoader
-)
-from langchain.docstore.document import Document # Ensure Document is imported
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
-
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # --- Logging Setup ---
 LOG_FILE = "rag_assistant.log"
@@ -73,106 +59,439 @@ def setup_logging():
         ]
     )
 
-setup_logging() 
-
-logger = logging.getLogger(__name__)
+def log_path_diagnostics():
+    """Logs the PATH this process sees and warns if Poppler or Tesseract (used for PDFs) are missing from it."""
+    path_directories = os.environ.get('PATH', '').split(os.pathsep)
+    logger.debug("Python script sees the following PATH components:")
+    for i, p_dir in enumerate(path_directories):
+        logger.debug(f"  PATH[{i}]: {p_dir}")
+    if not any("poppler" in p.lower() for p in path_directories):
+        logger.warning("Poppler's directory does NOT seem to be in the Python script's PATH!")
+    if not any("tesseract" in p.lower() for p in path_directories):
+        logger.warning("Tesseract's directory does NOT seem to be in the Python script's PATH!")
 # --- End Logging Setup ---
 
 # --- Constants ---
 DATA_PATH = "data/"
 VECTORSTORE_PATH = "vectorstore/"
+MANIFEST_FILE = "manifest.json" # Stored inside VECTORSTORE_PATH, next to the FAISS index
+MANIFEST_VERSION = 2
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".json", ".jsonl")
+STREAMED_EXTENSIONS = (".json", ".jsonl") # Parsed record by record instead of all at once
+STREAM_RECORDS_PER_BATCH = int(os.getenv("RAG_STREAM_RECORDS_PER_BATCH", "1000")) # Records split and queued together
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+RETRIEVER_K = 3
+BATCH_MAX_CONCURRENCY = int(os.getenv("RAG_BATCH_MAX_CONCURRENCY", "8")) # Parallel LLM calls per batch
+# Document parsing: RAG_PARSE_WORKERS > 1 parses files in a process pool (0 = one per CPU core)
+PARSE_WORKERS = int(os.getenv("RAG_PARSE_WORKERS", "1"))
+PARSE_TIMEOUT = float(os.getenv("RAG_PARSE_TIMEOUT", "300")) # Seconds per file, process pool only
+# Seconds a process waits for another one to finish building or publishing the index
+INDEX_LOCK_TIMEOUT = float(os.getenv("RAG_INDEX_LOCK_TIMEOUT", "3600"))
+# Ingestion pipeline: chunks per embeddings call, and parsed files buffered ahead of embedding
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+INGEST_QUEUE_SIZE = int(os.getenv("RAG_INGEST_QUEUE_SIZE", "4"))
 
-def load_documents():
-    """Loads documents from the data directory, supporting PDF, TXT, and JSON files."""
-    all_documents = []
-    
-    # Supported file types and their loaders
-    file_handlers = {
-        ".pdf": {
-            "loader_primary": UnstructuredPDFLoader,
-            "loader_fallback": PyPDFLoader,
-            "primary_kwargs": {"mode": "single", "strategy": "auto"},
-            "fallback_kwargs": {},
-            "log_msg_primary": "Loading {file} using UnstructuredPDFLoader...",
-            "log_msg_fallback": "Attempting to load {file} with PyPDFLoader as a fallback..."
-        },
-        ".txt": {
-            "loader_primary": TextLoader,
-            "primary_kwargs": {"encoding": 'utf-8'},
-            "log_msg_primary": "Loading {file} using TextLoader..."
-        }
+def env_flag(name, default=False):
+    """Reads a boolean flag such as RAG_FULL_REBUILD=1 from the environment."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Supported file types and their loaders. Loaders are named by their class in
+# langchain_community.document_loaders and imported when the first file is parsed.
+FILE_HANDLERS = {
+    ".pdf": {
+        "loader_primary": "UnstructuredPDFLoader",
+        "loader_fallback": "PyPDFLoader",
+        "primary_kwargs": {"mode": "single", "strategy": "auto"},
+        "fallback_kwargs": {},
+        "log_msg_primary": "Loading {file} using UnstructuredPDFLoader...",
+        "log_msg_fallback": "Attempting to load {file} with PyPDFLoader as a fallback..."
+    },
+    ".txt": {
+        "loader_primary": "TextLoader",
+        "primary_kwargs": {"encoding": 'utf-8'},
+        "log_msg_primary": "Loading {file} using TextLoader..."
     }
+}
 
-    if not os.path.exists(DATA_PATH):
-        os.makedirs(DATA_PATH)
-        logger.info(f"Created data directory: {DATA_PATH}")
+def _publication_document(record, index, filename):
+    """Builds the Document for one record of a JSON publication list."""
+    content = record.get("publication_description", "") # Use 'publication_description'
+    if not content:
+        logger.warning(f"Record {index} in {filename} has no 'publication_description' or it's empty.")
 
-    for filename in os.listdir(DATA_PATH):
-        file_ext = os.path.splitext(filename)[1].lower()
-        file_path = os.path.join(DATA_PATH, filename)
+    metadata = {
+        "source": filename, # Keep original filename as source
+        "title": record.get("title"),
+        "authors": record.get("authors"),
+        "year": record.get("year"),
+        # Add other fields from 'record' as needed, e.g., record_index
+        "record_index": index
+    }
+    # Filter out None values from metadata for cleaner logs/usage
+    metadata = {k: v for k, v in metadata.items() if v is not None}
+    return Document(page_content=content, metadata=metadata)
+
+def iter_json_documents(file_path):
+    """Yields one Document per record of a JSON publication list (.json) or JSON Lines file (.jsonl).
 
-        if file_ext in file_handlers:
-            handler_config = file_handlers[file_ext]
-            logger.info(handler_config["log_msg_primary"].format(file=filename))
+    Records are decoded one at a time (see json_stream), so memory does not grow with the
+    file size. On a decoding error the records before it have already been yielded.
+    """
+    filename = os.path.basename(file_path)
+    logger.info(f"Loading {filename} using custom JSON processing...")
+    count = 0
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            if filename.lower().endswith(".jsonl"):
+                for line_number, record in iter_json_lines(f):
+                    if not isinstance(record, dict):
+                        logger.warning(f"Skipping line {line_number} in {filename}: expected a JSON object, but got {type(record)}.")
+                        continue
+                    yield _publication_document(record, count, filename)
+                    count += 1
+            else:
+                for record in iter_json_array(f):
+                    yield _publication_document(record, count, filename)
+                    count += 1
+        logger.info(f"Successfully processed {filename} ({count} records).")
+    except TypeError as e_type:
+        logger.warning(f"Skipping {filename}: {e_type}")
+    except json.JSONDecodeError as e_json_decode:
+        logger.error(f"Error decoding JSON from {filename}: {e_json_decode}")
+    except Exception as e_custom_json:
+        logger.error(f"Error processing {filename} with custom JSON handler: {e_custom_json}")
+
+def load_json_file(file_path):
+    """Builds one Document per record of a JSON publication list or JSON Lines file."""
+    return list(iter_json_documents(file_path))
+
+class StreamedDocuments:
+    """Lazily iterates the documents of a JSON/JSON Lines file.
+
+    Only the time spent parsing (not the consumer's time between records) is counted in
+    `seconds`; the file is recorded in the parse metrics once fully consumed.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.seconds = 0.0
+        self.count = 0
+
+    def __iter__(self):
+        documents = iter_json_documents(self.file_path)
+        while True:
+            start = time.perf_counter()
             try:
-                loader_class = handler_config["loader_primary"]
-                loader = loader_class(file_path, **handler_config["primary_kwargs"])
-                documents = loader.load()
-                logger.info(f"Successfully loaded {filename} ({len(documents)} docs).")
-                all_documents.extend(documents)
-            except Exception as e_primary:
-                logger.error(f"Error loading {filename} with {loader_class.__name__}: {e_primary}")
-                if "loader_fallback" in handler_config:
-                    logger.info(handler_config["log_msg_fallback"].format(file=filename))
-                    try:
-                        fallback_loader_class = handler_config["loader_fallback"]
-                        loader_fallback = fallback_loader_class(file_path, **handler_config.get("fallback_kwargs", {}))
-                        documents = loader_fallback.load()
-                        logger.info(f"Successfully loaded {filename} with {fallback_loader_class.__name__} ({len(documents)} docs).")
-                        all_documents.extend(documents)
-                    except Exception as e_fallback:
-                        logger.error(f"Error loading {filename} with {fallback_loader_class.__name__} as fallback: {e_fallback}")
-        elif file_ext == ".json": # Custom handling for JSON files
-            logger.info(f"Loading {filename} using custom JSON processing...")
+                document = next(documents)
+            except StopIteration:
+                break
+            finally:
+                self.seconds += time.perf_counter() - start
+            self.count += 1
+            yield document
+        record_file_parsed(os.path.splitext(self.file_path)[1].lower(), self.seconds, self.count, "ok" if self.count else "empty")
+
+def get_loader_class(loader):
+    """Resolves a FILE_HANDLERS loader (a class, or a class name in langchain_community.document_loaders)."""
+    if isinstance(loader, str):
+        from langchain_community import document_loaders
+        return getattr(document_loaders, loader)
+    return loader
+
+def load_file(file_path, file_handlers=None):
+    """Loads a single file with its primary loader, falling back to the secondary loader on failure.
+
+    Returns a (possibly empty) list of documents. `file_handlers` defaults to FILE_HANDLERS;
+    parse workers receive the parent's copy, since they do not share its globals.
+    """
+    file_handlers = FILE_HANDLERS if file_handlers is None else file_handlers
+    filename = os.path.basename(file_path)
+    file_ext = os.path.splitext(filename)[1].lower()
+
+    if file_ext in STREAMED_EXTENSIONS: # Custom handling for JSON files
+        return load_json_file(file_path)
+    if file_ext not in file_handlers:
+        logger.info(f"Skipping unsupported file type: {filename}")
+        return []
+
+    handler_config = file_handlers[file_ext]
+    logger.info(handler_config["log_msg_primary"].format(file=filename))
+    loader_class = get_loader_class(handler_config["loader_primary"])
+    try:
+        loader = loader_class(file_path, **handler_config["primary_kwargs"])
+        documents = loader.load()
+        logger.info(f"Successfully loaded {filename} ({len(documents)} docs).")
+        return documents
+    except Exception as e_primary:
+        logger.error(f"Error loading {filename} with {loader_class.__name__}: {e_primary}")
+        if "loader_fallback" in handler_config:
+            logger.info(handler_config["log_msg_fallback"].format(file=filename))
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                if isinstance(data, list): # Expecting a list of records
-                    for i, record in enumerate(data):
-                        content = record.get("publication_description", "") # Use 'publication_description'
-                        if not content:
-                            logger.warning(f"Record {i} in {filename} has no 'publication_description' or it's empty.")
-                        
-                        metadata = {
-                            "source": filename, # Keep original filename as source
-                            "title": record.get("title"),
-                            "authors": record.get("authors"),
-                            "year": record.get("year"),
-                            # Add other fields from 'record' as needed, e.g., record_index
-                            "record_index": i 
-                        }
-                        # Filter out None values from metadata for cleaner logs/usage
-                        metadata = {k: v for k, v in metadata.items() if v is not None}
-                        
-                        doc = Document(page_content=content, metadata=metadata)
-                        all_documents.append(doc)
-                    logger.info(f"Successfully processed {filename} ({len(data)} records).")
+                fallback_loader_class = get_loader_class(handler_config["loader_fallback"])
+                loader_fallback = fallback_loader_class(file_path, **handler_config.get("fallback_kwargs", {}))
+                documents = loader_fallback.load()
+                logger.info(f"Successfully loaded {filename} with {fallback_loader_class.__name__} ({len(documents)} docs).")
+                return documents
+            except Exception as e_fallback:
+                logger.error(f"Error loading {filename} with {fallback_loader_class.__name__} as fallback: {e_fallback}")
+    return []
+
+def _load_file_timed(file_path, file_handlers=None):
+    """Runs load_file and returns (documents, parse seconds, outcome)."""
+    start = time.perf_counter()
+    documents = load_file(file_path) if file_handlers is None else load_file(file_path, file_handlers)
+    return documents, time.perf_counter() - start, "ok" if documents else "empty"
+
+def get_parse_context():
+    """Start method for parse workers: forkserver where available, else spawn.
+
+    Never fork: workers start from the ingest prefetch thread and after every timeout,
+    while other threads may hold the logging, parse-cache or queue locks a forked child
+    would inherit in their held state.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # The server imports this module once, so a replacement worker starts without re-importing it
+    context.set_forkserver_preload([__name__])
+    return context
+
+def _parse_worker_main(conn, file_handlers, log_level):
+    """Worker process loop: parses each file path received on conn and sends back the result.
+
+    The loader classes are imported first and "ready" is sent once they are, so that
+    import time does not count against the first file's timeout.
+    """
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s")
+    for handler_config in file_handlers.values():
+        for key in ("loader_primary", "loader_fallback"):
+            try:
+                if key in handler_config:
+                    get_loader_class(handler_config[key])
+            except Exception as e: # load_file reports it again for the files that need this loader
+                logger.warning(f"Could not import {handler_config[key]}: {e}")
+    conn.send(("ready", None))
+    while True:
+        try:
+            file_path = conn.recv()
+        except EOFError: # The parent went away
+            return
+        if file_path is None:
+            return
+        try:
+            conn.send(("ok", _load_file_timed(file_path, file_handlers)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+class _ParseWorker:
+    """One parse process with its own pipe, so a stuck file can be killed without touching the others."""
+
+    def __init__(self, context, file_handlers):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_parse_worker_main, args=(child_conn, file_handlers, logger.getEffectiveLevel()), daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False # Until the worker has imported the loaders
+        self.position = None # Index of the file being parsed, None when idle
+        self.deadline = None
+
+    def submit(self, position, file_path, timeout):
+        self.conn.send(file_path)
+        self.position, self.deadline = position, time.monotonic() + timeout
+
+    def stop(self, kill=False):
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                kill = True
+        if kill:
+            self.process.terminate()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+def _iter_files_in_pool(file_paths, workers, timeout):
+    """Parses files in worker processes, yielding (documents, seconds, outcome) per file in input order.
+
+    At most 2 * workers files are parsed or buffered ahead of the one being yielded, so
+    parsed documents do not pile up when the consumer is slower than the workers. Each
+    file's `timeout` starts when a worker picks it up. A file that exceeds it is logged
+    and skipped, and its worker is terminated and replaced right away, so stuck loaders
+    (e.g. OCR jobs) never hold up the files behind them.
+    """
+    from multiprocessing.connection import wait
+    context = get_parse_context()
+    new_worker = functools.partial(_ParseWorker, context, FILE_HANDLERS)
+    pool = [new_worker() for _ in range(min(workers, len(file_paths)))]
+    results = {}
+    next_submit = next_yield = 0
+    try:
+        while next_yield < len(file_paths):
+            for worker in pool:
+                if worker.ready and worker.position is None and next_submit < min(len(file_paths), next_yield + 2 * workers):
+                    worker.submit(next_submit, file_paths[next_submit], timeout)
+                    next_submit += 1
+            if next_yield in results:
+                yield results.pop(next_yield)
+                next_yield += 1
+                continue
+
+            deadlines = [worker.deadline for worker in pool if worker.position is not None]
+            ready = wait([worker.conn for worker in pool if not worker.ready or worker.position is not None],
+                         timeout=max(0.0, min(deadlines) - time.monotonic()) if deadlines else None)
+            for i, worker in enumerate(pool):
+                position, replace = worker.position, False
+                if worker.conn in ready:
+                    try:
+                        status, payload = worker.conn.recv()
+                    except (EOFError, OSError): # The worker died (e.g. a crash in a native parser)
+                        status, payload, replace = "error", f"worker exited with code {worker.process.exitcode}", True
+                    if status == "ready":
+                        worker.ready = True
+                        continue
+                    if position is None:
+                        logger.error(f"Parse worker failed to start: {payload}")
+                    elif status == "ok":
+                        results[position] = payload
+                    else:
+                        logger.error(f"Worker failed loading {os.path.basename(file_paths[position])}: {payload}")
+                        results[position] = ([], None, "error")
+                elif position is not None and time.monotonic() >= worker.deadline:
+                    logger.error(f"Timed out after {timeout:.0f}s loading {os.path.basename(file_paths[position])}; skipping it.")
+                    results[position] = ([], timeout, "timeout")
+                    replace = True
                 else:
-                    logger.warning(f"Skipping {filename}: Expected a list of JSON objects, but got {type(data)}.")
-            except json.JSONDecodeError as e_json_decode:
-                logger.error(f"Error decoding JSON from {filename}: {e_json_decode}")
-            except Exception as e_custom_json:
-                logger.error(f"Error processing {filename} with custom JSON handler: {e_custom_json}")
-        else:
-            logger.info(f"Skipping unsupported file type: {filename}")
+                    continue
+                worker.position = worker.deadline = None
+                if replace:
+                    worker.stop(kill=True)
+                    pool[i] = new_worker()
+    finally:
+        for worker in pool:
+            # Workers still parsing belong to a consumer that stopped early
+            worker.stop(kill=worker.position is not None)
+
+def list_data_files():
+    """Returns the paths of all files in DATA_PATH in sorted order, creating the directory if needed."""
+    if not os.path.exists(DATA_PATH):
+        os.makedirs(DATA_PATH)
+        logger.info(f"Created data directory: {DATA_PATH}")
+    return [os.path.join(DATA_PATH, filename) for filename in sorted(os.listdir(DATA_PATH))]
+
+def iter_loaded_files(file_paths, workers=None, timeout=None):
+    """Parses files and yields (file_path, documents, parse seconds) one file at a time, in input order.
+
+    Files whose extracted documents are in the parse cache (see get_parse_cache) are
+    served from it; newly parsed files are added to it. JSON and JSON Lines files are not
+    parsed up front: their documents are a StreamedDocuments iterable read record by
+    record (seconds is None; see its `seconds`). With more than one worker
+    (RAG_PARSE_WORKERS) the remaining files are parsed in a process pool with a per-file
+    timeout (RAG_PARSE_TIMEOUT); the order stays the same as a serial run.
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    timeout = PARSE_TIMEOUT if timeout is None else timeout
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    cache = get_parse_cache()
+    signatures = {path: get_loader_signature(os.path.splitext(path)[1].lower()) for path in file_paths}
+    pooled_paths = [path for path in file_paths if os.path.splitext(path)[1].lower() not in STREAMED_EXTENSIONS]
+    cached_paths = set()
+    if cache is not None:
+        cache.evict_deleted()
+        cached_paths = {path for path in pooled_paths if signatures[path] and cache.has(path, signatures[path])}
+    parse_paths = [path for path in pooled_paths if path not in cached_paths]
+
+    if workers > 1 and len(parse_paths) > 1:
+        logger.info(f"Parsing {len(parse_paths)} files with {workers} worker processes (timeout {timeout:.0f}s per file)...")
+        results = _iter_files_in_pool(parse_paths, workers, timeout)
+    else:
+        results = (_load_file_timed(file_path) for file_path in parse_paths)
+    try:
+        for file_path in file_paths:
+            file_ext = os.path.splitext(file_path)[1].lower()
+            if file_ext in STREAMED_EXTENSIONS:
+                yield file_path, StreamedDocuments(file_path), None
+                continue
+            documents = cache.get(file_path, signatures[file_path]) if file_path in cached_paths else None
+            if documents is not None:
+                record_file_parsed(file_ext, None, len(documents), "cached")
+                yield file_path, documents, 0.0
+                continue
+            if file_path in cached_paths: # Changed since the lookup above
+                documents, seconds, outcome = _load_file_timed(file_path)
+            else:
+                documents, seconds, outcome = next(results)
+            record_file_parsed(file_ext, seconds, len(documents), outcome)
+            if cache is not None and outcome == "ok" and signatures[file_path]:
+                cache.put(file_path, signatures[file_path], documents)
+            yield file_path, documents, seconds
+    finally:
+        results.close()
+    if cache is not None and pooled_paths:
+        stats = cache.stats()
+        logger.info(
+            f"Parse cache: {len(cached_paths)} of {len(pooled_paths)} files served from cache "
+            f"({stats['entries']} entries, {stats['stored_bytes'] / 1e6:.1f} MB stored)."
+        )
+
+
+def get_loader_signature(file_ext):
+    """Identifies the loaders and kwargs used for a file type (None if it has no loader).
+
+    Cached documents are only served for the same signature, so changing e.g. the PDF
+    strategy re-parses the PDFs.
+    """
+    handler = FILE_HANDLERS.get(file_ext)
+    if handler is None:
+        return None
+    return json.dumps(
+        {key: getattr(value, "__qualname__", value) for key, value in handler.items() if not key.startswith("log_msg")},
+        sort_keys=True,
+        default=str,
+    )
+
+_parse_cache = None
+
+def get_parse_cache():
+    """The parsed-document cache at PARSE_CACHE_PATH, or None if RAG_PARSE_CACHE=0."""
+    global _parse_cache
+    if not env_flag("RAG_PARSE_CACHE", default=True):
+        return None
+    if _parse_cache is None or _parse_cache.path != PARSE_CACHE_PATH:
+        _parse_cache = ParsedDocumentCache(PARSE_CACHE_PATH)
+    return _parse_cache
+
+def _create_sample_document():
+    """Leaves a sample file in an empty DATA_PATH, telling the user to add their own."""
+    with open(os.path.join(DATA_PATH, "sample_document.txt"), "w") as f:
+        f.write("This is a sample document. Replace it with your own data or add supported file types.")
+    logger.info(f"A sample document 'sample_document.txt' has been created in {DATA_PATH}. Please add actual documents and restart.")
+    print(f"No processable documents found in {DATA_PATH}. A sample_document.txt has been created. Please add your documents and restart.")
+
+def load_documents(workers=None, timeout=None):
+    """Loads documents from the data directory, supporting PDF, TXT, and JSON files.
+
+    Files are processed in sorted order (see iter_loaded_files for parallel parsing). This
+    holds every document in memory; ingestion streams files instead (see ingest_documents).
+    """
+    all_documents = []
+    for _, documents, _ in iter_loaded_files(list_data_files(), workers=workers, timeout=timeout):
+        all_documents.extend(documents)
 
     if not all_documents:
         logger.warning(f"No processable documents found in {DATA_PATH}. Cannot proceed without data.")
         # Create a sample file only if the directory was truly empty of processable files
-        with open(os.path.join(DATA_PATH, "sample_document.txt"), "w") as f:
-            f.write("This is a sample document. Replace it with your own data or add supported file types.")
-        logger.info(f"A sample document 'sample_document.txt' has been created in {DATA_PATH}. Please add actual documents and restart.")
-        print(f"No processable documents found in {DATA_PATH}. A sample_document.txt has been created. Please add your documents and restart.")
+        _create_sample_document()
         return all_documents # Return empty list
 
     logger.info(f"Total documents loaded: {len(all_documents)}")
@@ -197,12 +516,6 @@ def get_text_chunks(documents):
         if i == 0 and not content_snippet:
             logger.warning("The first document page appears empty. This might indicate a problem with PDF text extraction (e.g., image-based PDF or complex encoding).")
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-
     docs_with_content = [doc for doc in documents if doc.page_content and doc.page_content.strip()]
 
     if not docs_with_content:
@@ -210,92 +523,971 @@ def get_text_chunks(documents):
         return []
         
     logger.info(f"Splitting {len(docs_with_content)} documents with actual content into chunks...")
-    chunks = text_splitter.split_documents(docs_with_content)
+    chunks = split_documents(docs_with_content)
     logger.info(f"Created {len(chunks)} text chunks.")
     return chunks
 
-def get_vector_store(text_chunks, embeddings):
-    """Creates a FAISS vector store, always rebuilding it."""
-    # Always rebuild the vector store to ensure it reflects current documents
-    logger.info(f"Attempting to remove existing vector store at {VECTORSTORE_PATH} if it exists...")
-    if os.path.exists(VECTORSTORE_PATH):
-        try:
-            shutil.rmtree(VECTORSTORE_PATH) # Remove the directory and its contents
-            logger.info(f"Successfully removed existing vector store directory: {VECTORSTORE_PATH}")
-        except OSError as e:
-            logger.error(f"Error removing directory {VECTORSTORE_PATH}: {e.strerror} - proceeding to create new.")
-            # If removal fails, FAISS might still overwrite or handle it, or fail later.
-            # For robustness, one might want to ensure the path is clear or use a new path.
-
-    logger.info("Creating new vector store...")
-    vectorstore = FAISS.from_documents(text_chunks, embeddings)
-    os.makedirs(VECTORSTORE_PATH, exist_ok=True) # Ensure directory exists
-    vectorstore.save_local(VECTORSTORE_PATH)
-    logger.info(f"Vector store created and saved to {VECTORSTORE_PATH}")
-    return vectorstore
+def split_documents(documents):
+    """Splits the documents that have text into chunks (without get_text_chunks' logging)."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=len
+    )
+    chunks = text_splitter.split_documents(
+        [doc for doc in documents if doc.page_content and doc.page_content.strip()]
+    )
+    record_chunks_created(len(chunks))
+    return chunks
 
-def initialize_rag_chain():
-    """Initializes all components of the RAG chain and returns the chain."""
-    logger.info("Initializing RAG assistant components...")
-    if not os.getenv("OPENAI_API_KEY"):
-        logger.error("OPENAI_API_KEY not found. Please set it in the .env file.")
-        print("Error: OPENAI_API_KEY not found. Please create a .env file with your key.")
+def iter_file_chunks(filenames=None, stats=None, workers=None, timeout=None):
+    """Parses and splits the files in DATA_PATH one at a time, yielding (filename, chunks, chunk_ids).
+
+    `filenames` restricts it to those files. Only one file's documents are held at a
+    time, and a large JSON/JSON Lines file is yielded in several parts. Parse and split throughput go to `stats` (a PipelineStats) if given.
+    """
+    file_paths = list_data_files()
+    if filenames is not None:
+        wanted = set(filenames)
+        file_paths = [file_path for file_path in file_paths if os.path.basename(file_path) in wanted]
+    for file_path, documents, seconds in iter_loaded_files(file_paths, workers=workers, timeout=timeout):
+        filename = os.path.basename(file_path)
+        # Streamed files are split and queued STREAM_RECORDS_PER_BATCH records at a time
+        groups = batched(documents, STREAM_RECORDS_PER_BATCH) if isinstance(documents, StreamedDocuments) else [documents]
+        seen_ids = {}
+        for group in groups:
+            start = time.perf_counter()
+            chunks = split_documents(group)
+            chunk_ids = compute_chunk_ids(chunks, seen=seen_ids)
+            if stats is not None:
+                stats.add("split", len(chunks), time.perf_counter() - start)
+            yield filename, chunks, chunk_ids
+        if stats is not None:
+            stats.add("parse", 1, documents.seconds if isinstance(documents, StreamedDocuments) else seconds or 0.0)
+
+def scan_data_files(previous=None):
+    """Returns {filename: {"sha256", "size", "mtime_ns"}} for every supported file in DATA_PATH.
+
+    If `previous` (the "files" section of a manifest) lists a file with the same size and
+    mtime, its recorded hash is reused instead of re-reading the file.
+    """
+    previous = previous or {}
+    files = {}
+    if not os.path.isdir(DATA_PATH):
+        return files
+    for filename in sorted(os.listdir(DATA_PATH)):
+        file_path = os.path.join(DATA_PATH, filename)
+        if not os.path.isfile(file_path) or os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        stat = os.stat(file_path)
+        known = previous.get(filename) or {}
+        if known.get("sha256") and known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+            sha256 = known["sha256"]
+        else:
+            sha256 = compute_file_sha256(file_path)
+        files[filename] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return files
+
+def get_data_fingerprint(files):
+    """Reduces a scan_data_files()/manifest "files" mapping to {filename: sha256}."""
+    return {name: info.get("sha256") for name, info in files.items()}
+
+def get_chunk_source_file(chunk):
+    """Maps a chunk back to its file in DATA_PATH (loaders store either the path or the bare filename)."""
+    return os.path.basename(str(chunk.metadata.get("source", "")))
+
+def compute_chunk_ids(text_chunks, seen=None):
+    """Derives a stable id for each chunk from its source file, text and metadata.
+
+    The ids double as the per-chunk content hashes in the manifest and as the FAISS
+    docstore ids, so an unchanged chunk keeps the same id across runs. Pass the same
+    `seen` dict when computing the ids of one file in several parts.
+    """
+    chunk_ids = []
+    seen = {} if seen is None else seen
+    for chunk in text_chunks:
+        payload = json.dumps(
+            {
+                "source": get_chunk_source_file(chunk),
+                "content": chunk.page_content,
+                "metadata": chunk.metadata,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        chunk_id = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        # Identical chunks (e.g. a repeated page) still need distinct docstore ids
+        occurrence = seen.get(chunk_id, 0)
+        seen[chunk_id] = occurrence + 1
+        chunk_ids.append(chunk_id if occurrence == 0 else f"{chunk_id}-{occurrence}")
+    return chunk_ids
+
+def iter_embedding_layers(embeddings):
+    """Yields an embeddings object and every object it wraps (cache, instrumentation), outermost first."""
+    while embeddings is not None:
+        yield embeddings
+        embeddings = embeddings.__dict__.get("underlying_embeddings")
+
+def get_index_config(embeddings):
+    """Settings that invalidate every stored vector when they change."""
+    from chunk_store import get_docstore_backend
+    from faiss_index import get_index_params
+    # The cache and metrics wrappers do not change the vectors, so describe the innermost model
+    *_, embeddings = iter_embedding_layers(embeddings)
+    config = {
+        "embedding_class": type(embeddings).__name__,
+        "embedding_model": getattr(embeddings, "model", None),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "index": get_index_params(),
+    }
+    dedup_params = get_dedup_params()
+    if dedup_params is not None: # Absent when off, so indexes built without dedup stay valid
+        config["dedup"] = dedup_params
+    if get_docstore_backend() != "memory": # Likewise; switching backends rewrites the store
+        config["docstore"] = get_docstore_backend()
+    return config
+
+def load_manifest():
+    """Loads the index manifest stored next to the FAISS index, or None if missing/unreadable."""
+    manifest_path = os.path.join(VECTORSTORE_PATH, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
         return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not read index manifest {manifest_path}: {e}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        logger.info(f"Index manifest version {manifest.get('version')} is outdated (expected {MANIFEST_VERSION}).")
+        return None
+    return manifest
 
-    documents = load_documents()
-    if not documents:
-        logger.warning(f"No documents found in {DATA_PATH}. Cannot proceed without data.")
+def save_manifest(manifest, directory=None):
+    """Writes the manifest atomically so a crash never leaves a half-written file."""
+    directory = directory or VECTORSTORE_PATH
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def compute_index_version(config, chunk_ids):
+    """Content-derived version of an index: changes whenever the set of chunks or the config does."""
+    payload = json.dumps({"config": config, "chunk_ids": sorted(chunk_ids)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def get_index_version():
+    """Returns the version of the vector store currently saved in VECTORSTORE_PATH, or None."""
+    manifest = load_manifest()
+    return manifest.get("index_version") if manifest else None
+
+def data_matches_manifest(manifest):
+    """Whether the files in DATA_PATH are exactly the ones the manifest's index was built from."""
+    current_files = scan_data_files(previous=manifest["files"])
+    stored_files = {name: info for name, info in manifest["files"].items() if info.get("sha256") is not None}
+    return get_data_fingerprint(current_files) == get_data_fingerprint(stored_files)
+
+def index_needs_refresh(current_version, read_only=False):
+    """Whether a process serving index `current_version` should reload or rebuild its chain.
+
+    True when another process published a different index to VECTORSTORE_PATH or, unless
+    read_only, when the files in DATA_PATH no longer match the saved index.
+    """
+    manifest = load_manifest()
+    if manifest is None:
+        return not read_only
+    if manifest.get("index_version") != current_version:
+        return True
+    return not read_only and not data_matches_manifest(manifest)
+
+def get_manifest_chunk_ids(manifest):
+    """Returns the set of chunk ids recorded in a manifest."""
+    return {chunk_id for info in manifest["files"].values() for chunk_id in info["chunk_ids"]}
+
+def get_manifest_duplicates(files):
+    """Returns {dropped chunk id: kept chunk id} over a manifest's "files" section."""
+    return {chunk_id: kept_id for info in files.values() for chunk_id, kept_id in info.get("duplicates", {}).items()}
+
+def get_index_lock():
+    """Inter-process lock that serializes building, publishing and loading the index.
+
+    The lock file sits next to VECTORSTORE_PATH (not inside it, since that directory is
+    replaced on every publish). With several API workers, the first one to get the lock
+    builds the index and the others wait, then warm-start from what it saved.
+    """
+    lock_path = VECTORSTORE_PATH.rstrip("/\\") + ".lock"
+    if os.path.dirname(lock_path):
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    return FileLock(lock_path, timeout=INDEX_LOCK_TIMEOUT)
+
+def build_bm25_index(vectorstore):
+    """Builds the BM25 index over the chunks in the vector store's docstore."""
+    return BM25Index.build(
+        (chunk_id, vectorstore.docstore.search(chunk_id).page_content)
+        for chunk_id in vectorstore.index_to_docstore_id.values()
+    )
+
+def load_bm25_index(vectorstore, directory=None):
+    """Loads the BM25 index saved next to the FAISS index (default VECTORSTORE_PATH).
+
+    It is rebuilt from the docstore when it is missing or holds other chunks than the
+    vector store, e.g. an index published before BM25 was added or a concurrent republish.
+    """
+    directory = directory or VECTORSTORE_PATH
+    try:
+        bm25_index = BM25Index.load(directory)
+    except Exception as e:
+        logger.warning(f"Could not load BM25 index from {directory}: {e}")
+        bm25_index = None
+    if bm25_index is not None and set(bm25_index.chunk_ids) == set(vectorstore.index_to_docstore_id.values()):
+        return bm25_index
+    logger.info("BM25 index missing or out of date; building it from the docstore.")
+    return build_bm25_index(vectorstore)
+
+def load_deduplicator(vectorstore, params, directory=None):
+    """Loads the dedup state saved next to the FAISS index (default VECTORSTORE_PATH).
+
+    Like the BM25 index, it is rebuilt from the docstore when it is missing or holds
+    other chunks than the vector store.
+    """
+    directory = directory or VECTORSTORE_PATH
+    try:
+        deduplicator = ChunkDeduplicator.load(directory, params)
+    except Exception as e:
+        logger.warning(f"Could not load dedup state from {directory}: {e}")
+        deduplicator = None
+    chunk_ids = list(vectorstore.index_to_docstore_id.values())
+    if deduplicator is not None and set(deduplicator.chunk_hashes) == set(chunk_ids):
+        return deduplicator
+    logger.info("Dedup state missing or out of date; building it from the docstore.")
+    deduplicator = ChunkDeduplicator.from_params(params)
+    for chunk_id in chunk_ids:
+        deduplicator.add(chunk_id, vectorstore.docstore.search(chunk_id).page_content)
+    return deduplicator
+
+def merge_duplicate_sources(docstore, changes):
+    """Updates the "duplicate_sources" metadata of kept chunks; returns whether any changed.
+
+    `changes` maps a kept chunk id to (filenames to remove, sources to add): the files
+    whose copies of the chunk were dropped, the latter as the copies' "source" metadata.
+    A kept chunk never lists its own file.
+    """
+    changed = False
+    for kept_id, (removed, added) in changes.items():
+        doc = docstore.search(kept_id)
+        if not isinstance(doc, Document): # Deleted in this update
+            continue
+        before = doc.metadata.get("duplicate_sources", [])
+        sources = {source for source in before if os.path.basename(source) not in removed} | added
+        sources = sorted(source for source in sources if os.path.basename(source) != get_chunk_source_file(doc))
+        if sources != before:
+            changed = True
+            metadata = {key: value for key, value in doc.metadata.items() if key != "duplicate_sources"}
+            if sources:
+                metadata["duplicate_sources"] = sources
+            # Replaced rather than edited in place, since an on-disk docstore returns copies
+            docstore.delete([kept_id])
+            docstore.add({kept_id: Document(id=kept_id, page_content=doc.page_content, metadata=metadata)})
+    return changed
+
+def get_docstore_scratch_path():
+    """Where an on-disk docstore is written before it is published (next to VECTORSTORE_PATH, like the lock)."""
+    return VECTORSTORE_PATH.rstrip("/\\") + f".docstore-{os.getpid()}.sqlite"
+
+def create_docstore():
+    """Returns an empty docstore of the configured backend (RAG_DOCSTORE) for a new vector store."""
+    from chunk_store import SQLiteDocstore, get_docstore_backend
+    if get_docstore_backend() == "sqlite":
+        path = get_docstore_scratch_path()
+        if os.path.exists(path):
+            os.remove(path) # Left over from an update that failed
+        return SQLiteDocstore(path)
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    return InMemoryDocstore()
+
+def save_vector_store(vectorstore, manifest, deduplicator=None):
+    """Publishes the index, docstore, BM25 index, dedup state and manifest to VECTORSTORE_PATH by swapping directories.
+
+    Everything is written to a staging directory first and then renamed into place, so
+    the live files are never rewritten in place. Processes that memory-mapped the previous
+    index keep reading the old (now unlinked) files safely. Call it while holding the
+    index lock. A crash between the two renames leaves no index in VECTORSTORE_PATH;
+    recover_vector_store puts one back on the next start.
+    """
+    target = VECTORSTORE_PATH.rstrip("/\\")
+    staging = f"{target}.tmp-{os.getpid()}"
+    retired = f"{target}.old-{os.getpid()}"
+    from chunk_store import SQLiteDocstore
+    shutil.rmtree(staging, ignore_errors=True)
+    vectorstore.save_local(staging)
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        vectorstore.docstore.save(staging) # The pickle next to the index then holds only the id map
+    with stage("bm25_build"):
+        build_bm25_index(vectorstore).save(staging)
+    if deduplicator is not None:
+        deduplicator.save(staging)
+    save_manifest(manifest, directory=staging)
+    if os.path.exists(target):
+        os.rename(target, retired)
+    os.rename(staging, target)
+    shutil.rmtree(retired, ignore_errors=True)
+    logger.info(f"Vector store published to {VECTORSTORE_PATH} ({vectorstore.index.ntotal} vectors).")
+
+def recover_vector_store():
+    """Restores VECTORSTORE_PATH after a publish that crashed between its two renames.
+
+    Puts back the retired directory of the previous version or, if there is none, a staging
+    directory whose manifest (written last) shows it is complete. Does nothing while
+    VECTORSTORE_PATH exists. Call it while holding the index lock.
+    """
+    target = VECTORSTORE_PATH.rstrip("/\\")
+    if os.path.exists(target):
+        return False
+    staged = [path for path in glob.glob(glob.escape(target) + ".tmp-*") if os.path.exists(os.path.join(path, MANIFEST_FILE))]
+    for candidates in (glob.glob(glob.escape(target) + ".old-*"), staged):
+        directories = sorted((path for path in candidates if os.path.isdir(path)), key=os.path.getmtime)
+        if directories:
+            os.rename(directories[-1], target)
+            logger.warning(f"Restored the vector store in {VECTORSTORE_PATH} from {directories[-1]} after an interrupted publish.")
+            return True
+    return False
+
+def load_faiss_store(folder_path, embeddings, mmap=False, index_class=None):
+    """Like FAISS.load_local, but can memory-map the index read-only (see faiss_index.read_index)."""
+    from langchain_community.vectorstores import FAISS
+    from chunk_store import SQLiteDocstore
+    from faiss_index import read_index
+    index = read_index(os.path.join(folder_path, "index.faiss"), mmap=mmap, index_class=index_class)
+    # The docstore pickle is only ever written by save_vector_store in this process or a sibling
+    with open(os.path.join(folder_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    if isinstance(docstore, SQLiteDocstore):
+        docstore.open(folder_path) # Chunk texts stay on disk and are read per retrieved chunk
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def _load_indexed_vector_store(manifest, embeddings, mmap=False):
+    """Loads the saved FAISS index if it matches the manifest, otherwise returns None."""
+    from faiss_index import apply_search_params
+    try:
+        index_class = (manifest.get("index") or {}).get("class")
+        vectorstore = load_faiss_store(VECTORSTORE_PATH, embeddings, mmap=mmap, index_class=index_class)
+    except Exception as e:
+        logger.warning(f"Could not load existing vector store from {VECTORSTORE_PATH}: {e}")
+        return None
+    if set(vectorstore.index_to_docstore_id.values()) != get_manifest_chunk_ids(manifest):
+        logger.warning("Saved vector store does not match its manifest.")
         return None
+    apply_search_params(vectorstore.index)
+    return vectorstore
+
+def load_vector_store(embeddings, mmap=False, check_data=True):
+    """Warm start: loads the saved FAISS index if it is valid for the current data and config.
 
-    text_chunks = get_text_chunks(documents)
-    if not text_chunks:
-        logger.error("No text could be extracted from the documents. Check document content and loaders.")
-        print("Error: No text could be extracted from documents.")
+    Returns None when the index has to be (re)built, i.e. when there is no manifest, the
+    embedding/chunking config changed, any file in DATA_PATH was added, changed or
+    removed, or the saved index does not match its manifest. With check_data=False the
+    files in DATA_PATH are not compared (read-only serving of a separately built index).
+    mmap=True maps the index read-only instead of reading it into memory.
+    """
+    manifest = load_manifest()
+    if manifest is None:
+        logger.info("No index manifest found; the vector store has to be built.")
+        return None
+    if manifest.get("config") != get_index_config(embeddings):
+        logger.info("Index config changed since the vector store was built.")
+        return None
+    if check_data and not data_matches_manifest(manifest):
+        logger.info(f"Documents in {DATA_PATH} changed since the vector store was built.")
         return None
+    vectorstore = _load_indexed_vector_store(manifest, embeddings, mmap=mmap)
+    if vectorstore is not None:
+        logger.info(f"Loaded existing vector store from {VECTORSTORE_PATH} ({vectorstore.index.ntotal} vectors).")
+    return vectorstore
 
-    logger.info("Initializing OpenAI embeddings model...")
+def update_vector_store(embeddings, iter_chunks, full_rebuild=False, stats=None):
+    """Creates or incrementally updates the FAISS vector store from a stream of per-file chunks.
+
+    `iter_chunks(filenames)` yields (filename, chunks, chunk_ids) for at least the named
+    files in DATA_PATH (every file if filenames is None), possibly in several consecutive
+    parts per file. Chunks are embedded in batches
+    of EMBED_BATCH_SIZE and added to the index while the stream is still producing, so
+    embedding overlaps parsing and no full chunk list is ever built.
+
+    Chunks whose id is already in the saved index are reused and files that did not
+    change are not parsed at all; vectors of removed chunks are deleted. The result holds
+    the same chunk ids and documents as a full rebuild. Pass full_rebuild=True (or change
+    the embedding/chunking config) to re-embed everything. Returns None if there are no
+    chunks at all.
+
+    With RAG_DEDUP=exact or near, chunks that repeat a kept chunk are dropped before
+    embedding. The manifest records them per file under "duplicates", and the kept chunk
+    lists their files in its "duplicate_sources" metadata.
+    """
+    from langchain_community.vectorstores import FAISS
+    from chunk_store import SQLiteDocstore
+    from faiss_index import IndexBuilder, apply_search_params, describe_index, is_fallback_index, supports_removal
+    stats = stats or PipelineStats()
+    config = get_index_config(embeddings)
+    dedup_params = config.get("dedup")
+    old_manifest = None if full_rebuild else load_manifest()
+    files = scan_data_files(previous=(old_manifest or {}).get("files"))
+    vectorstore = None
+    if full_rebuild:
+        logger.info("Full rebuild requested.")
+    elif old_manifest is None:
+        logger.info("No usable index manifest found. Building the vector store from scratch.")
+    elif old_manifest.get("config") != config:
+        logger.info(f"Index config changed ({old_manifest.get('config')} -> {config}). Rebuilding.")
+    else:
+        vectorstore = _load_indexed_vector_store(old_manifest, embeddings)
+        if vectorstore is None:
+            logger.info("Falling back to a full rebuild.")
+
+    new_files = {name: dict(info, chunk_ids=[]) for name, info in files.items()}
+    files_to_parse = None # All of them
+    stale_ids = set()
+    if vectorstore is not None:
+        old_files = old_manifest["files"]
+        added_files = sorted(set(files) - set(old_files))
+        removed_files = sorted(set(old_files) - set(files))
+        changed_files = sorted(
+            name for name in set(files) & set(old_files)
+            if files[name]["sha256"] != old_files[name]["sha256"]
+        )
+        logger.info(f"Incremental index update: {len(added_files)} added, {len(changed_files)} changed, {len(removed_files)} removed files.")
+        for name in added_files:
+            logger.info(f"  + {name}")
+        for name in changed_files:
+            logger.info(f"  ~ {name}")
+        for name in removed_files:
+            logger.info(f"  - {name}")
+
+        # Chunks of changed and removed files are deleted unless the new versions still have them
+        stale_ids = {chunk_id for name in changed_files + removed_files for chunk_id in old_files[name]["chunk_ids"]}
+        # Only flat indexes can drop vectors in place, and an index that fell back to flat
+        # because the corpus was too small to train should become the requested type once
+        # it can. Both are rebuilt; the embedding cache serves the unchanged chunks.
+        if (stale_ids and not supports_removal(vectorstore.index)) or \
+                ((added_files or changed_files or removed_files) and is_fallback_index(vectorstore.index)):
+            logger.info(f"Rebuilding the {describe_index(vectorstore.index)['class']} index instead of updating it in place.")
+            vectorstore = None
+        else:
+            # Duplicates of a deleted chunk are parsed again, so that one of them is kept instead
+            orphaned_files = sorted(
+                name for name in set(files) - set(added_files) - set(changed_files)
+                if stale_ids.intersection(old_files[name].get("duplicates", {}).values())
+            )
+            files_to_parse = added_files + changed_files + orphaned_files
+            for name in set(files) - set(files_to_parse):
+                new_files[name]["chunk_ids"] = list(old_files[name]["chunk_ids"])
+                if "duplicates" in old_files[name]:
+                    new_files[name]["duplicates"] = dict(old_files[name]["duplicates"])
+
+    indexed_ids = set(vectorstore.index_to_docstore_id.values()) if vectorstore is not None else set()
+    builder = IndexBuilder() if vectorstore is None else None
+    docstore, built_ids = (create_docstore() if builder is not None else None), []
+    if vectorstore is None:
+        logger.info("Streaming every document into a new vector store...")
+    elif isinstance(vectorstore.docstore, SQLiteDocstore):
+        vectorstore.docstore.copy_on_write(get_docstore_scratch_path()) # The published file stays untouched
+
+    deduplicator, source_changes, redundant_ids = None, {}, set()
+    dedup_saved = {"chunks": 0, "text_bytes": 0}
+    if dedup_params is not None:
+        if vectorstore is None:
+            deduplicator = ChunkDeduplicator.from_params(dedup_params)
+        else:
+            deduplicator = load_deduplicator(vectorstore, dedup_params)
+            deduplicator.remove(stale_ids)
+            # The files of re-parsed and removed copies are re-added below if they are still dropped
+            for name in files_to_parse + removed_files:
+                for kept_id in old_files.get(name, {}).get("duplicates", {}).values():
+                    source_changes.setdefault(kept_id, (set(), set()))[0].add(name)
+
+    streamed_files = set()
+
+    def chunks_to_embed(stream):
+        for filename, chunks, chunk_ids in stream:
+            entry = new_files.setdefault(filename, {"sha256": None, "size": None, "mtime_ns": None})
+            if filename not in streamed_files: # A file may come in several parts
+                streamed_files.add(filename)
+                entry["chunk_ids"] = []
+                if deduplicator is not None:
+                    entry["duplicates"] = {}
+            start = time.perf_counter()
+            kept = []
+            for chunk, chunk_id in zip(chunks, chunk_ids):
+                kept_id = deduplicator.check(chunk_id, chunk.page_content) if deduplicator is not None else None
+                if kept_id is None:
+                    kept.append((chunk, chunk_id))
+                    continue
+                entry["duplicates"][chunk_id] = kept_id
+                source_changes.setdefault(kept_id, (set(), set()))[1].add(str(chunk.metadata.get("source", filename)))
+                if chunk_id in indexed_ids:
+                    redundant_ids.add(chunk_id) # Indexed before its file changed; now a copy
+                else:
+                    dedup_saved["chunks"] += 1
+                    dedup_saved["text_bytes"] += len(chunk.page_content.encode("utf-8"))
+            if deduplicator is not None:
+                stats.add("dedup", len(chunks), time.perf_counter() - start)
+            for chunk, chunk_id in kept:
+                entry["chunk_ids"].append(chunk_id)
+                if chunk_id not in indexed_ids:
+                    yield chunk, chunk_id
+
+    # Parsing and splitting run in a background thread, at most INGEST_QUEUE_SIZE files ahead
+    stream = prefetch(iter_chunks(files_to_parse), INGEST_QUEUE_SIZE)
+    num_added = 0
+    try:
+        for batch in batched(chunks_to_embed(stream), EMBED_BATCH_SIZE):
+            texts = [chunk.page_content for chunk, _ in batch]
+            ids = [chunk_id for _, chunk_id in batch]
+            with stats.timed("embed", len(batch)):
+                vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+            with stats.timed("index", len(batch)):
+                if builder is not None:
+                    builder.add(vectors)
+                    docstore.add({
+                        chunk_id: Document(id=chunk_id, page_content=chunk.page_content, metadata=chunk.metadata)
+                        for chunk, chunk_id in batch
+                    })
+                    built_ids.extend(ids)
+                else:
+                    vectorstore.add_embeddings(zip(texts, vectors.tolist()), metadatas=[chunk.metadata for chunk, _ in batch], ids=ids)
+            num_added += len(batch)
+    finally:
+        stream.close()
+
+    chunk_ids = [chunk_id for info in new_files.values() for chunk_id in info["chunk_ids"]]
+    if not chunk_ids:
+        logger.warning(f"No text chunks could be extracted from the files in {DATA_PATH}.")
+        return None
+    duplicate_ids = list(get_manifest_duplicates(new_files))
+    new_manifest = {
+        "version": MANIFEST_VERSION,
+        # Dropped copies count too: their files are still answered from the kept chunk
+        "index_version": compute_index_version(config, chunk_ids + duplicate_ids),
+        "config": config,
+        "files": new_files,
+    }
+
+    if builder is not None:
+        start = time.perf_counter()
+        index = builder.finish() # Trains IVF/PQ indexes on the buffered vectors
+        stats.add("index", 0, time.perf_counter() - start)
+        vectorstore = FAISS(embeddings, index, docstore, dict(enumerate(built_ids)))
+        merge_duplicate_sources(vectorstore.docstore, source_changes)
+        logger.info(f"Vector store created from {num_added} chunks ({describe_index(vectorstore.index)}).")
+    else:
+        ids_to_delete = sorted((stale_ids | redundant_ids) - set(chunk_ids))
+        sources_changed = merge_duplicate_sources(vectorstore.docstore, source_changes)
+        if not ids_to_delete and not num_added and not sources_changed:
+            logger.info("Vector store is up to date; nothing to embed.")
+            new_manifest["index"] = describe_index(vectorstore.index)
+            if new_manifest != old_manifest:
+                save_manifest(new_manifest) # e.g. a file was touched without changing its chunks
+            return vectorstore
+        if ids_to_delete:
+            logger.info(f"Deleting {len(ids_to_delete)} stale chunk vectors...")
+            vectorstore.delete(ids_to_delete)
+        logger.info(f"Embedded {num_added} new or changed chunks (reusing {len(chunk_ids) - num_added}).")
+
+    if deduplicator is not None:
+        log_dedup_savings(deduplicator, dedup_saved, len(duplicate_ids), vectorstore.index.d)
+    apply_search_params(vectorstore.index)
+    new_manifest["index"] = describe_index(vectorstore.index)
+    save_vector_store(vectorstore, new_manifest, deduplicator=deduplicator)
+    return vectorstore
+
+def log_dedup_savings(deduplicator, saved, total_duplicates, dimension):
+    """Logs and records what dropping duplicate chunks saved in this update."""
+    for kind, count in deduplicator.dropped.items():
+        record_dedup(kind, count)
+    # Each dropped chunk is one text not sent for embedding, one float32 vector and its docstore text
+    saved_bytes = saved["chunks"] * dimension * 4 + saved["text_bytes"]
+    requests = -(-saved["chunks"] // EMBED_BATCH_SIZE)
+    logger.info(
+        f"Dedup: dropped {deduplicator.dropped['exact']} exact and {deduplicator.dropped['near']} near duplicate chunks; "
+        f"{saved['chunks']} fewer texts embedded (~{requests} embedding requests), ~{saved_bytes / 1e6:.2f} MB less index. "
+        f"{total_duplicates} duplicates dropped in total."
+    )
+
+def get_vector_store(text_chunks, embeddings, full_rebuild=False):
+    """Creates or incrementally updates the FAISS vector store from already split chunks.
+
+    Same as update_vector_store, for callers that hold the whole chunk list; chunks are
+    attributed to files by their source metadata.
+    """
+    chunks_by_file = {}
+    for chunk, chunk_id in zip(text_chunks, compute_chunk_ids(text_chunks)):
+        file_chunks, file_chunk_ids = chunks_by_file.setdefault(get_chunk_source_file(chunk), ([], []))
+        file_chunks.append(chunk)
+        file_chunk_ids.append(chunk_id)
+
+    def iter_chunks(filenames):
+        for filename, (file_chunks, file_chunk_ids) in chunks_by_file.items():
+            yield filename, file_chunks, file_chunk_ids
+
+    return update_vector_store(embeddings, iter_chunks, full_rebuild=full_rebuild)
+
+def get_embeddings():
+    """Creates the embeddings model, wrapped in the persistent embedding cache unless RAG_EMBEDDING_CACHE=0."""
+    from langchain_openai import OpenAIEmbeddings
     embeddings = OpenAIEmbeddings()
+    if env_flag("RAG_EMBEDDING_CACHE", default=True):
+        embeddings = CachedEmbeddings(embeddings)
+        logger.info(f"Embedding cache enabled at {embeddings.path} (max {embeddings.max_entries} entries).")
+    # Outermost, so the embed_query/embed_documents timings include cache lookups
+    return InstrumentedEmbeddings(embeddings)
+
+def log_embedding_cache_stats(embeddings):
+    """Logs hit/miss counters if the embeddings are cached."""
+    cache = next((layer for layer in iter_embedding_layers(embeddings) if isinstance(layer, CachedEmbeddings)), None)
+    if cache is not None:
+        stats = cache.stats()
+        logger.info(
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.1%} hit rate), {stats['entries']} entries stored."
+        )
+
+def ingest_documents(embeddings, full_rebuild=False, stats=None):
+    """Streams the documents in DATA_PATH through parse, split, embed and index steps.
+
+    Files are parsed (in a process pool with RAG_PARSE_WORKERS > 1) and split in a
+    background thread while the embedder works on earlier files; at most
+    INGEST_QUEUE_SIZE split files wait in between, so memory stays flat as the corpus
+    grows. Builds or updates the vector store (see update_vector_store) and logs each
+    step's throughput; pass a PipelineStats as `stats` to get the numbers.
+    """
+    stats = stats or PipelineStats()
+    with stage("index_build"):
+        vectorstore = update_vector_store(
+            embeddings, lambda filenames: iter_file_chunks(filenames, stats=stats),
+            full_rebuild=full_rebuild, stats=stats,
+        )
+    stats.finish()
+    for step, stage_name in (("parse", "load_documents"), ("split", "split")):
+        if step in stats.seconds:
+            record_stage(stage_name, stats.seconds[step])
+    stats.log()
 
-    vectorstore = get_vector_store(text_chunks, embeddings)
     if not vectorstore:
-        logger.error("Failed to create or load vector store.")
+        if not scan_data_files():
+            logger.warning(f"No documents found in {DATA_PATH}. Cannot proceed without data.")
+            _create_sample_document()
+        else:
+            logger.error("No text could be extracted from the documents. Check document content and loaders.")
+            print("Error: No text could be extracted from documents.")
         return None
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-    logger.info("Retriever created from vector store.")
+    return vectorstore
 
-    # Initialize LLM
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-    logger.info(f"ChatOpenAI LLM initialized with model gpt-3.5-turbo.")
+def open_vector_store(embeddings, full_rebuild=False, read_only=False, mmap=False):
+    """Loads, updates or builds the vector store under the index lock.
 
-    # Setup memory
-    memory = ConversationBufferMemory(
-        memory_key='chat_history',
-        return_messages=True,
-        output_key='answer'
-    )
-    logger.info("ConversationBufferMemory initialized.")
+    Returns (vectorstore, boot_type) with boot_type "warm", "cold" or "read-only", or
+    (None, boot_type) on failure. In read-only mode the saved index is loaded as is (no
+    data scan, never rebuilt); it has to be built beforehand with `--build-index`.
+    """
+    with get_index_lock():
+        recover_vector_store()
+        if read_only:
+            if full_rebuild:
+                logger.warning("Ignoring full_rebuild: the index is opened read-only.")
+            vectorstore = load_vector_store(embeddings, mmap=mmap, check_data=False)
+            if vectorstore is None:
+                logger.error(f"No usable index in {VECTORSTORE_PATH}. Build it first with `python rag_assistant.py --build-index`.")
+            return vectorstore, "read-only"
 
-    # Create ConversationalRetrievalChain
-    qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
+        # Warm start: skip ingestion entirely when the saved index already reflects DATA_PATH
+        vectorstore = None if full_rebuild else load_vector_store(embeddings, mmap=mmap)
+        if vectorstore is not None:
+            return vectorstore, "warm"
+        vectorstore = ingest_documents(embeddings, full_rebuild=full_rebuild)
+        log_embedding_cache_stats(embeddings)
+        return vectorstore, "cold"
+
+def build_index(full_rebuild=False):
+    """Builds or updates the index in VECTORSTORE_PATH without starting a chain (the `--build-index` step)."""
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.error("OPENAI_API_KEY not found. Please set it in the .env file.")
+        return False
+    start_time = time.perf_counter()
+    embeddings = get_embeddings()
+    with get_index_lock():
+        recover_vector_store()
+        vectorstore = ingest_documents(embeddings, full_rebuild=full_rebuild)
+    log_embedding_cache_stats(embeddings)
+    if vectorstore is None:
+        return False
+    logger.info(f"Index built in {time.perf_counter() - start_time:.2f}s ({vectorstore.index.ntotal} vectors, version {get_index_version()}).")
+    return True
+
+def create_retriever(vectorstore, k=RETRIEVER_K):
+    """Creates the retriever for the configured mode (RAG_RETRIEVAL_MODE, see hybrid_retriever).
+
+    The BM25 index is only loaded when the mode or the lexical fast path can use it.
+    With RAG_CONTEXT_PACKING=1 the retriever packs its results to a token budget
+    instead of returning the top k (see context_packing).
+    """
+    from context_packing import create_context_packer
+    from hybrid_retriever import HybridRetriever, get_retrieval_mode
+    mode = get_retrieval_mode()
+    retriever = HybridRetriever(vectorstore=vectorstore, search_kwargs={"k": k}, mode=mode, context_packer=create_context_packer())
+    if mode != "vector" or retriever.lexical_fast_path:
+        retriever.bm25_index = load_bm25_index(vectorstore)
+    packing = f"packing up to {retriever.context_packer.token_budget} tokens" if retriever.context_packer else f"top {k}"
+    logger.info(f"Retriever created ({mode} mode, lexical fast path {'on' if retriever.lexical_fast_path else 'off'}, {packing}).")
+    return retriever
+
+def create_qa_chain(llm, retriever, condense_llm=None):
+    """Builds the ConversationalRetrievalChain, like ConversationalRetrievalChain.from_llm.
+
+    The question generator applies the condense policy (see condense.CondenseQuestionChain)
+    and uses condense_llm (default: llm). The chain has no memory of its own: callers pass
+    the session's history as "chat_history" (see session_store) so conversations stay separate.
+    """
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain.chains.question_answering import load_qa_chain
+    from condense import create_condense_chain
+    return ConversationalRetrievalChain(
         retriever=retriever,
-        memory=memory,
+        combine_docs_chain=load_qa_chain(llm, chain_type="stuff"),
+        question_generator=create_condense_chain(condense_llm or llm),
         return_source_documents=True,
-        verbose=False  # Disable verbose output
+        verbose=False,  # Disable verbose output
     )
-    logger.info("ConversationalRetrievalChain created successfully.")
+
+def get_condense_stats(qa_chain):
+    """Decision counts and skip rate of the chain's condense policy, or None if it has none."""
+    stats = getattr(getattr(qa_chain, "question_generator", None), "stats", None)
+    return stats() if callable(stats) else None
+
+def initialize_rag_chain(full_rebuild=False, read_only=None, mmap=None):
+    """Initializes all components of the RAG chain and returns the chain.
+
+    If the saved vector store is still valid for the documents in DATA_PATH it is loaded
+    directly (warm start); otherwise the documents are ingested first (cold start).
+    Set full_rebuild=True to skip the warm start and re-embed every chunk.
+    read_only (default RAG_INDEX_READ_ONLY) serves a separately built index without ever
+    building; mmap (default RAG_INDEX_MMAP, on) memory-maps loaded indexes so several
+    worker processes share one copy in RAM.
+    """
+    from langchain_openai import ChatOpenAI
+    from condense import CONDENSE_MODEL
+    logger.info("Initializing RAG assistant components...")
+    start_time = time.perf_counter()
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.error("OPENAI_API_KEY not found. Please set it in the .env file.")
+        print("Error: OPENAI_API_KEY not found. Please create a .env file with your key.")
+        return None
+
+    logger.info("Initializing OpenAI embeddings model...")
+    embeddings = get_embeddings()
+
+    read_only = env_flag("RAG_INDEX_READ_ONLY") if read_only is None else read_only
+    mmap = env_flag("RAG_INDEX_MMAP", default=True) if mmap is None else mmap
+    vectorstore, boot_type = open_vector_store(embeddings, full_rebuild=full_rebuild, read_only=read_only, mmap=mmap)
+    if vectorstore is None:
+        return None
+
+    retriever = create_retriever(vectorstore)
+
+    # Initialize LLM
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+    logger.info(f"ChatOpenAI LLM initialized with model gpt-3.5-turbo.")
+    # Follow-up questions can be rewritten by a cheaper model (RAG_CONDENSE_MODEL)
+    condense_llm = ChatOpenAI(model_name=CONDENSE_MODEL, temperature=0) if CONDENSE_MODEL else llm
+
+    qa_chain = create_qa_chain(llm, retriever, condense_llm=condense_llm)
+    logger.info(f"ConversationalRetrievalChain created successfully (condense policy {qa_chain.question_generator.policy}, model {CONDENSE_MODEL or 'gpt-3.5-turbo'}).")
+    logger.info(f"RAG chain initialized in {time.perf_counter() - start_time:.2f}s ({boot_type} start).")
     return qa_chain
 
-def main():
+async def astream_answer(qa_chain, question, chat_history=None):
+    """Runs the conversational retrieval steps of `qa_chain` and streams the answer.
+
+    Mirrors ConversationalRetrievalChain: the question is condensed against the chat
+    history (a list of (question, answer) turns), documents are retrieved, and the
+    answer is generated from them. Yields ("sources", documents) as soon as retrieval
+    finishes, then ("token", text) for each generated token, and finally
+    ("answer", full_answer).
+    """
+    from langchain.chains.conversational_retrieval.base import _get_chat_history
+    get_chat_history = qa_chain.get_chat_history or _get_chat_history
+    chat_history_str = get_chat_history(chat_history or [])
+
+    new_question = question
+    if chat_history_str:
+        with stage("condense"):
+            result = await qa_chain.question_generator.ainvoke({"question": question, "chat_history": chat_history_str})
+        new_question = result[qa_chain.question_generator.output_key]
+
+    with stage("retrieve"):
+        docs = await qa_chain.retriever.ainvoke(new_question)
+    yield "sources", docs
+
+    if qa_chain.response_if_no_docs_found is not None and not docs:
+        answer = qa_chain.response_if_no_docs_found
+        yield "token", answer
+    else:
+        inputs = {
+            "input_documents": docs,
+            "question": new_question if qa_chain.rephrase_question else question,
+            "chat_history": chat_history_str,
+        }
+        tokens = []
+        llm_start = time.perf_counter()
+        # astream_events makes the chat model stream; only the answer LLM runs inside combine_docs_chain
+        async for event in qa_chain.combine_docs_chain.astream_events(inputs, version="v2"):
+            if event["event"] == "on_chat_model_stream":
+                token = event["data"]["chunk"].content
+                if token:
+                    tokens.append(token)
+                    yield "token", token
+        record_stage("llm", time.perf_counter() - llm_start)
+        answer = "".join(tokens)
+
+    yield "answer", answer
+
+def search_by_vectors(vectorstore, vectors, k):
+    """Runs a single FAISS search for a whole matrix of query vectors.
+
+    Returns one list of (document, score) pairs per query, like
+    FAISS.similarity_search_with_score_by_vector would for each row.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    scores, indices = vectorstore.index.search(matrix, k)
+    results = []
+    for row_scores, row_indices in zip(scores, indices):
+        results.append([
+            (vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)]), float(score))
+            for score, i in zip(row_scores, row_indices)
+            if i != -1 # FAISS pads with -1 when the index holds fewer than k vectors
+        ])
+    return results
+
+async def aanswer_questions_batch(qa_chain, questions, max_concurrency=None, slot=None):
+    """Answers independent questions with one embeddings request and one FAISS search.
+
+    Questions are treated as standalone (no chat history, no condensation, no memory).
+    Retrieval follows the retriever's mode, lexical fast path and context packing, as
+    for a single question; the questions that need the vector store are embedded in one
+    batched request and searched together. The answer LLM calls then run with at most
+    `max_concurrency` in flight. `slot`, an async context manager factory such as
+    AdmissionController.slot, is held around the retrieval and around each LLM call.
+    Returns one dict per question, in input order, with "question", "answer",
+    "source_documents" and "error" (None unless that question's LLM call failed).
+    """
+    max_concurrency = max_concurrency or BATCH_MAX_CONCURRENCY
+    slot = slot or contextlib.nullcontext
+    retriever = qa_chain.retriever
+
+    logger.info(f"Retrieving for {len(questions)} batch questions...")
+    async with slot():
+        if hasattr(retriever, "abatch_retrieve"):
+            retrieved = await retriever.abatch_retrieve(list(questions))
+        else: # A plain vector store retriever
+            vectorstore = retriever.vectorstore
+            vectors = await vectorstore.embeddings.aembed_documents(list(questions))
+            with stage("search"):
+                retrieved = [[doc for doc, _ in docs_and_scores] for docs_and_scores in
+                             search_by_vectors(vectorstore, vectors, retriever.search_kwargs.get("k", RETRIEVER_K))]
+
+    combine_docs_chain = qa_chain.combine_docs_chain
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer(question, docs):
+        async with semaphore:
+            try:
+                async with slot():
+                    with stage("llm"):
+                        result = await combine_docs_chain.ainvoke({"input_documents": docs, "question": question, "chat_history": ""})
+                return {"question": question, "answer": result[combine_docs_chain.output_key], "source_documents": docs, "error": None}
+            except Exception as e:
+                logger.error(f"Error answering batch question '{question}': {e}")
+                return {"question": question, "answer": None, "source_documents": docs, "error": str(e)}
+
+    return await asyncio.gather(*(answer(question, docs) for question, docs in zip(questions, retrieved)))
+
+def answer_questions_batch(qa_chain, questions, max_concurrency=None):
+    """Synchronous wrapper around aanswer_questions_batch for scripts and evaluation jobs."""
+    return asyncio.run(aanswer_questions_batch(qa_chain, questions, max_concurrency=max_concurrency))
+
+def evaluate_vector_store(vectorstore, embeddings, num_queries=100, k=10):
+    """Measures recall@k and query latency of the vector store's index against exact flat search.
+
+    The stored chunks are re-embedded (from the embedding cache when enabled) and perturbed
+    chunk vectors serve as queries, so the comparison runs on the indexed data itself.
+    """
+    from faiss_index import evaluate_index, index_vectors_in_order, sample_query_vectors
+    vectors = np.asarray(index_vectors_in_order(vectorstore, embeddings), dtype=np.float32)
+    if vectorstore._normalize_L2:
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = sample_query_vectors(vectors, num_queries)
+    return evaluate_index(vectorstore.index, vectors, queries, k=k)
+
+def parse_args(argv=None):
+    """Parses command-line options for the CLI."""
+    parser = argparse.ArgumentParser(description="RAG-powered Question-Answering Assistant")
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        default=env_flag("RAG_FULL_REBUILD"),
+        help="Re-embed every document instead of updating the vector store incrementally.",
+    )
+    parser.add_argument(
+        "--build-index",
+        action="store_true",
+        help="Build or update the index under the index lock, then exit (run before starting read-only API workers).",
+    )
+    parser.add_argument(
+        "--evaluate-index",
+        action="store_true",
+        help="Report recall@k and latency of the configured index against flat search, then exit.",
+    )
+    parser.add_argument("--eval-queries", type=int, default=100, help="Number of queries for --evaluate-index.")
+    parser.add_argument("--eval-k", type=int, default=10, help="Neighbours per query for --evaluate-index.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function to run the RAG assistant CLI."""
+    args = parse_args(argv)
+    setup_logging()
+    log_path_diagnostics()
     logger.info("RAG Assistant CLI starting...")
+
+    if args.build_index:
+        if not build_index(full_rebuild=args.full_rebuild):
+            logger.error("Index build failed.")
+            sys.exit(1)
+        return
+
+    if args.evaluate_index:
+        embeddings = get_embeddings()
+        vectorstore = None if args.full_rebuild else load_vector_store(embeddings)
+        vectorstore = vectorstore or ingest_documents(embeddings, full_rebuild=args.full_rebuild)
+        if vectorstore is None:
+            logger.error("No vector store to evaluate. Exiting CLI.")
+            return
+        report = evaluate_vector_store(vectorstore, embeddings, num_queries=args.eval_queries, k=args.eval_k)
+        print(json.dumps(report, indent=2))
+        return
     
-    qa_chain = initialize_rag_chain()
+    qa_chain = initialize_rag_chain(full_rebuild=args.full_rebuild)
 
     if not qa_chain:
         logger.error("Failed to initialize RAG chain. Exiting CLI.")
         return
 
+    session_store = InMemorySessionStore()
+    session_id = "cli"
+
     logger.info("RAG Assistant is ready. CLI started. Type 'exit' to quit.")
     print("\nRAG Assistant with session memory is ready. Type 'exit' to quit.")
 
@@ -310,8 +1502,10 @@ def main():
         logger.info(f"Received question: '{user_question}'")
         try:
             logger.info("Invoking ConversationalRetrievalChain...")
-            result = qa_chain.invoke({"question": user_question})
+            chat_history = session_store.get_history(session_id)
+            result = qa_chain.invoke({"question": user_question, "chat_history": chat_history})
             answer = result.get('answer', "Sorry, I couldn't find an answer.")
+            session_store.append_turn(session_id, user_question, answer)
             
             logger.info(f"Retrieved answer: '{answer[:100]}...'" if len(answer) > 100 else f"Retrieved answer: '{answer}'")
             
@@ -0,0 +1,258 @@
+# Per-session conversation history stores for the RAG Assistant
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_BACKEND = os.getenv("RAG_SESSION_STORE", "memory") # "memory" or "sqlite"
+SESSION_DB_PATH = os.getenv("RAG_SESSION_DB_PATH", "cache/sessions.sqlite")
+MAX_SESSIONS = int(os.getenv("RAG_MAX_SESSIONS", "1000"))
+SESSION_TTL = float(os.getenv("RAG_SESSION_TTL", "3600")) # Seconds of inactivity before a session expires
+SESSION_MAX_TOKENS = int(os.getenv("RAG_SESSION_MAX_TOKENS", "2000")) # History budget per session
+# SQLite store: reads record the access time in memory; it is written with the next write, or
+# once this many sessions are pending or the oldest is this many seconds old
+ACCESS_FLUSH_SESSIONS = 256
+ACCESS_FLUSH_SECONDS = 30.0
+
+APPROX_CHARS_PER_TOKEN = 4
+
+Turn = Tuple[str, str] # (question, answer), the chat_history format ConversationalRetrievalChain accepts
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // APPROX_CHARS_PER_TOKEN)
+
+
+def trim_turns(turns: List[Turn], max_tokens: int) -> List[Turn]:
+    """Drops the oldest turns until the history fits in max_tokens. The latest turn is always kept."""
+    total = sum(estimate_tokens(q) + estimate_tokens(a) for q, a in turns)
+    start = 0
+    while total > max_tokens and start < len(turns) - 1:
+        q, a = turns[start]
+        total -= estimate_tokens(q) + estimate_tokens(a)
+        start += 1
+    return turns[start:]
+
+
+class SessionStore(ABC):
+    """Interface for session-keyed chat history with bounded size.
+
+    The async variants are what the API calls; by default they run the blocking method
+    in a worker thread so disk I/O never holds up the event loop.
+    """
+
+    @abstractmethod
+    def get_history(self, session_id: str) -> List[Turn]:
+        """Returns the session's (question, answer) turns, oldest first; [] if unknown or expired."""
+
+    @abstractmethod
+    def append_turn(self, session_id: str, question: str, answer: str) -> None:
+        """Adds a finished turn, trimming the oldest turns to the token budget."""
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        """Forgets the session."""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Backend name, number of sessions and evictions."""
+
+    async def aget_history(self, session_id: str) -> List[Turn]:
+        return await asyncio.to_thread(self.get_history, session_id)
+
+    async def aappend_turn(self, session_id: str, question: str, answer: str) -> None:
+        await asyncio.to_thread(self.append_turn, session_id, question, answer)
+
+    async def aclear(self, session_id: str) -> None:
+        await asyncio.to_thread(self.clear, session_id)
+
+
+class InMemorySessionStore(SessionStore):
+    """Keeps histories in process memory with LRU eviction over max_sessions and a TTL."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL, max_tokens: int = SESSION_MAX_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, Tuple[float, List[Turn]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        # Sessions are ordered by last access, so expired ones are at the front
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    def get_history(self, session_id: str) -> List[Turn]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def append_turn(self, session_id: str, question: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            _, turns = self._sessions.pop(session_id, (now, []))
+            self._sessions[session_id] = (now, trim_turns(turns + [(question, answer)], self.max_tokens))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "evicted": self.evicted}
+
+    # Plain dictionary work: cheaper to do on the event loop than to hand to a thread
+    async def aget_history(self, session_id: str) -> List[Turn]:
+        return self.get_history(session_id)
+
+    async def aappend_turn(self, session_id: str, question: str, answer: str) -> None:
+        self.append_turn(session_id, question, answer)
+
+    async def aclear(self, session_id: str) -> None:
+        self.clear(session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Keeps histories in a local SQLite file so they survive restarts, with the same bounds.
+
+    Reads do not write: the access time they record is kept in memory and flushed with
+    the next write, or in batches (ACCESS_FLUSH_SESSIONS, ACCESS_FLUSH_SECONDS).
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL,
+                 max_tokens: int = SESSION_MAX_TOKENS):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._accessed: Dict[str, float] = {} # Session id -> access time not yet written
+        self._accessed_since: Optional[float] = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,"
+            " question TEXT NOT NULL, answer TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+        self._conn.commit()
+
+    def _flush_accessed(self) -> None:
+        """Writes the pending access times; the caller holds the lock and commits."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE sessions SET last_access = MAX(last_access, ?) WHERE session_id = ?",
+                [(accessed, session_id) for session_id, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+        self._accessed_since = None
+
+    def _expire(self, now: float) -> None:
+        self._flush_accessed() # Sessions that were only read recently are still active
+        deleted = self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl,)).rowcount
+        self.evicted += max(deleted, 0)
+
+    def _load_turns(self, session_id: str) -> List[Tuple[int, str, str]]:
+        return self._conn.execute(
+            "SELECT id, question, answer FROM turns WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+
+    def get_history(self, session_id: str) -> List[Turn]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None or now - max(row[0], self._accessed.get(session_id, 0.0)) > self.ttl:
+                return [] # Unknown, or expired and not deleted yet
+            self._accessed[session_id] = now
+            if self._accessed_since is None:
+                self._accessed_since = now
+            if len(self._accessed) >= ACCESS_FLUSH_SESSIONS or now - self._accessed_since >= ACCESS_FLUSH_SECONDS:
+                self._flush_accessed()
+                self._conn.commit()
+            return [(question, answer) for _, question, answer in self._load_turns(session_id)]
+
+    def append_turn(self, session_id: str, question: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?)"
+                " ON CONFLICT (session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, now),
+            )
+            self._conn.execute(
+                "INSERT INTO turns (session_id, question, answer) VALUES (?, ?, ?)", (session_id, question, answer)
+            )
+            rows = self._load_turns(session_id)
+            kept = trim_turns([(q, a) for _, q, a in rows], self.max_tokens)
+            dropped = len(rows) - len(kept)
+            if dropped:
+                self._conn.execute(
+                    "DELETE FROM turns WHERE session_id = ? AND id <= ?", (session_id, rows[dropped - 1][0])
+                )
+            excess = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN"
+                    " (SELECT session_id FROM sessions ORDER BY last_access ASC LIMIT ?)",
+                    (excess,),
+                )
+                self.evicted += excess
+            self._conn.commit()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._accessed.pop(session_id, None)
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": "sqlite", "sessions": sessions, "evicted": self.evicted}
+
+
+def create_session_store(backend: Optional[str] = None) -> SessionStore:
+    """Creates the session store selected by RAG_SESSION_STORE ("memory" or "sqlite")."""
+    backend = (backend or SESSION_STORE_BACKEND).lower()
+    if backend == "sqlite":
+        logger.info(f"Using SQLite session store at {SESSION_DB_PATH}.")
+        return SQLiteSessionStore()
+    if backend != "memory":
+        logger.warning(f"Unknown session store '{backend}', falling back to the in-memory store.")
+    logger.info(f"Using in-memory session store (max {MAX_SESSIONS} sessions, TTL {SESSION_TTL:.0f}s).")
+    return InMemorySessionStore()
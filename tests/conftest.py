@@ -1,2 +1,111 @@
 # conftest.py for pytest
 # You can define shared fixtures and hooks here.
+
+import json
+import os
+import sys
+
+import pytest
+
+# The modules in src/rt_rag import each other by bare name (e.g. `from rag_assistant import ...`),
+# the same way they are run from that directory, so put it on the path for the tests.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "rt_rag")))
+
+# Tests parse throwaway files; keep them out of the on-disk parse cache unless a test opts in
+os.environ.setdefault("RAG_PARSE_CACHE", "0")
+
+
+@pytest.fixture
+def no_answer_cache(monkeypatch):
+    """Turns off the API's answer cache, so repeated questions reach the chain."""
+    import api_main
+    monkeypatch.setattr(api_main, "answer_cache", None)
+
+
+@pytest.fixture
+def make_chain():
+    """Factory for a real ConversationalRetrievalChain over a tiny index, answering with canned replies."""
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+
+    def make(*replies):
+        vectorstore = FAISS.from_documents(
+            [Document(page_content="Apples are red.", metadata={"source": "fruit.txt"})],
+            DeterministicFakeEmbedding(size=8),
+        )
+        llm = GenericFakeChatModel(messages=iter(AIMessage(content=reply) for reply in replies))
+        return ConversationalRetrievalChain.from_llm(
+            llm=llm, retriever=vectorstore.as_retriever(search_kwargs={"k": 1}), return_source_documents=True,
+        )
+    return make
+
+
+@pytest.fixture
+def parse_sse():
+    """Parser for a Server-Sent Events body into (event, data) pairs."""
+    def parse(body):
+        events = []
+        for block in body.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines())
+            events.append((lines["event"], json.loads(lines["data"])))
+        return events
+    return parse
+
+
+@pytest.fixture
+def store_paths(tmp_path, monkeypatch):
+    """Points DATA_PATH and VECTORSTORE_PATH at a temporary directory and returns the data directory."""
+    import rag_assistant
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(rag_assistant, "DATA_PATH", str(data_dir) + "/")
+    monkeypatch.setattr(rag_assistant, "VECTORSTORE_PATH", str(tmp_path / "vectorstore") + "/")
+    return data_dir
+
+
+@pytest.fixture
+def counting_embeddings():
+    """Fake embeddings class that records how many texts and queries were embedded."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    class CountingEmbeddings(DeterministicFakeEmbedding):
+        embedded: int = 0
+        queries: int = 0
+
+        def embed_documents(self, texts):
+            self.embedded += len(texts)
+            return super().embed_documents(texts)
+
+        def embed_query(self, text):
+            self.queries += 1
+            return super().embed_query(text)
+
+        async def aembed_query(self, text):
+            return self.embed_query(text)
+    return CountingEmbeddings
+
+
+@pytest.fixture
+def build():
+    """Builds (or incrementally updates) the vector store from the files in DATA_PATH."""
+    import rag_assistant
+
+    def build(embeddings, full_rebuild=False):
+        chunks = rag_assistant.get_text_chunks(rag_assistant.load_documents())
+        return rag_assistant.get_vector_store(chunks, embeddings, full_rebuild=full_rebuild)
+    return build
+
+
+@pytest.fixture
+def stored_docs():
+    """Lists a vector store's (chunk id, text) pairs, sorted, for comparing two stores."""
+    def stored_docs(vectorstore):
+        return sorted(
+            (doc_id, vectorstore.docstore.search(doc_id).page_content)
+            for doc_id in vectorstore.index_to_docstore_id.values()
+        )
+    return stored_docs
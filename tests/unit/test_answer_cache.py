@@ -0,0 +1,75 @@
+# Tests for the exact and semantic answer cache
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from answer_cache import AnswerCache, key_terms, normalize_question
+
+
+class KeywordEmbeddings:
+    """Embeds text as counts of a few keywords so similarity is predictable."""
+    keywords = ("apple", "pear", "colour", "price")
+
+    async def aembed_query(self, text):
+        return [float(text.lower().count(word)) for word in self.keywords]
+
+
+class ConstantEmbeddings:
+    """Embeds every text to the same vector, like questions that differ only in one entity."""
+
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+def get(cache, question, version="v1"):
+    value, tier, embedding = asyncio.run(cache.aget(question, version))
+    return value, tier, embedding
+
+
+def test_normalization():
+    assert normalize_question("  What is   RT-RAG?? ") == "what is rt-rag"
+
+
+def test_exact_and_semantic_tiers():
+    cache = AnswerCache(embeddings=KeywordEmbeddings(), similarity_threshold=0.99)
+    value, tier, embedding = get(cache, "Apple colour?")
+    assert value is None
+    cache.put("Apple colour?", "v1", {"answer": "Red"}, embedding)
+
+    assert get(cache, "  apple COLOUR ")[:2] == ({"answer": "Red"}, "exact")
+    assert get(cache, "What colour is an apple")[:2] == ({"answer": "Red"}, "semantic")
+    assert get(cache, "Pear price")[0] is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_near_miss_questions_do_not_share_answers():
+    assert key_terms('Who wrote "Deep Nets" for ICML 2021?') == {"deep nets", "deep", "nets", "icml", "2021"}
+    cache = AnswerCache(embeddings=ConstantEmbeddings(), similarity_threshold=0.95)
+    for question in ("Who wrote paper X?", "How many papers came out in 2020?", 'Who wrote "Deep Nets"?'):
+        _, _, embedding = get(cache, question)
+        cache.put(question, "v1", {"answer": question}, embedding)
+
+    for near_miss in ("Who wrote paper Y?", "How many papers came out in 2021?", 'Who wrote "Deep Trees"?', "Who wrote paper X2?"):
+        assert get(cache, near_miss)[0] is None
+    assert get(cache, "Which author wrote paper X")[:2] == ({"answer": "Who wrote paper X?"}, "semantic")
+
+
+def test_new_index_version_invalidates_entries():
+    cache = AnswerCache(embeddings=None)
+    cache.put("question", "v1", {"answer": "old"})
+    assert get(cache, "question", "v1")[0] == {"answer": "old"}
+    assert get(cache, "question", "v2")[0] is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_lru_bound():
+    cache = AnswerCache(embeddings=None, max_entries=2)
+    for question in ("a", "b", "c"):
+        cache.put(question, "v1", question.upper())
+    assert get(cache, "a")[0] is None
+    assert get(cache, "c")[0] == "C"
@@ -0,0 +1,273 @@
+# Tests for the FastAPI endpoints in api_main
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+import httpx
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import api_main
+from session_store import InMemorySessionStore
+
+pytestmark = pytest.mark.usefixtures("no_answer_cache")
+
+
+class FakeChain:
+    """Stands in for the ConversationalRetrievalChain, with a configurable delay."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.calls = 0
+
+    async def ainvoke(self, inputs, config=None):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        return {
+            "answer": f"Answer to {inputs['question']}",
+            "source_documents": [Document(page_content="x", metadata={"source": "b.txt"}),
+                                 Document(page_content="y", metadata={"source": "a.txt"})],
+        }
+
+
+def post_many(payloads):
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/ask", json=payload) for payload in payloads))
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def fake_chain(monkeypatch):
+    chain = FakeChain()
+    monkeypatch.setattr(api_main, "qa_chain", chain)
+    return chain
+
+
+def test_ask_returns_answer_and_sorted_sources(fake_chain):
+    (response,) = post_many([{"question": "What?", "session_id": "s1"}])
+    assert response.status_code == 200
+    assert response.json() == {"answer": "Answer to What?", "sources": ["a.txt", "b.txt"], "session_id": "s1", "index_version": None, "context_tokens": None, "timings": None}
+
+
+def test_concurrency_is_bounded_and_overflow_is_rejected(fake_chain, monkeypatch):
+    fake_chain.delay = 0.2
+    monkeypatch.setattr(api_main, "admission", api_main.AdmissionController(max_concurrent=2, max_queued=2, queue_timeout=5))
+    responses = post_many([{"question": f"q{i}"} for i in range(6)])
+    codes = sorted(response.status_code for response in responses)
+    assert codes == [200, 200, 200, 200, 429, 429]
+    assert fake_chain.max_running == 2
+
+
+def test_stream_sends_sources_first_then_tokens(monkeypatch, make_chain, parse_sse):
+    monkeypatch.setattr(api_main, "qa_chain", make_chain("Apples are red"))
+    monkeypatch.setattr(api_main, "session_store", InMemorySessionStore())
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/ask/stream", json={"question": "What colour are apples?", "session_id": "s1"})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert events[0] == ("sources", {"sources": ["fruit.txt"]})
+    assert "".join(data["token"] for kind, data in events if kind == "token") == "Apples are red"
+    kind, done = events[-1]
+    assert kind == "done"
+    assert done["answer"] == "Apples are red"
+    assert done["time_to_first_token_ms"] is not None
+    # The streamed turn lands in the session history like /ask would
+    assert api_main.session_store.get_history("s1") == [("What colour are apples?", "Apples are red")]
+
+
+def test_sessions_keep_separate_histories(monkeypatch, make_chain):
+    chain = make_chain("Red.", "What colour are pears?", "Green.", "Yellow.")
+    monkeypatch.setattr(api_main, "qa_chain", chain)
+    monkeypatch.setattr(api_main, "session_store", InMemorySessionStore())
+    post_many([{"question": "Apple colour?", "session_id": "alice"}])
+    post_many([{"question": "And pears?", "session_id": "alice"}])
+    post_many([{"question": "Banana colour?", "session_id": "bob"}])
+    assert api_main.session_store.get_history("alice") == [("Apple colour?", "Red."), ("And pears?", "Green.")]
+    assert api_main.session_store.get_history("bob") == [("Banana colour?", "Yellow.")]
+
+
+def test_repeated_stateless_question_is_served_from_cache(fake_chain, monkeypatch):
+    from answer_cache import AnswerCache
+    monkeypatch.setattr(api_main, "answer_cache", AnswerCache(embeddings=None))
+    monkeypatch.setattr(api_main, "index_version", "v1")
+    first, = post_many([{"question": "What?"}])
+    fake_chain.max_running = 0
+    second, = post_many([{"question": "what"}])
+    assert second.json() == first.json()
+    assert fake_chain.max_running == 0
+    assert api_main.answer_cache.stats()["exact_hits"] == 1
+
+
+class QueryCountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings that count query embeddings and embedded batch texts."""
+    queries: int = 0
+    documents: int = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return super().embed_documents(texts)
+
+
+def make_hybrid_chain(embeddings, *replies, **retriever_kwargs):
+    """A chain over a tiny index whose HybridRetriever has a BM25 index, answering with canned replies."""
+    from bm25_index import BM25Index
+    from hybrid_retriever import HybridRetriever
+    from rag_assistant import create_qa_chain
+    vectorstore = FAISS.from_documents([Document(page_content="Apples are red.", metadata={"source": "fruit.txt"}),
+                                        Document(page_content="Pears are green.", metadata={"source": "pears.txt"})], embeddings)
+    embeddings.documents = 0
+    bm25_index = BM25Index.build((chunk_id, vectorstore.docstore.search(chunk_id).page_content)
+                                 for chunk_id in vectorstore.index_to_docstore_id.values())
+    retriever = HybridRetriever(vectorstore=vectorstore, bm25_index=bm25_index, search_kwargs={"k": 1}, **retriever_kwargs)
+    llm = GenericFakeChatModel(messages=iter(AIMessage(content=reply) for reply in replies))
+    return create_qa_chain(llm, retriever)
+
+
+def test_lexical_fast_path_skips_the_semantic_cache_tier(monkeypatch):
+    from answer_cache import AnswerCache
+    embeddings = QueryCountingEmbeddings(size=8)
+    monkeypatch.setattr(api_main, "qa_chain", make_hybrid_chain(embeddings, "Red.", "Red, mostly.", mode="vector", lexical_fast_path=True))
+    monkeypatch.setattr(api_main, "answer_cache", AnswerCache(embeddings=embeddings))
+
+    keywords, = post_many([{"question": "apples red"}])
+    assert keywords.json()["sources"] == ["fruit.txt"]
+    assert embeddings.queries == 0
+    # Questions go through the semantic tier and the retriever; the embedding cache makes the second call a hit
+    question, = post_many([{"question": "What colour are apples?"}])
+    assert question.status_code == 200 and embeddings.queries == 2
+
+
+def test_identical_in_flight_questions_share_one_chain_call(fake_chain, monkeypatch):
+    fake_chain.delay = 0.2
+    monkeypatch.setattr(api_main, "single_flight", api_main.SingleFlight())
+    responses = post_many([{"question": "What?"}, {"question": "what", "session_id": "new"}, {"question": "What?"}, {"question": "Why?"}])
+    assert fake_chain.calls == 2
+    assert [response.json()["answer"] for response in responses] == ["Answer to What?"] * 3 + ["Answer to Why?"]
+    assert responses[1].json()["session_id"] == "new"
+    assert api_main.single_flight.stats() == {"leaders": 2, "coalesced": 2, "in_flight": 0, "coalesce_rate": 0.5}
+
+
+def test_reindex_swaps_chain_while_in_flight_requests_finish_on_old_index(monkeypatch):
+    old_chain, new_chain = FakeChain(delay=0.3), FakeChain()
+    monkeypatch.setattr(api_main, "qa_chain", old_chain)
+    monkeypatch.setattr(api_main, "index_version", "v1")
+    monkeypatch.setattr(api_main, "create_answer_cache", lambda chain: None)
+    monkeypatch.setattr(api_main, "initialize_rag_chain", lambda full_rebuild=False: new_chain)
+    monkeypatch.setattr(api_main, "get_index_version", lambda: "v2")
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            in_flight = asyncio.create_task(client.post("/ask", json={"question": "Before?"}))
+            await asyncio.sleep(0.1)
+            reindexed = await client.post("/reindex")
+            after = await client.post("/ask", json={"question": "After?"})
+            return await in_flight, reindexed, after
+
+    in_flight, reindexed, after = asyncio.run(run())
+    assert reindexed.json()["index_version"] == "v2" and reindexed.json()["previous_index_version"] == "v1"
+    assert in_flight.json()["index_version"] == "v1"
+    assert after.json()["index_version"] == "v2"
+    assert old_chain.max_running == new_chain.max_running == 1
+    assert api_main.qa_chain is new_chain
+
+
+def test_failed_reindex_keeps_serving_old_chain(fake_chain, monkeypatch):
+    monkeypatch.setattr(api_main, "index_version", "v1")
+    monkeypatch.setattr(api_main, "initialize_rag_chain", lambda full_rebuild=False: None)
+    monkeypatch.setattr(api_main, "ADMIN_TOKEN", "secret")
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            forbidden = await client.post("/reindex")
+            failed = await client.post("/reindex", headers={"X-Admin-Token": "secret"})
+            return forbidden, failed
+
+    forbidden, failed = asyncio.run(run())
+    assert (forbidden.status_code, failed.status_code) == (403, 500)
+    assert api_main.qa_chain is fake_chain and api_main.index_version == "v1"
+
+
+class BatchCountingEmbeddings(DeterministicFakeEmbedding):
+    requests: int = 0
+
+    async def aembed_documents(self, texts):
+        self.requests += 1
+        return self.embed_documents(texts)
+
+
+def test_batch_embeds_once_and_keeps_order(monkeypatch, make_chain):
+    chain = make_chain("A1", "A2", "A3")
+    vectorstore = chain.retriever.vectorstore
+    vectorstore.add_documents([Document(page_content="Pears are green.", metadata={"source": "pears.txt"})])
+    embeddings = BatchCountingEmbeddings(size=8)
+    vectorstore.embedding_function = embeddings
+    monkeypatch.setattr(api_main, "qa_chain", chain)
+
+    questions = ["Apples are red.", "Pears are green.", "Apples are red."]
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/ask/batch", json={"questions": questions})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    answers = response.json()["answers"]
+    assert [answer["question"] for answer in answers] == questions
+    assert sorted(answer["answer"] for answer in answers) == ["A1", "A2", "A3"]
+    assert embeddings.requests == 1
+    # One batched search returns what a per-question search would
+    for question, answer in zip(questions, answers):
+        expected = vectorstore.similarity_search(question, k=1)
+        assert answer["sources"] == [expected[0].metadata["source"]]
+
+
+def test_batch_follows_the_retrieval_mode_and_takes_a_slot_per_llm_call(monkeypatch):
+    class CountingAdmission(api_main.AdmissionController):
+        slots = 0
+
+        def slot(self):
+            self.slots += 1
+            return super().slot()
+
+    embeddings = QueryCountingEmbeddings(size=8)
+    chain = make_hybrid_chain(embeddings, "A1", "A2", mode="hybrid", lexical_fast_path=True)
+    monkeypatch.setattr(api_main, "qa_chain", chain)
+    monkeypatch.setattr(api_main, "admission", CountingAdmission(max_concurrent=2, max_queued=4, queue_timeout=5))
+    questions = ["pears", "What colour are apples?"]
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/ask/batch", json={"questions": questions})
+
+    answers = asyncio.run(run()).json()["answers"]
+    # The keyword query takes the lexical fast path; only the question is embedded
+    assert (embeddings.documents, embeddings.queries) == (1, 0)
+    assert api_main.admission.slots == 1 + len(questions)
+    for question, answer in zip(questions, answers):
+        assert answer["sources"] == [doc.metadata["source"] for doc in chain.retriever.invoke(question)]
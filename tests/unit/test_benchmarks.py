@@ -0,0 +1,42 @@
+# Smoke test for the offline benchmark suite in benchmarks/
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("fastapi")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "benchmarks")))
+import run_benchmarks  # noqa: E402
+from corpus import generate_corpus  # noqa: E402
+from chunk_store import get_docstore_backend  # noqa: E402
+
+
+def test_generate_corpus_cycles_formats(tmp_path):
+    counts = generate_corpus(str(tmp_path), 5, formats=("txt", "json", "pdf"), words_per_doc=300)
+    assert counts == {"txt": 2, "json": 2, "pdf": 1}
+    assert sorted(os.listdir(tmp_path))[0] == "doc_000000.txt"
+    assert (tmp_path / "doc_000002.pdf").read_bytes().startswith(b"%PDF-1.4")
+
+
+def test_run_benchmarks_reports_every_stage():
+    results = run_benchmarks.run_benchmarks(
+        sizes=[4], formats=["txt", "json"], words_per_doc=300, num_queries=5, ask_requests=4,
+        concurrency_levels=[1, 2], embedding_latency=0.0, embedding_per_text_latency=0.0,
+        llm_latency=0.0, llm_token_latency=0.0, embedding_size=16, import_repeats=1,
+    )
+    assert results["import"]["rag_assistant_ms"] > 0 and results["import"]["api_main_heavy_modules"] == []
+    (run,) = results["runs"]
+    assert run["load"]["documents"] == 6 # 2 text files + 2 JSON files with 2 records each
+    assert run["split"]["chunks"] >= run["load"]["documents"]
+    assert run["index_build"]["vectors"] == run["split"]["chunks"]
+    assert run["pipeline"]["seconds"] > 0 and "embed_per_sec" in run["pipeline"]
+    assert run["index_load"]["docstore"] == get_docstore_backend() and run["index_load"]["seconds"] > 0
+    assert set(run["query"]) >= {"p50_ms", "p95_ms", "p99_ms"}
+    assert [ask["concurrency"] for ask in run["ask"]] == [1, 2]
+    assert all(ask["errors"] == 0 for ask in run["ask"])
+
+    lines = run_benchmarks.compare_results(results, results)
+    assert any(line.startswith("size=4/query/p95_ms") and line.endswith("+0.0%") for line in lines)
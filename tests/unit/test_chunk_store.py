@@ -0,0 +1,71 @@
+# Tests for the on-disk SQLite docstore
+
+import os
+import pickle
+
+import pytest
+
+pytest.importorskip("faiss")
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import chunk_store
+import rag_assistant
+from chunk_store import DOCSTORE_FILE, SQLiteDocstore
+
+
+def test_read_only_store_is_copied_on_first_write(tmp_path):
+    published = tmp_path / "published"
+    published.mkdir()
+    store = SQLiteDocstore(str(tmp_path / "scratch.sqlite"))
+    store.add({"a": Document(page_content="Alpha", metadata={"source": "a.txt", "page": 1})})
+    with pytest.raises(ValueError, match="already exist"):
+        store.add({"a": Document(page_content="Again")})
+    store.save(str(published))
+    assert not os.path.exists(tmp_path / "scratch.sqlite")
+
+    loaded = pickle.loads(pickle.dumps(store)).open(str(published))
+    assert loaded.search("a") == Document(id="a", page_content="Alpha", metadata={"source": "a.txt", "page": 1})
+    assert loaded.search("b") == "ID b not found."
+    with pytest.raises(ValueError, match="read-only"):
+        loaded.delete(["a"])
+
+    loaded.copy_on_write(str(tmp_path / "update.sqlite"))
+    loaded.add({"b": Document(page_content="Beta")})
+    loaded.delete(["a"])
+    assert len(loaded) == 1
+    assert len(SQLiteDocstore().open(str(published))) == 1 # Still only "a"
+    assert SQLiteDocstore().open(str(published)).search("a").page_content == "Alpha"
+
+
+def test_vector_store_with_sqlite_docstore(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunk_store, "DOCSTORE_BACKEND", "sqlite")
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(rag_assistant, "DATA_PATH", str(data_dir) + "/")
+    monkeypatch.setattr(rag_assistant, "VECTORSTORE_PATH", str(tmp_path / "vectorstore") + "/")
+    (data_dir / "a.txt").write_text("Alpha document about apples.")
+    (data_dir / "b.txt").write_text("Beta document about bananas.")
+    embeddings = DeterministicFakeEmbedding(size=8)
+
+    def build(full_rebuild=False):
+        chunks = rag_assistant.get_text_chunks(rag_assistant.load_documents())
+        return rag_assistant.get_vector_store(chunks, embeddings, full_rebuild=full_rebuild)
+
+    build()
+    (data_dir / "b.txt").write_text("Beta document about blueberries.")
+    incremental = build()
+    assert isinstance(incremental.docstore, SQLiteDocstore)
+    assert os.path.exists(tmp_path / "vectorstore" / DOCSTORE_FILE)
+    assert not os.path.exists(rag_assistant.get_docstore_scratch_path())
+
+    loaded = rag_assistant.load_vector_store(embeddings)
+    assert isinstance(loaded.docstore, SQLiteDocstore) and loaded.docstore.read_only
+    [doc] = loaded.similarity_search("Beta document about blueberries.", k=1)
+    assert doc.page_content == "Beta document about blueberries."
+
+    rebuilt = build(full_rebuild=True)
+    for vectorstore in (incremental, rebuilt):
+        assert sorted(
+            vectorstore.docstore.search(chunk_id).page_content for chunk_id in vectorstore.index_to_docstore_id.values()
+        ) == ["Alpha document about apples.", "Beta document about blueberries."]
@@ -0,0 +1,58 @@
+# Tests for the condense-question policy
+
+import pytest
+
+pytest.importorskip("faiss")
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import rag_assistant
+from condense import is_self_contained
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What colour are ripe bananas?", True),
+    ("How are PDF files parsed during ingestion?", True),
+    ("What about pears?", False),
+    ("And for JSON files?", False),
+    ("Why is it red?", False),
+    ("Can you explain that in more detail?", False),
+    ("Bananas?", False),
+])
+def test_is_self_contained(question, expected):
+    assert is_self_contained(question) is expected
+
+
+class CountingChatModel(GenericFakeChatModel):
+    """Fake chat model that records the prompts it was called with."""
+    prompts: list = []
+
+    def _generate(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._generate(messages, *args, **kwargs)
+
+
+def test_follow_ups_are_rewritten_once_and_self_contained_questions_skip_the_llm():
+    vectorstore = FAISS.from_documents(
+        [Document(page_content="Apples are red. Pears are green.", metadata={"source": "fruit.txt"})],
+        DeterministicFakeEmbedding(size=8),
+    )
+    llm = CountingChatModel(messages=iter(AIMessage(content=reply) for reply in ["Green.", "Green.", "Yellow."]), prompts=[])
+    condense_llm = CountingChatModel(messages=iter([AIMessage(content="What colour are pears?")]), prompts=[])
+    chain = rag_assistant.create_qa_chain(llm, vectorstore.as_retriever(search_kwargs={"k": 1}), condense_llm=condense_llm)
+    history = [("What colour are apples?", "Red.")]
+
+    for _ in range(2):
+        result = chain.invoke({"question": "What about pears?", "chat_history": history})
+        assert result["answer"] == "Green."
+    result = chain.invoke({"question": "What colour are ripe bananas?", "chat_history": history})
+    assert result["answer"] == "Yellow."
+
+    assert len(condense_llm.prompts) == 1 # Rewritten once, then served from the cache
+    assert len(llm.prompts) == 3 # Answers only
+    stats = rag_assistant.get_condense_stats(chain)
+    assert stats["decisions"] == {"rewritten": 1, "cached": 1, "self_contained": 1}
+    assert stats["skip_rate"] == pytest.approx(2 / 3)
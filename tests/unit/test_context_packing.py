@@ -0,0 +1,56 @@
+# Tests for packing retrieved chunks into the answer context
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import context_packing
+from context_packing import ContextPacker
+from metrics import start_context_stats
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def test_floor_mmr_and_token_budget():
+    query = [1.0, 1.0, 0.0]
+    documents = [Document(page_content=text) for text in ("apples " * 10, "apples again " * 5, "bananas " * 10, "cherries " * 10)]
+    vectors = np.array([[1, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+    packer = ContextPacker(token_budget=25, max_chunks=8, max_similarity_gap=0.15, mmr_lambda=0.7, token_counter=word_count)
+
+    # The unrelated chunk is below the floor, and the copy of the first chunk comes after the diverse one
+    assert packer.order(query, vectors) == [0, 2, 1]
+    stats = start_context_stats()
+    packed = packer.pack(documents, query, vectors)
+    assert [doc.page_content for doc in packed] == ["apples " * 10, "bananas " * 10]
+    assert stats == {"tokens": 20, "chunks": 2}
+
+    # Without vectors (lexical hits) only the budget applies; the first chunk always goes in
+    small = ContextPacker(token_budget=5, token_counter=word_count)
+    assert small.pack(documents) == documents[:1]
+
+
+pytest.importorskip("faiss")
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import rag_assistant
+
+
+def test_retriever_over_fetches_and_packs(monkeypatch):
+    monkeypatch.setattr(context_packing, "CONTEXT_PACKING", True)
+    # Keep every candidate: random fake embeddings are as likely to point away from the question as towards it
+    monkeypatch.setattr(context_packing, "CONTEXT_MIN_SIMILARITY", -1.0)
+    monkeypatch.setattr(context_packing, "CONTEXT_MAX_SIMILARITY_GAP", 2.0)
+    monkeypatch.setattr(context_packing, "CONTEXT_TOKEN_BUDGET", 30)
+    texts = [f"Chunk number {i} about fruit." for i in range(10)]
+    vectorstore = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=16))
+    retriever = rag_assistant.create_retriever(vectorstore, k=2)
+    retriever.context_packer.token_counter = word_count
+
+    stats = start_context_stats()
+    documents = retriever.invoke("Which chunk is about fruit?")
+    assert len(documents) == 6 # 30 tokens of 5-word chunks, more than k
+    assert len({doc.page_content for doc in documents}) == 6
+    assert stats == {"tokens": 30, "chunks": 6}
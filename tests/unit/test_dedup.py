@@ -0,0 +1,90 @@
+# Tests for duplicate chunk detection and its use during ingestion
+
+import pytest
+
+import dedup
+from dedup import ChunkDeduplicator
+
+TEXT = " ".join(str(i) for i in range(200))
+NEAR_COPY = TEXT.replace(" 100 ", " one hundred ")
+REWRAPPED = TEXT.replace(" 50 ", "\n50\n")
+OTHER = " ".join(str(i) for i in range(1000, 1200))
+
+
+def test_exact_and_near_duplicates(tmp_path):
+    exact = ChunkDeduplicator("exact")
+    assert exact.check("a", TEXT) is None
+    assert exact.check("b", REWRAPPED) == "a"
+    assert exact.check("c", NEAR_COPY) is None
+    assert exact.dropped == {"exact": 1, "near": 0}
+
+    near = ChunkDeduplicator("near", threshold=0.9)
+    assert near.check("a", TEXT) is None
+    assert near.check("a", TEXT) is None # Already kept
+    assert near.check("b", NEAR_COPY) == "a"
+    assert near.check("c", OTHER) is None
+    assert near.dropped == {"exact": 0, "near": 1}
+
+    near.save(str(tmp_path))
+    loaded = ChunkDeduplicator.load(str(tmp_path), near.params)
+    assert set(loaded.chunk_hashes) == {"a", "c"}
+    assert loaded.check("d", REWRAPPED) == "a"
+    assert ChunkDeduplicator.load(str(tmp_path), dict(near.params, threshold=0.8)) is None
+
+    loaded.remove(["a"])
+    assert loaded.check("b", NEAR_COPY) is None
+
+
+pytest.importorskip("faiss")
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import rag_assistant
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings that record how many texts were embedded."""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def build(embeddings, full_rebuild=False):
+    chunks = rag_assistant.get_text_chunks(rag_assistant.load_documents())
+    return rag_assistant.get_vector_store(chunks, embeddings, full_rebuild=full_rebuild)
+
+
+def stored_docs(vectorstore):
+    return sorted(
+        (doc_id, doc.page_content, doc.metadata)
+        for doc_id, doc in ((doc_id, vectorstore.docstore.search(doc_id)) for doc_id in vectorstore.index_to_docstore_id.values())
+    )
+
+
+def test_duplicates_are_not_embedded_and_survive_removal_of_the_kept_copy(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(dedup, "DEDUP_MODE", "near")
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(rag_assistant, "DATA_PATH", str(data_dir) + "/")
+    monkeypatch.setattr(rag_assistant, "VECTORSTORE_PATH", str(tmp_path / "vectorstore") + "/")
+    for name, text in {"a.txt": TEXT, "b.txt": NEAR_COPY, "c.txt": REWRAPPED, "d.txt": OTHER}.items():
+        (data_dir / name).write_text(text)
+
+    embeddings = CountingEmbeddings(size=8)
+    with caplog.at_level("INFO"):
+        vectorstore = build(embeddings)
+    assert embeddings.embedded == vectorstore.index.ntotal == 2
+    assert "dropped 1 exact and 1 near duplicate chunks; 2 fewer texts embedded" in caplog.text
+    kept = next(doc for _, _, doc in stored_docs(vectorstore) if doc["source"].endswith("a.txt"))
+    assert [source.rsplit("/", 1)[-1] for source in kept["duplicate_sources"]] == ["b.txt", "c.txt"]
+    assert len(rag_assistant.load_manifest()["files"]["b.txt"]["duplicates"]) == 1
+
+    (data_dir / "a.txt").unlink()
+    embeddings.embedded = 0
+    incremental = build(embeddings)
+    assert embeddings.embedded == 1 # b.txt is kept now; c.txt is a copy of it
+
+    rebuilt = build(CountingEmbeddings(size=8), full_rebuild=True)
+    assert stored_docs(incremental) == stored_docs(rebuilt)
+    assert incremental.index.ntotal == 2
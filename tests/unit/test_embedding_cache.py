@@ -0,0 +1,84 @@
+# Tests for the disk-backed embedding cache
+
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.texts += 1
+        return super().embed_query(text)
+
+
+def test_cache_hits_survive_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    underlying = CountingEmbeddings(size=4)
+    cache = CachedEmbeddings(underlying, path=path, model_name="fake")
+    first = cache.embed_documents(["alpha", "beta", "alpha"])
+    assert underlying.texts == 2
+    assert first[0] == first[2]
+
+    reopened = CachedEmbeddings(underlying, path=path, model_name="fake")
+    assert reopened.embed_documents(["beta", "alpha"]) == [first[1], first[0]]
+    assert reopened.embed_query("alpha") == first[0]
+    assert underlying.texts == 2
+    assert reopened.stats()["hits"] == 3
+    assert reopened.stats()["misses"] == 0
+
+    other_model = CachedEmbeddings(underlying, path=path, model_name="other")
+    other_model.embed_query("alpha")
+    assert underlying.texts == 3
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    underlying = CountingEmbeddings(size=4)
+    cache = CachedEmbeddings(underlying, path=str(tmp_path / "e.sqlite"), max_entries=2, model_name="fake")
+    cache.embed_query("one")
+    cache.embed_query("two")
+    cache.embed_query("one") # "two" is now the least recently used
+    cache.embed_query("three")
+    assert cache.stats()["entries"] == 2
+
+    underlying.texts = 0
+    cache.embed_query("one")
+    assert underlying.texts == 0
+    cache.embed_query("two")
+    assert underlying.texts == 1
+
+
+def test_async_lookups_run_off_the_event_loop(tmp_path):
+    underlying = CountingEmbeddings(size=4)
+    cache = CachedEmbeddings(underlying, path=str(tmp_path / "e.sqlite"), model_name="fake")
+    threads = set()
+    lookup = cache._lookup
+    cache._lookup = lambda keys: threads.add(threading.get_ident()) or lookup(keys)
+
+    async def run():
+        first = await cache.aembed_query("alpha")
+        return first, await cache.aembed_query("alpha"), await cache.aembed_documents(["alpha", "beta"])
+
+    first, again, documents = asyncio.run(run())
+    assert again == documents[0] == first
+    assert threads and threading.get_ident() not in threads
+    assert underlying.texts == 2
+    assert cache.stats()["entries"] == 2
+    # Hits are written as recently used with the next insert, not on every lookup
+    assert cache._touched == {}
+    cache.embed_query("alpha")
+    assert list(cache._touched) == [cache._key("alpha")]
@@ -0,0 +1,86 @@
+# Tests for the configurable FAISS index types in faiss_index
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+import faiss_index
+import rag_assistant
+
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("params", [
+    {"type": "flat"},
+    {"type": "hnsw", "m": 16, "ef_construction": 64},
+    {"type": "ivf", "nlist": 8, "train_sample": 300},
+    {"type": "ivfpq", "nlist": 8, "train_sample": 300, "pq_m": 4, "pq_nbits": 4},
+])
+def test_index_types_recall_against_flat(params):
+    vectors = random_vectors(500)
+    index = faiss_index.create_index(vectors, params)
+    index.add(vectors)
+    faiss_index.apply_search_params(index, nprobe=8, ef_search=64)
+
+    report = faiss_index.evaluate_index(index, vectors, faiss_index.sample_query_vectors(vectors, 20), k=5)
+    assert report["index"]["ntotal"] == 500
+    # Every search parameter here covers the whole index, except for PQ's lossy codes
+    assert report["recall@5"] >= (0.5 if params["type"] == "ivfpq" else 0.95)
+
+
+def test_ivf_falls_back_to_flat_when_too_few_vectors():
+    index = faiss_index.create_index(random_vectors(5), {"type": "ivf", "nlist": 8, "train_sample": 100})
+    assert isinstance(index, faiss.IndexFlat)
+    assert faiss_index.is_fallback_index(index, {"type": "ivf"})
+
+
+def test_ivf_vectors_are_reconstructed_after_preparation():
+    vectors = random_vectors(500)
+    index = faiss_index.create_index(vectors, {"type": "ivf", "nlist": 8, "train_sample": 300})
+    index.add(vectors)
+    with pytest.raises(ValueError, match="direct map"):
+        faiss_index.reconstruct_vectors(index, [3, 7])
+    faiss_index.make_reconstructable(index)
+    faiss_index.make_reconstructable(index) # Idempotent
+    np.testing.assert_allclose(faiss_index.reconstruct_vectors(index, [3, 7]), vectors[[3, 7]], rtol=1e-5)
+
+
+def test_hnsw_store_rebuilds_on_deletion(store_paths, counting_embeddings, build, stored_docs, monkeypatch):
+    monkeypatch.setattr(faiss_index, "INDEX_TYPE", "hnsw")
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    (store_paths / "b.txt").write_text("Beta document about bananas.")
+    embeddings = counting_embeddings(size=8)
+    vectorstore = build(embeddings)
+    assert isinstance(vectorstore.index, faiss.IndexHNSWFlat)
+    manifest = rag_assistant.load_manifest()
+    assert manifest["config"]["index"]["type"] == "hnsw"
+    assert manifest["index"]["class"] == "IndexHNSWFlat"
+
+    (store_paths / "a.txt").unlink()
+    updated = build(embeddings)
+    assert isinstance(updated.index, faiss.IndexHNSWFlat)
+    assert stored_docs(updated) == stored_docs(build(counting_embeddings(size=8), full_rebuild=True))
+    assert rag_assistant.load_vector_store(embeddings).index.hnsw.efSearch == faiss_index.HNSW_EF_SEARCH
+
+
+def test_changing_index_type_triggers_rebuild(store_paths, counting_embeddings, build, monkeypatch):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    embeddings = counting_embeddings(size=8)
+    build(embeddings)
+    assert rag_assistant.load_vector_store(embeddings) is not None
+
+    monkeypatch.setattr(faiss_index, "INDEX_TYPE", "hnsw")
+    assert rag_assistant.load_vector_store(embeddings) is None
+
+
+def test_evaluate_vector_store(store_paths, counting_embeddings, build):
+    for i in range(20):
+        (store_paths / f"doc{i}.txt").write_text(f"Document number {i} about topic {i * 7}.")
+    embeddings = counting_embeddings(size=8)
+    vectorstore = build(embeddings)
+    report = rag_assistant.evaluate_vector_store(vectorstore, embeddings, num_queries=5, k=3)
+    assert report["recall@3"] == 1.0
+    assert report["queries"] == 5
@@ -0,0 +1,95 @@
+# Tests for the BM25 index and the hybrid / lexical retriever
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("prometheus_client")
+
+import rag_assistant
+from bm25_index import BM25_FILE, BM25Index, tokenize
+from hybrid_retriever import HybridRetriever, is_keyword_query, reciprocal_rank_fusion
+from metrics import start_timings
+
+
+def test_bm25_ranks_by_term_rarity_and_frequency():
+    index = BM25Index.build([
+        ("a", "The apple orchard grows apples and pears."),
+        ("b", "Bananas, bananas and more bananas."),
+        ("c", "A banana and an apple walk into a bar."),
+    ])
+    assert tokenize("What is the Apple?") == ["apple"]
+    assert [chunk_id for chunk_id, _ in index.search("bananas", k=5)] == ["b"]
+    assert [chunk_id for chunk_id, _ in index.search("apple banana", k=5)][0] == "c"
+    assert index.search("the and", k=5) == [] # Stopwords only
+    assert index.search("kiwi", k=5) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60) == ["y", "x", "w", "z"]
+
+
+def test_is_keyword_query():
+    assert is_keyword_query("faiss ivf nprobe")
+    assert not is_keyword_query("how do I tune nprobe for ivf indexes")
+    assert not is_keyword_query("nprobe?")
+    assert not is_keyword_query("what is")
+
+
+def test_bm25_index_is_published_with_the_vector_store(store_paths, counting_embeddings, build):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    (store_paths / "b.txt").write_text("Beta document about bananas.")
+    vectorstore = build(counting_embeddings(size=8))
+    saved = BM25Index.load(rag_assistant.VECTORSTORE_PATH)
+    assert set(saved.chunk_ids) == set(vectorstore.index_to_docstore_id.values())
+
+    (store_paths / "b.txt").write_text("Beta document about blueberries.")
+    vectorstore = build(counting_embeddings(size=8))
+    bm25_index = rag_assistant.load_bm25_index(vectorstore)
+    (chunk_id, _), = bm25_index.search("blueberries", k=3)
+    assert vectorstore.docstore.search(chunk_id).page_content == "Beta document about blueberries."
+
+    # A missing or stale BM25 file is rebuilt from the docstore
+    (store_paths / ".." / "vectorstore" / BM25_FILE).unlink()
+    assert len(rag_assistant.load_bm25_index(vectorstore)) == 2
+
+
+@pytest.fixture
+def make_retriever(store_paths, counting_embeddings, build):
+    """Factory for a HybridRetriever over three fruit files, returned with its counting embeddings."""
+    def make(**kwargs):
+        for name, text in {"a": "Apples grow in the orchard.", "b": "Bananas grow on plants.", "c": "Cherries are small."}.items():
+            (store_paths / f"{name}.txt").write_text(text)
+        embeddings = counting_embeddings(size=8)
+        vectorstore = build(embeddings)
+        retriever = HybridRetriever(vectorstore=vectorstore, bm25_index=rag_assistant.load_bm25_index(vectorstore),
+                                    search_kwargs={"k": 2}, **kwargs)
+        return retriever, embeddings
+    return make
+
+
+def test_lexical_fast_path_skips_the_query_embedding(make_retriever):
+    retriever, embeddings = make_retriever(mode="vector", lexical_fast_path=True)
+    timings = start_timings()
+    docs = retriever.invoke("bananas")
+    assert [doc.page_content for doc in docs] == ["Bananas grow on plants."]
+    assert embeddings.queries == 0
+    assert "lexical" in timings and "embed_query" not in timings
+
+    # Questions, and keywords BM25 cannot match, go through the embeddings
+    assert len(asyncio.run(retriever.ainvoke("Which fruit grows on plants?"))) == 2
+    assert len(retriever.invoke("kiwis")) == 2
+    assert embeddings.queries == 2
+
+
+def test_hybrid_mode_fuses_both_rankings(make_retriever):
+    retriever, embeddings = make_retriever(mode="hybrid")
+    timings = start_timings()
+    docs = retriever.invoke("Where do cherries grow?")
+    assert len(docs) == 2
+    assert "Cherries are small." in [doc.page_content for doc in docs]
+    assert embeddings.queries == 1
+    assert {"lexical", "search"} <= set(timings)
+    assert [doc.page_content for doc in asyncio.run(retriever.ainvoke("Where do cherries grow?"))] == \
+        [doc.page_content for doc in docs]
@@ -0,0 +1,27 @@
+# Tests that importing the entry modules is cheap and free of side effects
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src", "rt_rag"))
+HEAVY_MODULES = ("faiss", "langchain.chains", "langchain_community.document_loaders", "langchain_openai", "langchain_text_splitters")
+
+
+@pytest.mark.parametrize("module", ["rag_assistant", "api_main"])
+def test_import_has_no_side_effects(module, tmp_path):
+    pytest.importorskip("fastapi")
+    script = (
+        f"import json, logging, sys; import {module}; "
+        f"print(json.dumps([[m for m in {HEAVY_MODULES!r} if m in sys.modules], len(logging.getLogger().handlers)]))"
+    )
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    output = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    heavy, root_handlers = json.loads(output.stdout.strip().splitlines()[-1])
+    assert heavy == []
+    assert root_handlers == 0
+    assert output.stderr == "" # Nothing logged, e.g. the PATH
+    assert os.listdir(tmp_path) == [] # No log file or cache created
@@ -0,0 +1,59 @@
+# Tests for incremental vector store updates in rag_assistant.get_vector_store
+
+import pytest
+
+pytest.importorskip("faiss")
+
+import rag_assistant
+
+
+def test_only_changed_files_are_embedded(store_paths, counting_embeddings, build, stored_docs):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    (store_paths / "b.txt").write_text("Beta document about bananas.")
+    embeddings = counting_embeddings(size=8)
+    build(embeddings)
+    assert embeddings.embedded == 2
+
+    (store_paths / "b.txt").write_text("Beta document about blueberries.")
+    (store_paths / "c.txt").write_text("Gamma document about cherries.")
+    embeddings.embedded = 0
+    build(embeddings)
+    assert embeddings.embedded == 2
+
+    (store_paths / "a.txt").unlink()
+    embeddings.embedded = 0
+    incremental = build(embeddings)
+    assert embeddings.embedded == 0
+
+    rebuilt = build(counting_embeddings(size=8), full_rebuild=True)
+    assert stored_docs(incremental) == stored_docs(rebuilt)
+    assert incremental.index.ntotal == rebuilt.index.ntotal == 2
+
+
+def test_warm_start_only_when_data_unchanged(store_paths, counting_embeddings, build, stored_docs):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    embeddings = counting_embeddings(size=8)
+    assert rag_assistant.load_vector_store(embeddings) is None
+
+    built = build(embeddings)
+    loaded = rag_assistant.load_vector_store(embeddings)
+    assert loaded is not None
+    assert stored_docs(loaded) == stored_docs(built)
+
+    (store_paths / "a.txt").write_text("Alpha document about apricots.")
+    assert rag_assistant.load_vector_store(embeddings) is None
+
+
+def test_index_needs_refresh_after_data_or_index_changes(store_paths, counting_embeddings, build):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    assert rag_assistant.index_needs_refresh(None)
+    assert not rag_assistant.index_needs_refresh(None, read_only=True)
+
+    build(counting_embeddings(size=8))
+    version = rag_assistant.get_index_version()
+    assert not rag_assistant.index_needs_refresh(version)
+    assert rag_assistant.index_needs_refresh("older-version", read_only=True)
+
+    (store_paths / "b.txt").write_text("Beta document about bananas.")
+    assert rag_assistant.index_needs_refresh(version)
+    assert not rag_assistant.index_needs_refresh(version, read_only=True)
@@ -0,0 +1,106 @@
+# Tests for the streaming ingestion pipeline (parse -> split -> embed -> index)
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("prometheus_client")
+
+import rag_assistant
+from faiss_index import IndexBuilder
+from pipeline import PipelineStats, prefetch
+
+
+@pytest.fixture
+def parsed_files(monkeypatch):
+    """Records the names of the files that get parsed, in order."""
+    names = []
+    load_file = rag_assistant.load_file
+
+    def counting_load_file(file_path):
+        names.append(file_path.rsplit("/", 1)[-1])
+        return load_file(file_path)
+
+    monkeypatch.setattr(rag_assistant, "load_file", counting_load_file)
+    return names
+
+
+@pytest.fixture
+def parse_tracking_embeddings(counting_embeddings):
+    """Counting embeddings that record how many files had been parsed at each embeddings call."""
+    class ParseTrackingEmbeddings(counting_embeddings):
+        parsed_files: list = []
+        parsed_at_call: list = []
+
+        def embed_documents(self, texts):
+            self.parsed_at_call.append(len(self.parsed_files))
+            return super().embed_documents(texts)
+    return ParseTrackingEmbeddings
+
+
+def test_embedding_overlaps_parsing_with_bounded_buffer(store_paths, parsed_files, parse_tracking_embeddings, monkeypatch):
+    monkeypatch.setattr(rag_assistant, "EMBED_BATCH_SIZE", 1)
+    monkeypatch.setattr(rag_assistant, "INGEST_QUEUE_SIZE", 1)
+    for i in range(12):
+        (store_paths / f"doc{i:02d}.txt").write_text(f"Document {i} about topic {i}.")
+    embeddings = parse_tracking_embeddings(size=8, parsed_files=parsed_files, parsed_at_call=[])
+    stats = PipelineStats()
+
+    vectorstore = rag_assistant.ingest_documents(embeddings, stats=stats)
+
+    assert vectorstore.index.ntotal == 12
+    # The i-th chunk is embedded before the parser gets more than a few files ahead
+    assert all(parsed <= i + 3 for i, parsed in enumerate(embeddings.parsed_at_call))
+    assert embeddings.parsed_at_call[0] < 12
+    summary = stats.summary()["stages"]
+    assert summary["parse"]["items"] == 12
+    assert summary["split"]["items"] == summary["embed"]["items"] == summary["index"]["items"] == 12
+
+
+def test_streaming_ingest_only_parses_changed_files(store_paths, parsed_files, counting_embeddings, build, stored_docs):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    (store_paths / "b.txt").write_text("Beta document about bananas.")
+    embeddings = counting_embeddings(size=8)
+    rag_assistant.ingest_documents(embeddings)
+    assert sorted(parsed_files) == ["a.txt", "b.txt"]
+
+    (store_paths / "b.txt").write_text("Beta document about blueberries.")
+    (store_paths / "c.txt").write_text("Gamma document about cherries.")
+    parsed_files.clear()
+    embeddings.embedded = 0
+    updated = rag_assistant.ingest_documents(embeddings)
+    assert sorted(parsed_files) == ["b.txt", "c.txt"]
+    assert embeddings.embedded == 2
+
+    rebuilt = build(counting_embeddings(size=8), full_rebuild=True)
+    assert stored_docs(updated) == stored_docs(rebuilt)
+    assert rag_assistant.load_vector_store(embeddings) is not None
+
+
+def test_ingest_without_text_returns_none(store_paths, counting_embeddings):
+    (store_paths / "empty.txt").write_text("   ")
+    assert rag_assistant.ingest_documents(counting_embeddings(size=8)) is None
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_index_builder_adds_batches(index_type):
+    vectors = np.random.default_rng(0).standard_normal((300, 8)).astype(np.float32)
+    builder = IndexBuilder({"type": index_type, "nlist": 4, "train_sample": 1000})
+    for start in range(0, 300, 64):
+        builder.add(vectors[start:start + 64])
+    if index_type == "flat":
+        assert builder.index.ntotal == 300 # Added as the batches arrive
+    index = builder.finish()
+    assert index.ntotal == builder.ntotal == 300
+    assert isinstance(index, faiss.IndexIVFFlat if index_type == "ivf" else faiss.IndexFlatL2)
+
+
+def test_prefetch_reraises_producer_errors():
+    def items():
+        yield 1
+        raise ValueError("bad file")
+
+    stream = prefetch(items(), maxsize=1)
+    assert next(stream) == 1
+    with pytest.raises(ValueError, match="bad file"):
+        next(stream)
@@ -0,0 +1,38 @@
+# Tests for the incremental JSON / JSON Lines readers
+
+import io
+import json
+
+import pytest
+
+from json_stream import iter_json_array, iter_json_lines
+
+RECORDS = [
+    {"title": "First", "publication_description": "About [brackets], \"quotes\" and é", "year": 2020},
+    {"title": "Second", "authors": ["A", "B"], "nested": {"list": [1, 2.5e3, None, True]}},
+    12345678901234567890,
+    "a string, with a comma",
+    [],
+]
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 16])
+def test_iter_json_array_matches_json_load(read_size):
+    text = json.dumps(RECORDS, indent=2)
+    assert list(iter_json_array(io.StringIO(text), read_size=read_size)) == RECORDS
+    assert list(iter_json_array(io.StringIO(" [ ] "), read_size=read_size)) == []
+
+
+def test_iter_json_array_errors():
+    with pytest.raises(TypeError, match="got <class 'dict'>"):
+        list(iter_json_array(io.StringIO('{"a": 1}')))
+
+    items = iter_json_array(io.StringIO('[{"a": 1}, {"b": }]'), read_size=4)
+    assert next(items) == {"a": 1}
+    with pytest.raises(json.JSONDecodeError):
+        next(items)
+
+
+def test_iter_json_lines_skips_bad_lines():
+    text = '{"a": 1}\n\nnot json\n{"b": 2}\n'
+    assert list(iter_json_lines(io.StringIO(text))) == [(1, {"a": 1}), (4, {"b": 2})]
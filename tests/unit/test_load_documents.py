@@ -0,0 +1,99 @@
+# Tests for rag_assistant.load_documents
+
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip("langchain_community")
+from langchain_community.document_loaders import TextLoader
+
+import rag_assistant
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_assistant, "DATA_PATH", str(tmp_path) + "/")
+    for name in ("c.txt", "a.txt", "b.txt"):
+        (tmp_path / name).write_text(f"Contents of {name}")
+    (tmp_path / "pubs.json").write_text(json.dumps([
+        {"title": "First", "publication_description": "About the first paper", "year": 2020},
+        {"title": "Second", "publication_description": ""},
+    ]))
+    return tmp_path
+
+
+def as_tuples(documents):
+    return [(doc.page_content, doc.metadata) for doc in documents]
+
+
+def test_process_pool_matches_serial_order(data_dir):
+    serial = rag_assistant.load_documents(workers=1)
+    pooled = rag_assistant.load_documents(workers=3)
+    assert as_tuples(pooled) == as_tuples(serial)
+    assert [doc.page_content for doc in serial[:3]] == ["Contents of a.txt", "Contents of b.txt", "Contents of c.txt"]
+    assert serial[3].metadata == {"source": "pubs.json", "title": "First", "year": 2020, "record_index": 0}
+
+
+class SlowTextLoader:
+    """Stands in for a loader that hangs on b.txt and on files named slow*.
+
+    Parse workers do not inherit the test's globals; they get it through the FILE_HANDLERS
+    copy passed to them and import it from this module.
+    """
+
+    def __init__(self, file_path, **kwargs):
+        self.file_path = file_path
+
+    def load(self):
+        if self.file_path.endswith("b.txt") or os.path.basename(self.file_path).startswith("slow"):
+            time.sleep(30)
+        return TextLoader(self.file_path, encoding="utf-8").load()
+
+
+def test_stuck_file_times_out_without_stalling_batch(data_dir, monkeypatch):
+    monkeypatch.setitem(rag_assistant.FILE_HANDLERS[".txt"], "loader_primary", SlowTextLoader)
+    start = time.perf_counter()
+    documents = rag_assistant.load_documents(workers=2, timeout=1)
+    assert time.perf_counter() - start < 10
+    sources = [doc.metadata["source"] for doc in documents]
+    assert not any(source.endswith("b.txt") for source in sources)
+    assert sum(source.endswith(("a.txt", "c.txt")) for source in sources) == 2
+
+
+def test_more_stuck_files_than_workers(data_dir, monkeypatch):
+    for i in range(3):
+        (data_dir / f"slow{i}.txt").write_text("Never parsed")
+    (data_dir / "z.txt").write_text("Contents of z.txt") # Queued behind the stuck files
+    monkeypatch.setitem(rag_assistant.FILE_HANDLERS[".txt"], "loader_primary", SlowTextLoader)
+    documents = rag_assistant.load_documents(workers=2, timeout=1)
+    # Each stuck worker is replaced on timeout, so the file behind them still gets a fresh worker and a full second
+    sources = sorted(doc.metadata["source"] for doc in documents if doc.metadata["source"].endswith(".txt"))
+    assert [os.path.basename(source) for source in sources] == ["a.txt", "c.txt", "z.txt"]
+
+
+def test_json_lines_use_the_publication_mapping(data_dir):
+    (data_dir / "more.jsonl").write_text(
+        json.dumps({"title": "Third", "publication_description": "About the third paper", "authors": ["C"]}) + "\n"
+        + "[1, 2]\n"
+        + json.dumps({"title": "Fourth", "publication_description": "About the fourth paper"}) + "\n"
+    )
+    documents = rag_assistant.load_documents(workers=1)
+    jsonl = [(doc.page_content, doc.metadata) for doc in documents if doc.metadata["source"] == "more.jsonl"]
+    assert jsonl == [
+        ("About the third paper", {"source": "more.jsonl", "title": "Third", "authors": ["C"], "record_index": 0}),
+        ("About the fourth paper", {"source": "more.jsonl", "title": "Fourth", "record_index": 1}),
+    ]
+
+
+def test_large_json_files_are_chunked_in_parts(data_dir, monkeypatch):
+    records = [{"title": f"Paper {i % 3}", "publication_description": f"Description {i % 3}"} for i in range(7)]
+    (data_dir / "pubs.json").write_text(json.dumps(records))
+    monkeypatch.setattr(rag_assistant, "STREAM_RECORDS_PER_BATCH", 2)
+
+    parts = [(name, ids) for name, _, ids in rag_assistant.iter_file_chunks(["pubs.json"])]
+    assert [name for name, _ in parts] == ["pubs.json"] * 4
+    streamed_ids = [chunk_id for _, ids in parts for chunk_id in ids]
+    all_chunks = rag_assistant.get_text_chunks(rag_assistant.load_json_file(str(data_dir / "pubs.json")))
+    assert streamed_ids == rag_assistant.compute_chunk_ids(all_chunks)
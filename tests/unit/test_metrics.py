@@ -0,0 +1,88 @@
+# Tests for per-stage timings and the /metrics endpoint
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("prometheus_client")
+import httpx
+from prometheus_client import REGISTRY
+
+import api_main
+import rag_assistant
+from metrics import InstrumentedEmbeddings
+from session_store import InMemorySessionStore
+
+pytestmark = pytest.mark.usefixtures("no_answer_cache")
+
+
+def post(path, payload, headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=payload, headers=headers or {})
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def timed_chain(monkeypatch, make_chain):
+    chain = make_chain("What colour are apples?", "Red.", "Apples are red")
+    vectorstore = chain.retriever.vectorstore
+    vectorstore.embedding_function = InstrumentedEmbeddings(vectorstore.embedding_function)
+    monkeypatch.setattr(api_main, "qa_chain", chain)
+    store = InMemorySessionStore()
+    store.append_turn("s1", "Tell me about apples.", "They are fruit.")
+    monkeypatch.setattr(api_main, "session_store", store)
+    return chain
+
+
+def test_ask_reports_stage_breakdown_only_on_request(timed_chain):
+    response = post("/ask", {"question": "Colour?", "session_id": "s1"}, headers={"X-Debug-Timings": "1"})
+    assert response.status_code == 200
+    timings = response.json()["timings"]
+    assert {"queue", "condense", "retrieve", "embed_query", "search", "llm", "total"} <= set(timings)
+    assert timings["total"] >= timings["llm"]
+
+    response = post("/ask", {"question": "Colour?", "session_id": "s2"})
+    assert response.json()["timings"] is None
+
+
+def test_stream_done_event_carries_timings(timed_chain, parse_sse):
+    response = post("/ask/stream", {"question": "Colour?"}, headers={"X-Debug-Timings": "true"})
+    kind, done = parse_sse(response.text)[-1]
+    assert kind == "done"
+    assert {"retrieve", "embed_query", "llm", "total"} <= set(done["timings"])
+
+
+def test_metrics_endpoint_exposes_histograms(timed_chain):
+    before = REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"stage": "llm"}) or 0
+    post("/ask", {"question": "Colour?"})
+    assert REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"stage": "llm"}) == before + 1
+
+    async def run():
+        transport = httpx.ASGITransport(app=api_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'rag_requests_total{endpoint="/ask",status="200"}' in response.text
+    assert "rag_request_duration_seconds_bucket" in response.text
+
+
+def test_file_parsing_is_counted(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_assistant, "DATA_PATH", str(tmp_path) + "/")
+    (tmp_path / "a.txt").write_text("Some text.")
+    (tmp_path / "empty.json").write_text("{}")
+    labels = {"extension": ".txt", "outcome": "ok"}
+    before_ok = REGISTRY.get_sample_value("rag_files_parsed_total", labels) or 0
+    before_empty = REGISTRY.get_sample_value("rag_files_parsed_total", {"extension": ".json", "outcome": "empty"}) or 0
+    before_chunks = REGISTRY.get_sample_value("rag_chunks_total") or 0
+
+    rag_assistant.get_text_chunks(rag_assistant.load_documents())
+
+    assert REGISTRY.get_sample_value("rag_files_parsed_total", labels) == before_ok + 1
+    assert REGISTRY.get_sample_value("rag_files_parsed_total", {"extension": ".json", "outcome": "empty"}) == before_empty + 1
+    assert REGISTRY.get_sample_value("rag_chunks_total") == before_chunks + 1
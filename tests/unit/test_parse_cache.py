@@ -0,0 +1,61 @@
+# Tests for the parsed-document cache
+
+import os
+
+import pytest
+
+pytest.importorskip("langchain_community")
+from langchain_core.documents import Document
+
+import rag_assistant
+from parse_cache import ParsedDocumentCache
+
+
+def test_entries_follow_content_and_loader(tmp_path):
+    cache = ParsedDocumentCache(str(tmp_path / "parsed.sqlite"))
+    source = tmp_path / "a.txt"
+    source.write_text("Alpha")
+    documents = [Document(page_content="Alpha", metadata={"source": str(source), "page": 1})]
+    cache.put(str(source), "loader-v1", documents)
+
+    assert cache.get(str(source), "loader-v1") == documents
+    assert cache.get(str(source), "loader-v2") is None
+
+    os.utime(source, ns=(1, 1)) # Touched, same content
+    assert cache.get(str(source), "loader-v1") == documents
+    source.write_text("Alphabet")
+    assert cache.get(str(source), "loader-v1") is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+    source.unlink()
+    assert cache.evict_deleted() == 1
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.fixture
+def parse_cache_enabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_PARSE_CACHE", "1")
+    monkeypatch.setattr(rag_assistant, "PARSE_CACHE_PATH", str(tmp_path / "cache" / "parsed.sqlite"))
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    monkeypatch.setattr(rag_assistant, "DATA_PATH", str(data_dir) + "/")
+    return data_dir
+
+
+def test_load_documents_serves_unchanged_files_from_cache(parse_cache_enabled, monkeypatch, caplog):
+    (parse_cache_enabled / "a.txt").write_text("Contents of a.txt")
+    (parse_cache_enabled / "b.txt").write_text("Contents of b.txt")
+    first = rag_assistant.load_documents()
+
+    calls = []
+    load_file = rag_assistant.load_file
+    monkeypatch.setattr(rag_assistant, "load_file", lambda path: calls.append(path) or load_file(path))
+    (parse_cache_enabled / "b.txt").write_text("New contents of b.txt")
+    with caplog.at_level("INFO"):
+        second = rag_assistant.load_documents()
+
+    assert [os.path.basename(path) for path in calls] == ["b.txt"]
+    assert second[0].page_content == first[0].page_content
+    assert second[0].metadata == first[0].metadata
+    assert second[1].page_content == "New contents of b.txt"
+    assert "Parse cache: 1 of 2 files served from cache" in caplog.text
@@ -0,0 +1,72 @@
+# Tests for the per-session conversation history stores
+
+import asyncio
+
+import pytest
+
+from session_store import InMemorySessionStore, SessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "sqlite":
+            return SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite"), **kwargs)
+        return InMemorySessionStore(**kwargs)
+    return make
+
+
+def test_histories_are_per_session(make_store):
+    store = make_store()
+    store.append_turn("a", "q1", "a1")
+    store.append_turn("b", "q2", "a2")
+    store.append_turn("a", "q3", "a3")
+    assert store.get_history("a") == [("q1", "a1"), ("q3", "a3")]
+    assert store.get_history("b") == [("q2", "a2")]
+    assert store.get_history("missing") == []
+    store.clear("a")
+    assert store.get_history("a") == []
+
+
+def test_token_window_drops_oldest_turns(make_store):
+    store = make_store(max_tokens=10)
+    store.append_turn("s", "x" * 20, "y" * 8) # 5 + 2 tokens
+    store.append_turn("s", "x" * 12, "y" * 4) # 3 + 1 tokens
+    assert store.get_history("s") == [("x" * 12, "y" * 4)]
+
+
+def test_least_recently_used_session_is_evicted(make_store):
+    store = make_store(max_sessions=2)
+    store.append_turn("a", "q", "a")
+    store.append_turn("b", "q", "a")
+    store.get_history("a")
+    store.append_turn("c", "q", "a")
+    assert store.get_history("b") == []
+    assert store.get_history("a") == [("q", "a")]
+    assert store.stats()["sessions"] == 2
+
+
+def test_idle_sessions_expire(make_store):
+    store = make_store(ttl=-1)
+    store.append_turn("a", "q", "a")
+    assert store.get_history("a") == []
+
+
+def test_sqlite_history_survives_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    SQLiteSessionStore(path=path).append_turn("a", "q", "answer")
+    assert SQLiteSessionStore(path=path).get_history("a") == [("q", "answer")]
+
+
+def test_sqlite_reads_do_not_write(tmp_path):
+    with pytest.raises(TypeError):
+        SessionStore()
+    store = SQLiteSessionStore(path=str(tmp_path / "sessions.sqlite"), max_sessions=2)
+    store.append_turn("a", "q", "a")
+    store.append_turn("b", "q", "a")
+    changes = store._conn.total_changes
+    assert asyncio.run(store.aget_history("a")) == [("q", "a")]
+    assert store._conn.total_changes == changes
+    # The pending access time is written before the next write picks a session to evict
+    asyncio.run(store.aappend_turn("c", "q", "a"))
+    assert store.get_history("b") == [] and store.get_history("a") == [("q", "a")]
@@ -0,0 +1,109 @@
+# Tests for building the index once and serving it read-only / memory-mapped
+
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+pytest.importorskip("filelock")
+
+import faiss_index
+import rag_assistant
+
+
+@pytest.fixture
+def slow_embeddings(counting_embeddings):
+    """Counting embeddings slow enough for concurrent builders to overlap without the lock."""
+    class SlowCountingEmbeddings(counting_embeddings):
+        def embed_documents(self, texts):
+            time.sleep(0.2)
+            return super().embed_documents(texts)
+    return SlowCountingEmbeddings
+
+
+def test_concurrent_workers_build_the_index_once(store_paths, slow_embeddings):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    (store_paths / "b.txt").write_text("Beta document about bananas.")
+    embeddings = slow_embeddings(size=8)
+    boot_types = []
+
+    def worker():
+        vectorstore, boot_type = rag_assistant.open_vector_store(embeddings)
+        assert vectorstore.index.ntotal == 2
+        boot_types.append(boot_type)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(boot_types) == ["cold", "warm", "warm"]
+    assert embeddings.embedded == 2
+
+
+def test_read_only_serves_saved_index_without_scanning_data(store_paths, counting_embeddings, build, stored_docs):
+    embeddings = counting_embeddings(size=8)
+    assert rag_assistant.open_vector_store(embeddings, read_only=True) == (None, "read-only")
+
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    built = build(embeddings)
+    (store_paths / "a.txt").write_text("Alpha document about apricots.")
+    embeddings.embedded = 0
+    vectorstore, boot_type = rag_assistant.open_vector_store(embeddings, read_only=True)
+    assert boot_type == "read-only"
+    assert stored_docs(vectorstore) == stored_docs(built)
+    assert embeddings.embedded == 0
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf"])
+def test_mmapped_index_survives_republish(store_paths, counting_embeddings, build, stored_docs, monkeypatch, index_type):
+    monkeypatch.setattr(faiss_index, "INDEX_TYPE", index_type)
+    monkeypatch.setattr(faiss_index, "IVF_NLIST", 2)
+    for i in range(6):
+        (store_paths / f"doc{i}.txt").write_text(f"Document {i} about topic {i}.")
+    embeddings = counting_embeddings(size=8)
+    build(embeddings)
+    mapped = rag_assistant.load_vector_store(embeddings, mmap=True)
+    assert type(mapped.index).__name__ == rag_assistant.load_manifest()["index"]["class"]
+    before = mapped.similarity_search("Document 3 about topic 3.", k=1)[0].page_content
+
+    # Publishing a new version swaps the directory; the mapped files stay readable
+    (store_paths / "doc3.txt").write_text("Document 3 was rewritten.")
+    build(embeddings)
+    assert mapped.similarity_search("Document 3 about topic 3.", k=1)[0].page_content == before
+    reloaded = rag_assistant.load_vector_store(embeddings, mmap=True)
+    assert "Document 3 was rewritten." in [doc for _, doc in stored_docs(reloaded)]
+
+
+def test_publish_interrupted_between_renames_is_recovered(store_paths, counting_embeddings, build, stored_docs, monkeypatch):
+    (store_paths / "a.txt").write_text("Alpha document about apples.")
+    embeddings = counting_embeddings(size=8)
+    built = build(embeddings)
+    rename = os.rename
+
+    def crash_on_staging(src, dst):
+        if ".tmp-" in os.path.basename(src):
+            raise OSError("Simulated crash")
+        rename(src, dst)
+
+    # The previous version has been moved aside but the new one is not in place yet
+    (store_paths / "a.txt").write_text("Alpha document about apricots.")
+    with monkeypatch.context() as m:
+        m.setattr(os, "rename", crash_on_staging)
+        with pytest.raises(OSError):
+            build(embeddings)
+    assert not os.path.exists(rag_assistant.VECTORSTORE_PATH)
+    vectorstore, _ = rag_assistant.open_vector_store(embeddings, read_only=True)
+    assert stored_docs(vectorstore) == stored_docs(built)
+
+    # With no previous version to restore, a complete staging directory is published instead
+    shutil.rmtree(rag_assistant.VECTORSTORE_PATH)
+    with monkeypatch.context() as m:
+        m.setattr(os, "rename", crash_on_staging)
+        with pytest.raises(OSError):
+            build(embeddings)
+    vectorstore, _ = rag_assistant.open_vector_store(embeddings, read_only=True)
+    assert [doc for _, doc in stored_docs(vectorstore)] == ["Alpha document about apricots."]